@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Group, GroupMembership, Task
+from .models import UserProfile, Group, GroupMembership, Task, EmailOutbox
 
 # Register your models here.
 
@@ -13,5 +13,11 @@ class TaskAdmin(admin.ModelAdmin):
     list_display = ('user', 'title', 'is_completed', 'created_by', 'assigned_to', 'attachment')
     search_fields = ('user', 'title', 'created_by', 'assigned_to')
    
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'last_error')
+
 admin.site.register(Group)
 admin.site.register(GroupMembership)
\ No newline at end of file
@@ -0,0 +1,294 @@
+"""
+Warstwa wysyłki maili dla workerów django_q.
+
+Zamiast otwierać sesję SMTP/SSL dla każdego maila (send_mail), worker trzyma
+ograniczoną pulę uwierzytelnionych połączeń (EMAIL_POOL_SIZE) i wysyła paczki
+wiadomości jednym połączeniem – jak send_mass_mail, ale z wynikiem dla każdej
+wiadomości osobno, żeby outbox mógł ponowić tylko te, które się nie udały.
+
+Liczniki (stats()) trzymają czas wysyłki i liczbę błędów w pamięci procesu.
+LocalSMTPBackend udaje serwer SMTP z opóźnieniem handshake'u – do benchmarków
+bez sieci (manage.py benchmark_mail).
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from smtplib import SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_IDLE_SECONDS = 60
+DEFAULT_BATCH_SIZE = 100
+
+
+class MailStats:
+    """Liczniki wysyłki w obrębie procesu (workera)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.sent = 0
+            self.failed = 0
+            self.batches = 0
+            self.connections_opened = 0
+            self.latency_total = 0.0
+            self.latency_max = 0.0
+
+    def record_batch(self, sent, failed, elapsed):
+        with self._lock:
+            self.batches += 1
+            self.sent += sent
+            self.failed += failed
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+
+    def record_open(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def as_dict(self):
+        with self._lock:
+            messages = self.sent + self.failed
+            return {
+                "sent": self.sent,
+                "failed": self.failed,
+                "batches": self.batches,
+                "connections_opened": self.connections_opened,
+                "latency_total_ms": round(self.latency_total * 1000, 2),
+                "latency_max_ms": round(self.latency_max * 1000, 2),
+                "latency_avg_ms": round(self.latency_total * 1000 / messages, 2) if messages else 0.0,
+            }
+
+
+class ConnectionPool:
+    """
+    Ograniczona pula otwartych połączeń backendu maili.
+
+    Połączenie nieużywane dłużej niż max_idle jest zamykane przy pobraniu,
+    bo serwer SMTP i tak zerwałby je po swoim timeoucie.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, max_idle=DEFAULT_MAX_IDLE_SECONDS, stats=None):
+        self.size = size
+        self.max_idle = max_idle
+        self.stats = stats or MailStats()
+        self._idle = []  # (ostatnie użycie, połączenie)
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def _open(self):
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        self.stats.record_open()
+        return connection
+
+    def acquire(self):
+        with self._cond:
+            while not self._idle and self._in_use >= self.size:
+                self._cond.wait()
+
+            connection = None
+            while self._idle:
+                last_used, candidate = self._idle.pop()
+                if time.monotonic() - last_used <= self.max_idle:
+                    connection = candidate
+                    break
+                _close_quietly(candidate)
+            self._in_use += 1
+
+        if connection is None:
+            try:
+                connection = self._open()
+            except Exception:
+                self._give_back(None)
+                raise
+        return connection
+
+    def release(self, connection, broken=False):
+        if broken:
+            _close_quietly(connection)
+            connection = None
+        self._give_back(connection)
+
+    def _give_back(self, connection):
+        with self._cond:
+            self._in_use -= 1
+            if connection is not None:
+                self._idle.append((time.monotonic(), connection))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception:
+            self.release(connection, broken=True)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for _, connection in idle:
+            _close_quietly(connection)
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        logger.debug("Closing pooled mail connection failed", exc_info=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                size=getattr(settings, "EMAIL_POOL_SIZE", DEFAULT_POOL_SIZE),
+                max_idle=getattr(settings, "EMAIL_POOL_MAX_IDLE_SECONDS", DEFAULT_MAX_IDLE_SECONDS),
+            )
+        return _pool
+
+
+def reset_pool():
+    """Zamyka pulę; następne get_pool() utworzy ją od nowa z bieżącymi ustawieniami."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+@receiver(setting_changed)
+def _reset_pool_on_settings_change(setting, **kwargs):
+    # override_settings w testach podmienia backend – stare połączenia są nieaktualne
+    if setting.startswith("EMAIL_"):
+        reset_pool()
+
+
+def stats():
+    return get_pool().stats.as_dict()
+
+
+def _send_one(connection, message):
+    try:
+        connection.send_messages([message])
+    except SMTPServerDisconnected:
+        # połączenie z puli zerwane przez serwer – jedna próba na świeżej sesji
+        connection.close()
+        connection.open()
+        connection.send_messages([message])
+
+
+def send_messages(messages, batch_size=None):
+    """
+    Wysyła wiadomości połączeniami z puli, paczkami po EMAIL_BATCH_SIZE.
+    Zwraca listę (wiadomość, wyjątek albo None) w kolejności wejścia.
+    """
+    pool = get_pool()
+    batch_size = batch_size or getattr(settings, "EMAIL_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    results = []
+
+    for start in range(0, len(messages), batch_size):
+        batch = messages[start:start + batch_size]
+        started = time.perf_counter()
+        failed = 0
+
+        try:
+            try:
+                connection = pool.acquire()
+            except Exception as e:
+                # serwer niedostępny – błąd dla każdej wiadomości paczki, outbox zaplanuje ponowienie
+                logger.warning("Could not open mail connection: %r", e)
+                failed = len(batch)
+                results.extend((message, e) for message in batch)
+                continue
+
+            try:
+                for message in batch:
+                    try:
+                        _send_one(connection, message)
+                    except Exception as e:
+                        failed += 1
+                        results.append((message, e))
+                    else:
+                        results.append((message, None))
+            except BaseException:
+                pool.release(connection, broken=True)
+                raise
+            else:
+                pool.release(connection)
+        finally:
+            pool.stats.record_batch(len(batch) - failed, failed, time.perf_counter() - started)
+
+    return results
+
+
+class LocalSMTPBackend(BaseEmailBackend):
+    """
+    Zastępczy backend SMTP do testów i benchmarków offline.
+
+    open() odczekuje EMAIL_STANDIN_HANDSHAKE_MS (koszt połączenia + TLS),
+    każda wiadomość EMAIL_STANDIN_SEND_MS. Liczniki na poziomie klasy pozwalają
+    sprawdzić, ile sesji otwarto.
+    """
+    opened = 0
+    delivered = 0
+    _counter_lock = threading.Lock()
+
+    def __init__(self, handshake_ms=None, send_ms=None, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently, **kwargs)
+        self.handshake_ms = handshake_ms if handshake_ms is not None else getattr(settings, "EMAIL_STANDIN_HANDSHAKE_MS", 0)
+        self.send_ms = send_ms if send_ms is not None else getattr(settings, "EMAIL_STANDIN_SEND_MS", 0)
+        self.connection = None
+
+    @classmethod
+    def reset_counters(cls):
+        with cls._counter_lock:
+            cls.opened = 0
+            cls.delivered = 0
+
+    def open(self):
+        if self.connection is not None:
+            return False
+        time.sleep(self.handshake_ms / 1000)
+        self.connection = object()
+        with self._counter_lock:
+            LocalSMTPBackend.opened += 1
+        return True
+
+    def close(self):
+        self.connection = None
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        new_connection = self.open()
+        try:
+            for message in email_messages:
+                message.message()  # serializacja jak przy prawdziwym SMTP
+                time.sleep(self.send_ms / 1000)
+            with self._counter_lock:
+                LocalSMTPBackend.delivered += len(email_messages)
+        finally:
+            if new_connection:
+                self.close()
+        return len(email_messages)
@@ -0,0 +1,32 @@
+# api/management/commands/archive_activity_partitions.py
+
+from django.core.management.base import BaseCommand
+from api import partitions
+
+
+class Command(BaseCommand):
+    help = 'Archiwizuje odłączone partycje aktywności do skompresowanych plików w storage i je usuwa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--detach',
+            action='store_true',
+            help='Najpierw odłącz partycje starsze niż ACTIVITY_RETENTION_MONTHS',
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported():
+            self.stdout.write(self.style.WARNING('Partycjonowanie aktywności wymaga PostgreSQL – pomijam.'))
+            return
+
+        if options['detach']:
+            for name in partitions.detach_expired_partitions():
+                self.stdout.write(f'Odłączono {name}')
+
+        archived = 0
+        for name in partitions.detached_partitions():
+            path = partitions.archive_partition(name)
+            archived += 1
+            self.stdout.write(f'{name} -> {path}')
+
+        self.stdout.write(self.style.SUCCESS(f'Zarchiwizowano {archived} partycji.'))
@@ -0,0 +1,50 @@
+# api/management/commands/benchmark_mail.py
+
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from api import mailer
+from api.mailer import LocalSMTPBackend
+
+
+class Command(BaseCommand):
+    help = 'Porównuje wysyłkę mail-po-mailu z pulą połączeń na zastępczym backendzie SMTP (bez sieci)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200, help='Liczba wiadomości')
+        parser.add_argument('--handshake-ms', type=int, default=50, help='Koszt otwarcia sesji (TCP + TLS + AUTH)')
+        parser.add_argument('--send-ms', type=int, default=1, help='Koszt wysłania jednej wiadomości')
+        parser.add_argument('--batch-size', type=int, default=100, help='Wiadomości na jedną sesję')
+
+    def handle(self, *args, **options):
+        messages = [
+            EmailMessage(subject=f'Benchmark {i}', body='TickTask', to=[f'user{i}@example.com'])
+            for i in range(options['messages'])
+        ]
+
+        with override_settings(
+            EMAIL_BACKEND='api.mailer.LocalSMTPBackend',
+            EMAIL_STANDIN_HANDSHAKE_MS=options['handshake_ms'],
+            EMAIL_STANDIN_SEND_MS=options['send_ms'],
+        ):
+            LocalSMTPBackend.reset_counters()
+            started = time.perf_counter()
+            for message in messages:
+                # dotychczasowa ścieżka: send_mail otwiera i zamyka sesję dla każdego maila
+                get_connection().send_messages([message])
+            self.report('mail po mailu', len(messages), time.perf_counter() - started)
+
+            LocalSMTPBackend.reset_counters()
+            started = time.perf_counter()
+            mailer.send_messages(messages, batch_size=options['batch_size'])
+            self.report('pula + paczki', len(messages), time.perf_counter() - started)
+            self.stdout.write(f'Liczniki: {mailer.stats()}')
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(
+            f'{label}: {count} wiadomości w {elapsed:.2f} s '
+            f'({count / elapsed:.0f}/s), otwartych sesji: {LocalSMTPBackend.opened}'
+        )
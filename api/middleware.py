@@ -0,0 +1,68 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .utils import activity_buffer, async_activity_buffer
+
+
+class ActivityBufferMiddleware:
+    """
+    Aktywności logowane w trakcie requestu trafiają do bazy jednym INSERT-em.
+    Odpowiedzi z błędem (>= 400) porzucają bufor – ich transakcja i tak
+    została wycofana. Działa też asynchronicznie, żeby pod ASGI nie wiązać
+    wątku na czas długich requestów (SSE, long-poll czatu).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        with activity_buffer() as buffer:
+            response = self.get_response(request)
+            if response.status_code >= 400:
+                buffer.clear()
+        return response
+
+    async def __acall__(self, request):
+        async with async_activity_buffer() as buffer:
+            response = await self.get_response(request)
+            if response.status_code >= 400:
+                buffer.clear()
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise z obsługą trybu async. Oryginał jest tylko synchroniczny, przez
+    co pod ASGI cały łańcuch middleware szedł przez jeden wątek – długo
+    czekające requesty blokowały się nawzajem.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_task_attachment_alter_task_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=512)),
+                ('message', models.TextField()),
+                ('from_email', models.CharField(blank=True, max_length=254, null=True)),
+                ('recipient_list', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('pending', 'Oczekuje'), ('sent', 'Wysłano'), ('dead', 'Nie dostarczono')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='api_outbox_status_next_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+PENDING_DEADLINE_INDEX = models.Index(condition=models.Q(('is_completed', False), models.Q(('status__in', ['completed', 'overdue']), _negated=True)), fields=['deadline'], name='api_task_pending_deadline_idx')
+
+
+def concurrently(schema_editor):
+    # CONCURRENTLY (bez blokady zapisów) tylko na Postgresie – SQLite tworzy indeks zwyczajnie
+    return {"concurrently": True} if schema_editor.connection.vendor == "postgresql" else {}
+
+
+def add_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model('api', 'Task'), PENDING_DEADLINE_INDEX, **concurrently(schema_editor))
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('api', 'Task'), PENDING_DEADLINE_INDEX, **concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('api', '0020_emailoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='task', index=PENDING_DEADLINE_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_index, remove_index),
+            ],
+        ),
+    ]
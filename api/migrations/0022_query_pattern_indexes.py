@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+INDEXES = [
+    ('activity', models.Index(fields=['user', 'created_at'], name='api_activity_user_created_idx')),
+    ('task', models.Index(fields=['assigned_to', 'status'], name='api_task_assignee_status_idx')),
+    ('task', models.Index(fields=['assigned_to', 'deadline'], name='api_task_assignee_deadline_idx')),
+    ('task', models.Index(fields=['status'], name='api_task_status_idx')),
+]
+
+
+def concurrently(schema_editor):
+    # CONCURRENTLY (bez blokady zapisów) tylko na Postgresie – SQLite tworzy indeksy zwyczajnie
+    return {"concurrently": True} if schema_editor.connection.vendor == "postgresql" else {}
+
+
+def add_indexes(apps, schema_editor):
+    for model_name, index in INDEXES:
+        schema_editor.add_index(apps.get_model('api', model_name), index, **concurrently(schema_editor))
+
+
+def remove_indexes(apps, schema_editor):
+    for model_name, index in reversed(INDEXES):
+        schema_editor.remove_index(apps.get_model('api', model_name), index, **concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('api', '0021_task_pending_deadline_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index) for model_name, index in INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_indexes, remove_indexes),
+            ],
+        ),
+    ]
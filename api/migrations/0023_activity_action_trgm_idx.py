@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_trgm_index(apps, schema_editor):
+    # GIN/pg_trgm istnieje tylko na Postgresie – na SQLite (testy) zostaje LIKE
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            # serwer bez contrib – wyszukiwanie działa dalej, tylko bez indeksu
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS api_activity_action_trgm_idx "
+        "ON api_activity USING gin (UPPER(action) gin_trgm_ops)"
+    )
+
+
+def drop_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS api_activity_action_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('api', '0022_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trgm_index, drop_trgm_index),
+    ]
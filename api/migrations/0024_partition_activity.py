@@ -0,0 +1,129 @@
+"""
+Zamiana api_activity na tabelę partycjonowaną miesięcznie po created_at
+(tylko PostgreSQL; na innych bazach migracja nic nie robi).
+
+Kopiuje istniejące wiersze, więc na dużej tabeli uruchamiać w oknie serwisowym.
+Zakładanie partycji jest tu zamrożoną kopią – kolejne miesiące dokłada potem
+harmonogram api.tasks.maintain_activity_partitions.
+"""
+from datetime import date
+
+from django.db import migrations
+from django.utils import timezone
+
+# partycje na bieżący miesiąc i tyle kolejnych
+PARTITIONS_AHEAD = 3
+
+COLUMNS = "id, action, created_at, source_user_id, user_id"
+
+CREATE_INDEXES = [
+    "CREATE INDEX api_activity_user_created_idx ON api_activity (user_id, created_at)",
+    "CREATE INDEX api_activity_user_id_idx ON api_activity (user_id)",
+    "CREATE INDEX api_activity_source_user_id_idx ON api_activity (source_user_id)",
+]
+
+# tylko gdy migracja 0023 mogła włączyć pg_trgm
+CREATE_TRGM_INDEX = (
+    "CREATE INDEX api_activity_action_trgm_idx ON api_activity USING gin (UPPER(action) gin_trgm_ops)"
+)
+
+RESET_IDENTITY = (
+    "SELECT setval(pg_get_serial_sequence('api_activity', 'id'), "
+    "COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM api_activity"
+)
+
+
+def table_definition(partitioned):
+    primary_key = "PRIMARY KEY (id, created_at)" if partitioned else "PRIMARY KEY (id)"
+    suffix = " PARTITION BY RANGE (created_at)" if partitioned else ""
+    return f"""
+        CREATE TABLE api_activity (
+            id bigint GENERATED BY DEFAULT AS IDENTITY,
+            action text NOT NULL,
+            created_at timestamp with time zone NOT NULL,
+            source_user_id integer NULL
+                REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED,
+            user_id integer NOT NULL
+                REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED,
+            {primary_key}
+        ){suffix}
+    """
+
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def create_partitions(schema_editor, start):
+    current = timezone.now().date().replace(day=1)
+    month = start.replace(day=1) if start else current
+    last = add_months(current, PARTITIONS_AHEAD)
+    while month <= last:
+        schema_editor.execute(
+            f'CREATE TABLE "api_activity_p{month.year:04d}_{month.month:02d}" PARTITION OF api_activity '
+            "FOR VALUES FROM (%s) TO (%s)",
+            [f"{month.isoformat()} 00:00+00", f"{add_months(month, 1).isoformat()} 00:00+00"],
+        )
+        month = add_months(month, 1)
+
+
+def create_indexes(schema_editor):
+    for sql in CREATE_INDEXES:
+        schema_editor.execute(sql)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        has_trgm = cursor.fetchone() is not None
+    if has_trgm:
+        schema_editor.execute(CREATE_TRGM_INDEX)
+
+
+def partition_activity(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    execute = schema_editor.execute
+    execute("ALTER TABLE api_activity RENAME TO api_activity_legacy")
+    execute(table_definition(partitioned=True))
+    # bezpiecznik na wypadek, gdyby harmonogram nie założył partycji na czas
+    execute("CREATE TABLE api_activity_default PARTITION OF api_activity DEFAULT")
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(created_at) FROM api_activity_legacy")
+        oldest = cursor.fetchone()[0]
+
+    # od najstarszego wiersza do bieżącego miesiąca + PARTITIONS_AHEAD
+    create_partitions(schema_editor, oldest.date() if oldest else None)
+
+    execute(f"INSERT INTO api_activity ({COLUMNS}) SELECT {COLUMNS} FROM api_activity_legacy")
+    # odroczone sprawdzenia FK z INSERT blokowałyby CREATE INDEX w tej samej transakcji
+    execute("SET CONSTRAINTS ALL IMMEDIATE")
+    execute(RESET_IDENTITY)
+    execute("DROP TABLE api_activity_legacy")
+    create_indexes(schema_editor)
+
+
+def unpartition_activity(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    execute = schema_editor.execute
+    execute("ALTER TABLE api_activity RENAME TO api_activity_partitioned")
+    execute(table_definition(partitioned=False))
+    execute(f"INSERT INTO api_activity ({COLUMNS}) SELECT {COLUMNS} FROM api_activity_partitioned")
+    execute("SET CONSTRAINTS ALL IMMEDIATE")
+    execute(RESET_IDENTITY)
+    execute("DROP TABLE api_activity_partitioned CASCADE")
+    create_indexes(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_activity_action_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_activity, unpartition_activity),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_partition_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lead_time', models.DurationField()),
+                ('deadline', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='api.task')),
+            ],
+            options={
+                'unique_together': {('task', 'lead_time', 'deadline')},
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+import re
+from datetime import timedelta
+
+import api.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Q
+from django.utils import timezone
+
+UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_lead_time(value):
+    amount, unit = re.match(r"^(\d+)([mhd])$", value.strip()).groups()
+    return timedelta(**{UNITS[unit]: int(amount)})
+
+
+def fill_remind_at(apps, schema_editor):
+    TaskReminder = apps.get_model("api", "TaskReminder")
+    TaskReminder.objects.update(remind_at=F("deadline") - F("lead_time"))
+
+
+def backfill_pending_reminders(apps, schema_editor):
+    # otwarte zadania z terminem w przyszłości dostają przypomnienia wg domyślnych wyprzedzeń
+    Task = apps.get_model("api", "Task")
+    TaskReminder = apps.get_model("api", "TaskReminder")
+
+    now = timezone.now()
+    lead_times = {parse_lead_time(value) for value in settings.REMINDER_DEFAULT_LEAD_TIMES}
+    tasks = (
+        Task.objects.filter(deadline__gt=now, is_completed=False)
+        .exclude(status="completed")
+        .only("id", "deadline")
+    )
+
+    batch = []
+    for task in tasks.iterator(chunk_size=1000):
+        for lead_time in lead_times:
+            if task.deadline - lead_time > now:
+                batch.append(TaskReminder(
+                    task_id=task.id, lead_time=lead_time,
+                    deadline=task.deadline, remind_at=task.deadline - lead_time,
+                ))
+        if len(batch) >= 1000:
+            TaskReminder.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TaskReminder.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_taskreminder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='reminder_lead_times',
+            field=models.JSONField(blank=True, default=api.models.default_reminder_lead_times),
+        ),
+        migrations.AlterField(
+            model_name='taskreminder',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='taskreminder',
+            name='remind_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_remind_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='taskreminder',
+            name='remind_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='taskreminder',
+            index=models.Index(condition=Q(('sent_at__isnull', True)), fields=['remind_at'], name='api_reminder_pending_idx'),
+        ),
+        migrations.RunPython(backfill_pending_reminders, migrations.RunPython.noop),
+    ]
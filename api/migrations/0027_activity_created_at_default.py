@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_reminder_lead_times'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
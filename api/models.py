@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models import Q
+from django.conf import settings
+from django.core.mail import EmailMessage
 from django.contrib.auth.models import User, Group
 from django.utils import timezone
+from datetime import timedelta
 
 
 class Note(models.Model):
@@ -26,6 +30,18 @@ STATUS_CHOICES = [
         ('no_deadline', "Bez deadlinu")
     ]
 
+def overdue_q(now=None):
+    """
+    Warunek "efektywnie po terminie": nieukończone zadanie z minionym deadlinem,
+    którego status nie został jeszcze przestawiony przez sweep_overdue_tasks.
+    """
+    now = now or timezone.now()
+    return (
+        Q(is_completed=False, deadline__lt=now)
+        & ~Q(status__in=['completed', 'overdue'])
+    )
+
+
 class Task(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tasks')
     title = models.CharField(max_length=255)
@@ -39,6 +55,22 @@ class Task(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='upcoming')
     attachment = models.FileField(upload_to='user_task_attachments/', blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # częściowy indeks tylko dla zadań, które sweeper może jeszcze przestawić
+            models.Index(
+                fields=['deadline'],
+                name='api_task_pending_deadline_idx',
+                condition=Q(is_completed=False) & ~Q(status__in=['completed', 'overdue']),
+            ),
+            # statystyki per user (TaskStatsView, TaskSummaryView, completed-tasks)
+            models.Index(fields=['assigned_to', 'status'], name='api_task_assignee_status_idx'),
+            # lista zadań usera posortowana po terminie (TaskViewSet)
+            models.Index(fields=['assigned_to', 'deadline'], name='api_task_assignee_deadline_idx'),
+            # completed-tasks dla admina
+            models.Index(fields=['status'], name='api_task_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.user.username})"
     
@@ -59,6 +91,34 @@ class Task(models.Model):
         super().save(*args, **kwargs)
 
     
+class TaskReminder(models.Model):
+    """
+    Przypomnienie o terminie dla pary zadanie / wyprzedzenie.
+    remind_at (= deadline - lead_time) jest liczone z góry przy zapisie zadania
+    (api.reminders.schedule_reminders), a job co minutę czyta tylko wiersze
+    z sent_at IS NULL i remind_at <= teraz. Wysłane wiersze zostają jako
+    rejestr – to samo przypomnienie nie pójdzie drugi raz.
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='reminders')
+    lead_time = models.DurationField()
+    deadline = models.DateTimeField()
+    remind_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('task', 'lead_time', 'deadline')
+        indexes = [
+            models.Index(
+                fields=['remind_at'],
+                name='api_reminder_pending_idx',
+                condition=Q(sent_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task.title} - {self.lead_time} przed {self.deadline}"
+
+
 class Schedule(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='schedules')
     name = models.CharField(max_length=255)
@@ -80,7 +140,8 @@ class Comment(models.Model):
 class Activity(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
     action = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # nie auto_now_add – ten nadpisałby czas zdarzenia momentem zapisu bufora (api.utils.log_activity)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     source_user = models.ForeignKey(
         User,
         null=True,
@@ -89,10 +150,20 @@ class Activity(models.Model):
         related_name='activities_made_by'
     )
 
+    class Meta:
+        indexes = [
+            # feedy aktywności: filtr po userze, sortowanie od najnowszych
+            models.Index(fields=['user', 'created_at'], name='api_activity_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.action} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
     
     
+def default_reminder_lead_times():
+    return list(settings.REMINDER_DEFAULT_LEAD_TIMES)
+
+
 class UserProfile(models.Model):
     ROLE_CHOICES = [
         ('admin', 'Admin'),
@@ -102,6 +173,8 @@ class UserProfile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='member')
+    # wyprzedzenia przypomnień, np. ["1h", "1d", "3d"]; pusta lista = bez przypomnień
+    reminder_lead_times = models.JSONField(default=default_reminder_lead_times, blank=True)
 
     def __str__(self):
         return f"{self.user.username} ({self.role})"
@@ -127,4 +200,66 @@ class GroupMembership(models.Model):
         unique_together = ('user', 'group')
 
     def __str__(self):
-        return f"{self.user.username} in {self.group.name} as {self.role}"
\ No newline at end of file
+        return f"{self.user.username} in {self.group.name} as {self.role}"
+
+class EmailOutbox(models.Model):
+    """
+    Transakcyjna skrzynka nadawcza – wiersz zapisywany w transakcji requestu,
+    wysyłka realizowana przez workery django_q (api.tasks).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Oczekuje'),
+        ('sent', 'Wysłano'),
+        ('dead', 'Nie dostarczono'),
+    ]
+
+    subject = models.CharField(max_length=512)
+    message = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True, null=True)
+    recipient_list = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='api_outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipient_list)} ({self.status})"
+
+    def as_message(self):
+        return EmailMessage(
+            subject=self.subject,
+            body=self.message,
+            from_email=self.from_email or None,
+            to=self.recipient_list,
+        )
+
+    def mark_sent(self):
+        self.status = 'sent'
+        self.sent_at = timezone.now()
+        self.attempts += 1
+        self.last_error = ''
+        self.save(update_fields=['status', 'sent_at', 'attempts', 'last_error'])
+
+    def mark_failed(self, error):
+        max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+        base_delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_BASE_SECONDS', 60)
+
+        self.attempts += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+        if self.attempts >= max_attempts:
+            # dead-letter – zostaje w tabeli do ręcznej analizy
+            self.status = 'dead'
+        else:
+            # wykładniczy backoff: 1 min, 2 min, 4 min, ...
+            delay = base_delay * (2 ** (self.attempts - 1))
+            self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+
+        self.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
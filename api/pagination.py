@@ -1,6 +1,124 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.db import models
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10  # domyślnie 10 na stronę
     page_size_query_param = "page_size" # pozwala zmienić przez ?page_size=
-    max_page_size = 100 # górny limit bezpieczeństwa
\ No newline at end of file
+    max_page_size = 100 # górny limit bezpieczeństwa
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginacja "seek" po (pole sortowania, id) – bez OFFSET i bez COUNT(*).
+    Włączana opcjonalnie przez ?page_size=; bez niego widok zwraca pełną listę.
+    NULL-e pola sortowania zawsze na końcu, niezależnie od kierunku.
+    """
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    max_page_size = 100
+    default_page_size = None  # ustawione w podklasie – stronicowanie zawsze włączone
+    invalid_cursor_message = "Nieprawidłowy kursor."
+
+    def get_ordering(self, request, queryset, view):
+        # pierwsze pole z ?ordering= (tylko z view.ordering_fields) albo view.ordering;
+        # widok bez ordering_fields nie pozwala sortować – inaczej OrderingFilter
+        # przepuściłby dowolne pole serializera, także adnotacje i pola wyliczane
+        ordering_filter = OrderingFilter()
+        if getattr(view, "ordering_fields", None):
+            ordering = ordering_filter.get_ordering(request, queryset, view)
+        else:
+            ordering = ordering_filter.get_default_ordering(view)
+        ordering = ordering or ["id"]
+        field = ordering[0]
+        descending = field.startswith("-")
+        return field.lstrip("-"), descending
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = request.query_params.get(self.page_size_query_param) or self.default_page_size
+        if not page_size:
+            return None
+
+        try:
+            self.page_size = min(max(int(page_size), 1), self.max_page_size)
+        except ValueError:
+            self.page_size = self.max_page_size
+
+        self.request = request
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+        self.model_field = queryset.model._meta.get_field(self.field)
+
+        value = F(self.field).desc(nulls_last=True) if self.descending else F(self.field).asc(nulls_last=True)
+        tie_break = "-id" if self.descending else "id"
+        queryset = queryset.order_by(value, tie_break)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.seek_predicate(*self.decode_cursor(encoded)))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def seek_predicate(self, value, pk):
+        lookup = "lt" if self.descending else "gt"
+        if value is None:
+            # jesteśmy już w ogonie z NULL-ami – przesuwamy się tylko po id
+            return Q(**{f"{self.field}__isnull": True, f"id__{lookup}": pk})
+        return (
+            Q(**{f"{self.field}__{lookup}": value})
+            | Q(**{self.field: value, f"id__{lookup}": pk})
+            | Q(**{f"{self.field}__isnull": True})
+        )
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field)
+        if isinstance(self.model_field, models.DateTimeField) and value is not None:
+            value = value.isoformat()
+        payload = json.dumps({"v": value, "id": obj.pk})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, encoded):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            value, pk = payload["v"], int(payload["id"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if isinstance(self.model_field, models.DateTimeField) and value is not None:
+            value = parse_datetime(value)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
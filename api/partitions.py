@@ -0,0 +1,196 @@
+"""
+Miesięczne partycje tabeli api_activity (tylko PostgreSQL).
+
+api_activity jest tabelą partycjonowaną RANGE (created_at) – patrz migracja
+0024. Harmonogram django_q (api.tasks.maintain_activity_partitions) zakłada
+partycje na kolejne miesiące i odłącza te starsze niż ACTIVITY_RETENTION_MONTHS.
+Odłączone partycje archiwizuje i usuwa komenda `archive_activity_partitions`.
+Na innych bazach (SQLite w testach) wszystkie funkcje nic nie robią.
+"""
+import gzip
+import logging
+import re
+import tempfile
+from datetime import date
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TABLE = "api_activity"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_RE = re.compile(r"^api_activity_p(\d{4})_(\d{2})$")
+
+
+def is_supported():
+    return connection.vendor == "postgresql"
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name):
+    match = PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def attached_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [TABLE],
+        )
+        return [name for (name,) in cursor.fetchall() if partition_month(name)]
+
+
+def detached_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition AND relname ~ %s
+            ORDER BY relname
+            """,
+            [PARTITION_RE.pattern],
+        )
+        return [name for (name,) in cursor.fetchall()]
+
+
+def ensure_partitions(start=None, months_ahead=None):
+    """
+    Zakłada brakujące partycje od miesiąca `start` do bieżącego + months_ahead.
+
+    Miesiąc, którego wiersze trafiły już do partycji DEFAULT (harmonogram nie
+    zdążył), dostaje partycję z przeniesionymi wierszami – patrz
+    create_partition. Błąd jednego miesiąca jest logowany i nie blokuje
+    pozostałych.
+    """
+    if not is_supported():
+        return []
+
+    if months_ahead is None:
+        months_ahead = settings.ACTIVITY_PARTITIONS_AHEAD
+    current = month_start(timezone.now().date())
+    month = month_start(start) if start else current
+    last = add_months(current, months_ahead)
+
+    existing = set(attached_partitions())
+    created = []
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            try:
+                create_partition(month)
+            except DatabaseError:
+                logger.exception("Could not create activity partition %s", name)
+            else:
+                created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def create_partition(month):
+    """
+    Partycja na miesiąc `month` w jednej transakcji.
+
+    CREATE TABLE ... PARTITION OF nie przejdzie, gdy DEFAULT ma już wiersze
+    z tego zakresu, więc tabela powstaje osobno, wiersze przechodzą do niej
+    z DEFAULT (zablokowanej do końca transakcji – nic nowego tam nie wpadnie)
+    i dopiero wtedy jest dołączana.
+    """
+    name = partition_name(month)
+    bounds = [f"{month.isoformat()} 00:00+00", f"{add_months(month, 1).isoformat()} 00:00+00"]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [DEFAULT_PARTITION])
+        if cursor.fetchone()[0] is None:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)',
+                bounds,
+            )
+            return
+
+        cursor.execute(f'LOCK TABLE "{DEFAULT_PARTITION}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}")')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+            f"WHERE created_at >= %s AND created_at < %s RETURNING *) "
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            bounds,
+        )
+        cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+def detach_expired_partitions(retention_months=None):
+    """
+    Odłącza partycje w całości starsze niż okres retencji (dane zostają w tabeli).
+
+    Po DETACH tabela zachowuje klucze obce do auth_user, które blokowałyby
+    usuwanie użytkowników aż do archiwizacji, więc są od razu zdejmowane.
+    """
+    if not is_supported():
+        return []
+
+    if retention_months is None:
+        retention_months = settings.ACTIVITY_RETENTION_MONTHS
+    cutoff = add_months(month_start(timezone.now().date()), -retention_months)
+
+    detached = []
+    for name in sorted(attached_partitions()):
+        if partition_month(name) < cutoff:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+                cursor.execute(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+                    [name],
+                )
+                for (constraint,) in cursor.fetchall():
+                    cursor.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT "{constraint}"')
+            detached.append(name)
+    return detached
+
+
+def archive_partition(name, storage=None):
+    """
+    Zrzuca odłączoną partycję do skompresowanego CSV w storage
+    (ACTIVITY_ARCHIVE_PREFIX/<nazwa>.csv.gz) i usuwa tabelę.
+    """
+    if name not in detached_partitions():
+        raise ValueError(f"{name} is not a detached activity partition")
+
+    storage = storage or default_storage
+    path = f"{settings.ACTIVITY_ARCHIVE_PREFIX}{name}.csv.gz"
+
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode="wb") as archive:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f'COPY (SELECT id, user_id, source_user_id, action, created_at '
+                    f'FROM "{name}" ORDER BY created_at, id) TO STDOUT WITH CSV HEADER',
+                    archive,
+                )
+        tmp.seek(0)
+        saved_path = storage.save(path, File(tmp))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE "{name}"')
+    return saved_path
@@ -0,0 +1,173 @@
+"""
+Przypomnienia o zbliżających się terminach zadań.
+
+Każdy użytkownik ma listę wyprzedzeń (UserProfile.reminder_lead_times, np.
+["1h", "1d", "3d"]). Przy zapisie zadania schedule_reminders zakłada wiersz
+TaskReminder z wyliczonym remind_at dla każdego wyprzedzenia. Job co minutę
+(dispatch_due_reminders) czyta indeksem tylko przypomnienia, którym minął
+remind_at – bez skanowania zadań – i w tej samej krótkiej transakcji
+zamyka je w rejestrze (sent_at) oraz zapisuje maile do EmailOutbox. SMTP,
+ponowienia z backoffem i dead-letter to już skrzynka nadawcza (api.tasks).
+"""
+import logging
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Task, TaskReminder, UserProfile
+from .utils import queue_mass_mail
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 200
+MAX_LEAD_TIMES = 5
+
+LEAD_TIME_RE = re.compile(r"^(\d+)([mhd])$")
+UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_lead_time(value):
+    """'30m' / '1h' / '3d' -> timedelta."""
+    match = LEAD_TIME_RE.match(str(value).strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Nieprawidłowe wyprzedzenie przypomnienia: {value!r} (np. 30m, 1h, 3d).")
+    return timedelta(**{UNITS[match.group(2)]: int(match.group(1))})
+
+
+def stored_lead_times(values, user_id):
+    """
+    Wyprzedzenia zapisane w profilu (JSONField – mogą być nieaktualne lub
+    wpisane poza API). Nieprawidłowe wpisy są pomijane z ostrzeżeniem, żeby
+    jeden profil nie blokował zapisu zadania.
+    """
+    if not isinstance(values, (list, tuple)):
+        logger.warning("Ignoring reminder lead times of user %s: %r is not a list", user_id, values)
+        return set()
+
+    lead_times = set()
+    for value in values:
+        try:
+            lead_times.add(parse_lead_time(value))
+        except ValueError:
+            logger.warning("Ignoring invalid reminder lead time %r of user %s", value, user_id)
+    return lead_times
+
+
+def describe_lead_time(lead_time):
+    if lead_time % timedelta(days=1) == timedelta(0):
+        days = lead_time.days
+        return "1 dzień" if days == 1 else f"{days} dni"
+    if lead_time % timedelta(hours=1) == timedelta(0):
+        return f"{int(lead_time.total_seconds() // 3600)} godz."
+    return f"{int(lead_time.total_seconds() // 60)} min"
+
+
+def schedule_reminders(tasks, now=None):
+    """
+    Przelicza oczekujące przypomnienia dla podanych zadań (po utworzeniu,
+    zmianie terminu, przypisania lub statusu). Wysłane wpisy zostają nietknięte.
+    """
+    now = now or timezone.now()
+    tasks = list(tasks)
+    if not tasks:
+        return []
+
+    TaskReminder.objects.filter(task__in=tasks, sent_at__isnull=True).delete()
+
+    lead_times_by_user = dict(
+        UserProfile.objects.filter(
+            user_id__in={task.assigned_to_id for task in tasks}
+        ).values_list("user_id", "reminder_lead_times")
+    )
+
+    rows = []
+    for task in tasks:
+        if task.deadline is None or task.is_completed or task.status == "completed":
+            continue
+
+        lead_times = lead_times_by_user.get(task.assigned_to_id)
+        if lead_times is None:
+            lead_times = settings.REMINDER_DEFAULT_LEAD_TIMES
+
+        for lead_time in stored_lead_times(lead_times, task.assigned_to_id):
+            remind_at = task.deadline - lead_time
+            # na przypomnienia, których moment już minął, jest za późno
+            if remind_at > now:
+                rows.append(TaskReminder(
+                    task=task, lead_time=lead_time, deadline=task.deadline, remind_at=remind_at
+                ))
+
+    # ignore_conflicts: ten sam termin i wyprzedzenie mogło już zostać wysłane
+    return TaskReminder.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def reschedule_user_reminders(user, now=None):
+    """Po zmianie ustawień użytkownika – przelicza jego otwarte zadania."""
+    now = now or timezone.now()
+    tasks = Task.objects.filter(
+        assigned_to=user, deadline__gt=now, is_completed=False
+    ).exclude(status="completed")
+    return schedule_reminders(tasks, now=now)
+
+
+def build_mail(reminder):
+    """Krotka (subject, message, from_email, recipient_list) dla queue_mass_mail."""
+    task = reminder.task
+    recipient = task.assigned_to
+    return (
+        f'Przypomnienie: termin zadania "{task.title}"',
+        (
+            f'Cześć {recipient.username},\n\n'
+            f'Przypominamy, że zadanie "{task.title}" ma termin za '
+            f'{describe_lead_time(reminder.lead_time)}: {task.deadline}.\n'
+            f'Sprawdź w TickTask!'
+        ),
+        None,
+        [recipient.email],
+    )
+
+
+def is_deliverable(reminder, now):
+    task = reminder.task
+    return (
+        task.deadline == reminder.deadline
+        and task.deadline > now
+        and not task.is_completed
+        and task.status != "completed"
+        and bool(task.assigned_to.email)
+    )
+
+
+def dispatch_due_reminders(now=None, chunk_size=CHUNK_SIZE):
+    """
+    Kolejkuje przypomnienia z remind_at <= now; zwraca liczbę maili w EmailOutbox.
+
+    Paczka: select_for_update(skip_locked) + sent_at + wiersze EmailOutbox w
+    jednej krótkiej transakcji, bez I/O sieciowego – rejestr i skrzynka
+    zmieniają się razem, więc przypomnienie nie pójdzie dwa razy ani nie
+    zginie. Wysyłkę robi deliver_emails po commicie.
+    """
+    now = now or timezone.now()
+    due = (
+        TaskReminder.objects.filter(sent_at__isnull=True, remind_at__lte=now)
+        .select_related("task__assigned_to")
+        .order_by("remind_at", "id")
+    )
+
+    queued = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(due.select_for_update(skip_locked=True, of=("self",))[:chunk_size])
+            if not chunk:
+                break
+
+            # nieaktualne (zmieniony termin, ukończone zadanie) zamykamy bez maila
+            deliverable = [reminder for reminder in chunk if is_deliverable(reminder, now)]
+            queue_mass_mail([build_mail(reminder) for reminder in deliverable])
+            TaskReminder.objects.filter(id__in=[reminder.id for reminder in chunk]).update(sent_at=now)
+        queued += len(deliverable)
+
+    return queued
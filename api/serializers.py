@@ -1,7 +1,12 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from .models import Note, Task, Schedule, Comment, Activity, UserProfile
+from . import uploads, visibility
+from .utils import log_activity
+from .reminders import MAX_LEAD_TIMES, parse_lead_time
 from django.utils import timezone
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -9,6 +14,26 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = UserProfile
         fields = ['role']
 
+class ReminderSettingsSerializer(serializers.ModelSerializer):
+    reminder_lead_times = serializers.ListField(
+        child=serializers.CharField(), allow_empty=True, max_length=MAX_LEAD_TIMES
+    )
+
+    class Meta:
+        model = UserProfile
+        fields = ['reminder_lead_times']
+
+    def validate_reminder_lead_times(self, value):
+        unique = []
+        for item in value:
+            try:
+                parse_lead_time(item)
+            except ValueError as e:
+                raise serializers.ValidationError(str(e))
+            if item not in unique:
+                unique.append(item)
+        return unique
+
 class UserSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer(source='userprofile', read_only=True)
     is_staff = serializers.BooleanField(read_only=True)  # ✅ DODAJ TO
@@ -40,6 +65,36 @@ STATUS_LABELS = {
     "all": "Wszystkie"
     }
 
+RECENT_COMMENTS_LIMIT = 2
+
+
+def recent_comments_prefetch():
+    """
+    Prefetch ostatnich komentarzy dla całej strony zadań w jednym zapytaniu
+    (ROW_NUMBER() po task_id), razem z autorami.
+    """
+    ranked = (
+        Comment.objects.select_related("author")
+        .annotate(
+            recent_rank=Window(
+                RowNumber(),
+                partition_by=[F("task_id")],
+                order_by=[F("created_at").desc(), F("id").desc()],
+            )
+        )
+        .filter(recent_rank__lte=RECENT_COMMENTS_LIMIT)
+        .order_by("-created_at", "-id")
+    )
+    return Prefetch("comments", queryset=ranked, to_attr="prefetched_recent_comments")
+
+
+class UploadRequestSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=sorted(uploads.UPLOAD_TARGETS))
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=255, required=False, default="application/octet-stream")
+    size = serializers.IntegerField(min_value=1)
+
+
 class TaskSerializer(serializers.ModelSerializer):
     created_by = serializers.StringRelatedField(read_only=True)
     assigned_to = serializers.StringRelatedField(read_only=True)
@@ -49,13 +104,15 @@ class TaskSerializer(serializers.ModelSerializer):
     recent_comments = serializers.SerializerMethodField()
     deadline = serializers.DateTimeField(required=False, allow_null=True)
     attachment = serializers.FileField(required=False, allow_null=True)
+    # klucz pliku wysłanego bezpośrednio do magazynu (api.uploads)
+    attachment_key = serializers.CharField(write_only=True, required=False)
 
     class Meta:
         model = Task
         fields = [
             "id", "user", "title", "description",
             "is_completed", "created_at", "deadline",
-            "priority", "created_by", "assigned_to", "assigned_to_id", 'recent_comments', 'status', 'attachment'
+            "priority", "created_by", "assigned_to", "assigned_to_id", 'recent_comments', 'status', 'attachment', 'attachment_key'
         ]
         read_only_fields = ["id", "created_at", "created_by", "assigned_to", "user"]
         extra_kwargs = {"deadline" : {"required":False, "allow_null":True}}
@@ -66,7 +123,7 @@ class TaskSerializer(serializers.ModelSerializer):
 
         # Sprawdź, czy leader lub zwykły user
         is_admin = user.is_staff
-        is_leader = hasattr(user, "userprofile") and user.userprofile.role == "leader"
+        is_leader = visibility.is_leader(user)
 
         # Jeśli NIE admin i NIE leader – przypisz do siebie
         if not (is_admin or is_leader) or "assigned_to" not in validated_data:
@@ -77,6 +134,14 @@ class TaskSerializer(serializers.ModelSerializer):
 
         return super().create(validated_data)
     
+    def validate_attachment_key(self, value):
+        return uploads.claim_upload(value, self.context["request"].user, "task")
+
+    def validate(self, attrs):
+        if "attachment_key" in attrs:
+            attrs["attachment"] = attrs.pop("attachment_key")
+        return attrs
+
     def validate_status(self, value):
         allowed_statuses = list(STATUS_LABELS.keys())
         if value not in allowed_statuses:
@@ -97,7 +162,7 @@ class TaskSerializer(serializers.ModelSerializer):
             old_label = STATUS_LABELS.get(old_status, old_status)
             new_label = STATUS_LABELS.get(new_status, new_status)
 
-            Activity.objects.create(
+            log_activity(
                 user=instance.assigned_to,
                 source_user=user,
                 action=(
@@ -109,7 +174,9 @@ class TaskSerializer(serializers.ModelSerializer):
         return updated_task
     
     def get_recent_comments(self, obj):
-        recent = obj.comments.order_by('-created_at')[:2]
+        recent = getattr(obj, "prefetched_recent_comments", None)
+        if recent is None:
+            recent = obj.comments.select_related('author').order_by('-created_at', '-id')[:RECENT_COMMENTS_LIMIT]
         return [
             {
                 'content': comment.content,
@@ -1,9 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_migrate, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
-from django.core.mail import send_mail
+from django.db import DEFAULT_DB_ALIAS, connections
+from django_q.models import Schedule
+from .models import UserProfile, GroupMembership
+from . import visibility
 from .models import Comment
+from .utils import queue_mail
+from .tasks import register_schedules
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -11,6 +15,31 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_visibility(sender, instance, **kwargs):
+    visibility.invalidate([instance.user_id])
+
+
+@receiver(pre_save, sender=GroupMembership)
+def remember_previous_group(sender, instance, **kwargs):
+    # przeniesienie do innej grupy zmienia też zakres członków starej grupy
+    instance._previous_group_id = (
+        GroupMembership.objects.filter(pk=instance.pk).values_list("group_id", flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=GroupMembership)
+@receiver(post_delete, sender=GroupMembership)
+def invalidate_group_visibility(sender, instance, **kwargs):
+    # zakres zależy od składu wszystkich grup leadera (nie tylko tych, którymi
+    # kieruje), więc czyścimy wszystkich członków starej i nowej grupy
+    group_ids = {instance.group_id, getattr(instance, "_previous_group_id", None)} - {None}
+    member_ids = GroupMembership.objects.filter(group_id__in=group_ids).values_list("user_id", flat=True)
+    visibility.invalidate([instance.user_id, *member_ids])
+
+
 @receiver(post_save, sender=Comment)
 def notify_comment(sender, instance, created, **kwargs):
     if created:
@@ -26,7 +55,7 @@ def notify_comment(sender, instance, created, **kwargs):
             recipient = task.created_by
 
         if recipient and recipient.email:
-            send_mail(
+            queue_mail(
                 subject=f'Nowy komentarz do zadania: {task.title}',
                 message=(
                     f'Cześć {recipient.username},\n\n'
@@ -36,5 +65,13 @@ def notify_comment(sender, instance, created, **kwargs):
                 ),
                 from_email='noreply@inqse.com',
                 recipient_list=[recipient.email],
-                fail_silently=False
             )
+
+
+@receiver(post_migrate)
+def register_q_schedules(sender, **kwargs):
+    # harmonogramy django_q zakładamy raz, po migracjach aplikacji api
+    # przy częściowym migrate (np. `migrate api 0025`) tabel django_q może jeszcze nie być
+    using = kwargs.get("using", DEFAULT_DB_ALIAS)
+    if sender.name == "api" and Schedule._meta.db_table in connections[using].introspection.table_names():
+        register_schedules()
@@ -0,0 +1,154 @@
+"""
+Zadania wykonywane przez klaster django_q (Q_CLUSTER w settings).
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django_q.models import Schedule
+
+from . import mailer, partitions, reminders
+from .models import EmailOutbox, Task, overdue_q
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_CLAIM_SECONDS = 600  # rezerwacja wiersza na czas wysyłki
+OVERDUE_BATCH_SIZE = 500
+
+# Harmonogramy rejestrowane po migracji (patrz api.signals.register_q_schedules)
+SCHEDULES = [
+    {
+        "name": "email-outbox",
+        "func": "api.tasks.process_outbox",
+        "schedule_type": Schedule.MINUTES,
+        "minutes": 1,
+    },
+    {
+        "name": "overdue-sweeper",
+        "func": "api.tasks.sweep_overdue_tasks",
+        "schedule_type": Schedule.MINUTES,
+        "minutes": 5,
+    },
+    {
+        "name": "activity-partitions",
+        "func": "api.tasks.maintain_activity_partitions",
+        "schedule_type": Schedule.DAILY,
+    },
+    {
+        "name": "deadline-reminders",
+        "func": "api.tasks.dispatch_due_reminders",
+        "schedule_type": Schedule.MINUTES,
+        "minutes": 1,
+    },
+    {
+        "name": "chat-digests",
+        "func": "chat.notifications.flush_digests",
+        "schedule_type": Schedule.MINUTES,
+        "minutes": 1,
+    },
+]
+
+
+def register_schedules():
+    for entry in SCHEDULES:
+        defaults = {key: value for key, value in entry.items() if key != "name"}
+        defaults.setdefault("repeats", -1)
+        Schedule.objects.update_or_create(name=entry["name"], defaults=defaults)
+
+
+def deliver_email(outbox_id):
+    """Wysyła jeden mail z EmailOutbox; błąd planuje kolejną próbę z backoffem."""
+    return deliver_emails([outbox_id])
+
+
+def claim_emails(outbox_ids, now=None):
+    """
+    Rezerwuje wiersze do wysyłki: przesuwa next_attempt_at o OUTBOX_CLAIM_SECONDS,
+    więc ani process_outbox, ani drugi deliver_email ich nie weźmie. Gdy worker
+    padnie w trakcie wysyłki, rezerwacja wygasa i mail wraca do kolejki.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        emails = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(id__in=outbox_ids, status="pending", next_attempt_at__lte=now)
+            .order_by("id")
+        )
+        if emails:
+            EmailOutbox.objects.filter(id__in=[email.id for email in emails]).update(
+                next_attempt_at=now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+            )
+    return emails
+
+
+def deliver_emails(outbox_ids):
+    """
+    Wysyła paczkę maili z EmailOutbox połączeniem z puli (api.mailer).
+    Wiersze są rezerwowane w krótkiej transakcji, SMTP idzie już poza nią.
+    Każdy wiersz dostaje własny wynik – nieudane wracają do kolejki z backoffem.
+    """
+    emails = claim_emails(outbox_ids)
+    if not emails:
+        # już wysłane, dead-letter albo obsługiwane przez innego workera
+        return 0
+
+    results = mailer.send_messages([email.as_message() for email in emails])
+
+    for email, (_, error) in zip(emails, results):
+        if error is None:
+            email.mark_sent()
+        else:
+            logger.warning("Outbox email %s failed (attempt %s): %r", email.id, email.attempts + 1, error)
+            email.mark_failed(error)
+
+    return sum(1 for _, error in results if error is None)
+
+
+def process_outbox():
+    """Harmonogram: ponawia maile, którym minął termin kolejnej próby."""
+    due_ids = list(
+        EmailOutbox.objects.filter(status="pending", next_attempt_at__lte=timezone.now())
+        .order_by("next_attempt_at")
+        .values_list("id", flat=True)[:OUTBOX_BATCH_SIZE]
+    )
+    if due_ids:
+        deliver_emails(due_ids)
+        logger.info("Outbox batch of %s processed, mail stats: %s", len(due_ids), mailer.stats())
+    return len(due_ids)
+
+
+def sweep_overdue_tasks(batch_size=OVERDUE_BATCH_SIZE):
+    """
+    Harmonogram: przestawia zadania po terminie na "overdue" paczkami po id,
+    korzystając z częściowego indeksu api_task_pending_deadline_idx.
+    """
+    now = timezone.now()
+    updated = 0
+
+    while True:
+        batch_ids = list(
+            Task.objects.filter(overdue_q(now))
+            .order_by("deadline")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not batch_ids:
+            break
+
+        # warunek powtórzony w UPDATE – zadanie mogło zostać w międzyczasie ukończone
+        updated += Task.objects.filter(overdue_q(now), id__in=batch_ids).update(status="overdue")
+
+    return updated
+
+
+def maintain_activity_partitions():
+    """Harmonogram: partycje api_activity na kolejne miesiące + odłączenie przeterminowanych."""
+    created = partitions.ensure_partitions()
+    detached = partitions.detach_expired_partitions()
+    return {"created": created, "detached": detached}
+
+
+def dispatch_due_reminders():
+    """Harmonogram: co minutę wysyła przypomnienia, którym minął remind_at."""
+    return reminders.dispatch_due_reminders()
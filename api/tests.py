@@ -1,3 +1,935 @@
-from django.test import TestCase
+import gzip
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from smtplib import SMTPRecipientsRefused
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core import mail
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Task, Comment, Activity, EmailOutbox, Group, GroupMembership, TaskReminder, UserProfile
+from .serializers import TaskSerializer
+from . import mailer, partitions, reminders, uploads, visibility
+from .mailer import LocalSMTPBackend
+from .utils import activity_buffer, log_activity, queue_mail, queue_mass_mail
+from .tasks import claim_emails, deliver_email, deliver_emails, process_outbox, sweep_overdue_tasks
+
+
+class TaskSummaryViewTests(TestCase):
+    url = "/api/summary-tasks/"
+
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def make_users(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f"user{User.objects.count()}")
+            Task.objects.create(user=user, created_by=user, assigned_to=user, title="a", status="upcoming")
+            Task.objects.create(user=user, created_by=user, assigned_to=user, title="b", status="completed", priority="Wysoki")
+            Task.objects.create(user=user, created_by=user, assigned_to=user, title="c", status="overdue", priority="Wysoki")
+
+    def test_query_count_does_not_grow_with_users(self):
+        self.make_users(3)
+        with self.assertNumQueries(2):
+            first = self.client.get(self.url)
+
+        self.make_users(20)
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url)
+
+        self.assertEqual(len(first.data), 4)
+        self.assertEqual(len(second.data), 24)
+
+    def test_output_shape(self):
+        self.make_users(1)
+        user = User.objects.get(username="user1")
+
+        response = self.client.get(self.url, {"user_id": user.id})
+
+        self.assertEqual(response.data, [{
+            "id": user.id,
+            "username": "user1",
+            "total": 3,
+            "completed": 1,
+            "overdue": 1,
+            "upcoming": 1,
+            "in_progress": 0,
+            "priority_stats": {"Wysoki": 1, "Średni": 1, "Niski": 0},
+        }])
+
+    def test_due_tasks_count_as_overdue_before_sweeper(self):
+        user = User.objects.create_user("late")
+        past = timezone.now() - timedelta(days=1)
+        Task.objects.create(user=user, created_by=user, assigned_to=user, title="a", status="in_progress", deadline=past)
+        Task.objects.create(user=user, created_by=user, assigned_to=user, title="b", status="upcoming", deadline=past)
+        Task.objects.create(user=user, created_by=user, assigned_to=user, title="c", status="upcoming")
+
+        row = self.client.get(self.url, {"user_id": user.id}).data[0]
+
+        self.assertEqual((row["overdue"], row["upcoming"], row["in_progress"]), (2, 1, 0))
+
+    def test_paginated(self):
+        self.make_users(12)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {"page": 2})
+
+        self.assertEqual(response.data["count"], 13)
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_leader_sees_only_group_members(self):
+        self.make_users(2)
+        leader = User.objects.create_user("leader")
+        leader.userprofile.role = "leader"
+        leader.userprofile.save()
+        group = Group.objects.create(name="g")
+        GroupMembership.objects.create(user=leader, group=group, role="leader")
+        GroupMembership.objects.create(user=User.objects.get(username="user1"), group=group, role="member")
+
+        self.client.force_authenticate(leader)
+        response = self.client.get(self.url)
+
+        self.assertEqual({row["username"] for row in response.data}, {"leader", "user1"})
+
+
+class TaskStatsViewTests(TestCase):
+    url = "/api/tasks-stats/"
+
+    def setUp(self):
+        self.user = User.objects.create_user("user")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_task(self, **kwargs):
+        return Task.objects.create(user=self.user, created_by=self.user, assigned_to=self.user, title="t", **kwargs)
+
+    def test_read_does_not_write_and_counts_due_tasks_as_overdue(self):
+        past = timezone.now() - timedelta(days=1)
+        due = self.make_task(deadline=past, status="in_progress")
+        self.make_task(deadline=past, status="completed", is_completed=True)
+        self.make_task(deadline=timezone.now() + timedelta(days=1), status="upcoming")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data["overdue"], 1)
+        self.assertEqual(response.data["in_progress"], 0)
+        self.assertEqual(response.data["upcoming"], 1)
+        self.assertEqual(response.data["completed"], 1)
+        self.assertEqual(response.data["total"], 3)
+        due.refresh_from_db()
+        self.assertEqual(due.status, "in_progress")
+
+    def test_sweeper_moves_due_tasks_to_overdue(self):
+        past = timezone.now() - timedelta(days=1)
+        due = [self.make_task(deadline=past, status="upcoming") for _ in range(5)]
+        done = self.make_task(deadline=past, status="completed", is_completed=True)
+
+        self.assertEqual(sweep_overdue_tasks(batch_size=2), 5)
+
+        self.assertEqual(Task.objects.filter(id__in=[t.id for t in due], status="overdue").count(), 5)
+        done.refresh_from_db()
+        self.assertEqual(done.status, "completed")
+
+
+class TaskListQueryCountTests(TestCase):
+    url = "/api/tasks/"
+
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def make_tasks(self, count):
+        for i in range(count):
+            author = User.objects.create_user(f"author{User.objects.count()}")
+            task = Task.objects.create(user=author, created_by=author, assigned_to=author, title=f"t{i}")
+            for n in range(3):
+                Comment.objects.create(task=task, author=author, content=f"c{n}")
+
+    def test_recent_comments_use_constant_queries(self):
+        self.make_tasks(2)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+        self.make_tasks(10)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+
+        self.assertEqual(len(response.data), 12)
+        for row in response.data:
+            self.assertEqual([c["content"] for c in row["recent_comments"]], ["c2", "c1"])
+
+    def test_payload_matches_unprefetched_serializer(self):
+        self.make_tasks(3)
+        response = self.client.get(self.url)
+
+        request = response.wsgi_request
+        request.user = self.admin
+        expected = TaskSerializer(Task.objects.all(), many=True, context={"request": request}).data
+        self.assertEqual(
+            {row["id"]: row for row in response.data},
+            {row["id"]: row for row in expected},
+        )
+
+
+class TaskKeysetPaginationTests(TestCase):
+    url = "/api/tasks/"
+
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        now = timezone.now()
+        for i in range(7):
+            deadline = None if i % 3 == 0 else now + timedelta(days=i % 2)
+            Task.objects.create(user=self.admin, created_by=self.admin, assigned_to=self.admin, title=f"t{i}", deadline=deadline)
+
+    def collect(self, **params):
+        ids, deadlines = [], []
+        response = self.client.get(self.url, {"page_size": 2, **params})
+        while True:
+            self.assertNotIn("count", response.data)
+            ids += [row["id"] for row in response.data["results"]]
+            deadlines += [row["deadline"] for row in response.data["results"]]
+            if not response.data["next"]:
+                return ids, deadlines
+            response = self.client.get(response.data["next"])
+
+    def test_walks_every_task_once_with_null_deadlines_last(self):
+        for ordering in ("deadline", "-deadline"):
+            ids, deadlines = self.collect(ordering=ordering)
+
+            self.assertEqual(sorted(ids), sorted(Task.objects.values_list("id", flat=True)))
+            self.assertEqual(deadlines[-3:], [None, None, None])
+            self.assertNotIn(None, deadlines[:-3])
+
+    def test_unpaginated_without_page_size(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(len(response.data), 7)
+
+    def test_seek_query_has_no_offset_or_count(self):
+        first = self.client.get(self.url, {"page_size": 2})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data["next"])
+
+        sql = " ".join(q["sql"] for q in queries).upper()
+        self.assertNotIn("OFFSET", sql)
+        self.assertNotIn("COUNT(", sql)
+
+
+class IndexUsageMixin:
+    """
+    Łapie SQL wygenerowany przez endpoint i sprawdza w EXPLAIN, że planer
+    wybiera oczekiwany indeks (na Postgresie z wyłączonym seq scanem,
+    bo tabele testowe są zbyt małe, żeby indeks się opłacał).
+    """
+
+    def endpoint_query(self, url, table):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        matching = [
+            q["sql"] for q in queries
+            if f'FROM "{table}"' in q["sql"] and "COUNT(" not in q["sql"].upper()
+        ]
+        self.assertTrue(matching, f"{url} did not query {table}")
+        return matching[-1]
+
+    def index_names(self, index_name):
+        # na tabeli partycjonowanej planer używa indeksów partycji podpiętych pod indeks rodzica
+        if connection.vendor != "postgresql":
+            return {index_name}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = %s
+                """,
+                [index_name],
+            )
+            return {index_name, *(name for (name,) in cursor.fetchall())}
+
+    def assertEndpointUsesIndex(self, url, table, index_name):
+        sql = self.endpoint_query(url, table)
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(f'ANALYZE "{table}"')
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(connection.ops.explain_query_prefix() + " " + sql)
+            plan = "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+        self.assertTrue(
+            any(name in plan for name in self.index_names(index_name)),
+            f"{index_name} not used:\n{plan}",
+        )
+
+
+class TaskIndexTests(IndexUsageMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("member")
+        self.admin = User.objects.create_user("admin", is_staff=True)
+        for status in ("completed", "upcoming", "in_progress"):
+            Task.objects.create(user=self.user, created_by=self.user, assigned_to=self.user, title=status, status=status)
+            Activity.objects.create(user=self.user, action=status)
+
+        # ani sam user, ani sam status nie są selektywne – dopiero para
+        for i in range(50):
+            other = User.objects.create_user(f"other{i}")
+            Task.objects.create(user=other, created_by=other, assigned_to=other, title="x", status="completed")
+            Task.objects.create(
+                user=self.user, created_by=self.user, assigned_to=self.user, title="y",
+                status="upcoming", deadline=timezone.now() + timedelta(days=i),
+            )
+        self.client = APIClient()
+
+    def test_task_list_uses_assignee_deadline_index(self):
+        # stronicowana lista (LIMIT + ORDER BY deadline) czyta indeks w kolejności, bez sortowania
+        self.client.force_authenticate(self.user)
+        self.assertEndpointUsesIndex("/api/tasks/?page_size=10", "api_task", "api_task_assignee_deadline_idx")
+
+    def test_completed_tasks_use_assignee_status_index(self):
+        self.client.force_authenticate(self.user)
+        self.assertEndpointUsesIndex("/api/completed-tasks/", "api_task", "api_task_assignee_status_idx")
+
+    def test_completed_tasks_for_admin_use_status_index(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEndpointUsesIndex("/api/completed-tasks/", "api_task", "api_task_status_idx")
+
+    def test_my_activities_use_user_created_index(self):
+        self.client.force_authenticate(self.user)
+        self.assertEndpointUsesIndex("/api/my-activities/", "api_activity", "api_activity_user_created_idx")
+
+
+class VisibilityTests(TestCase):
+
+    def setUp(self):
+        self.leader = User.objects.create_user("leader")
+        self.leader.userprofile.role = "leader"
+        self.leader.userprofile.save()
+        self.member = User.objects.create_user("member")
+        self.group = Group.objects.create(name="g")
+        GroupMembership.objects.create(user=self.leader, group=self.group, role="leader")
+
+    def test_warm_cache_needs_no_queries(self):
+        visibility.visible_user_ids(self.leader)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(visibility.visible_user_ids(self.leader), {self.leader.id})
+            self.assertTrue(visibility.is_leader(self.leader))
+
+    def test_membership_and_profile_changes_invalidate(self):
+        self.assertNotIn(self.member.id, visibility.visible_user_ids(self.leader))
+
+        GroupMembership.objects.create(user=self.member, group=self.group, role="member")
+        self.assertIn(self.member.id, visibility.visible_user_ids(self.leader))
+
+        self.leader.userprofile.role = "member"
+        self.leader.userprofile.save()
+        self.assertEqual(visibility.visible_user_ids(self.leader), {self.leader.id})
+
+    def test_staff_is_unrestricted(self):
+        admin = User.objects.create_user("admin", is_staff=True)
+
+        self.assertIsNone(visibility.visible_user_ids(admin))
+
+    def test_leader_sees_own_tasks_and_all_groups_in_task_list(self):
+        other_group = Group.objects.create(name="other")
+        GroupMembership.objects.create(user=self.member, group=other_group, role="member")
+        led_only = User.objects.create_user("led-only")
+        led_only.userprofile.role = "leader"
+        led_only.userprofile.save()
+        GroupMembership.objects.create(user=led_only, group=other_group, role="member")
+        own = Task.objects.create(user=led_only, created_by=led_only, assigned_to=led_only, title="own")
+        Task.objects.create(user=self.member, created_by=self.member, assigned_to=self.member, title="peer")
+
+        self.assertEqual(visibility.visible_user_ids(led_only), {led_only.id})
+        self.assertEqual(visibility.visible_user_ids(led_only, all_groups=True), {led_only.id, self.member.id})
+
+        client = APIClient()
+        client.force_authenticate(led_only)
+        titles = {task["title"] for task in client.get("/api/tasks/").data}
+        self.assertEqual(titles, {own.title, "peer"})
+
+    def test_moving_membership_invalidates_old_group(self):
+        membership = GroupMembership.objects.create(user=self.member, group=self.group, role="member")
+        self.assertIn(self.member.id, visibility.visible_user_ids(self.leader))
+
+        membership.group = Group.objects.create(name="elsewhere")
+        membership.save()
+
+        self.assertNotIn(self.member.id, visibility.visible_user_ids(self.leader))
+
+    def test_invalidation_is_repeated_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            GroupMembership.objects.create(user=self.member, group=self.group, role="member")
+        # stary zakres zapisany przez równoległy request przed commitem
+        visibility._cache.local[self.leader.id] = (time.monotonic() + 60, ("leader", frozenset(), frozenset()))
+
+        for callback in callbacks:
+            callback()
+
+        self.assertIn(self.member.id, visibility.visible_user_ids(self.leader))
+
+    def test_shared_cache_tier_is_used_only_with_a_shared_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={"default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location,
+            }}):
+                visibility.visible_user_ids(self.leader)
+                visibility._cache.local.clear()
+                with self.assertNumQueries(0):
+                    self.assertEqual(visibility.visible_user_ids(self.leader), {self.leader.id})
+
+        # LocMem nie jest wspólny – po wygaśnięciu pamięci procesu liczymy od nowa
+        visibility._cache.local.clear()
+        with self.assertNumQueries(3):
+            visibility.visible_user_ids(self.leader)
+
+
+class ActivityBufferTests(TestCase):
+
+    def setUp(self):
+        self.leader = User.objects.create_user("leader", is_staff=True)
+        self.members = [User.objects.create_user(f"member{i}") for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.leader)
+
+    def test_task_for_many_assignees_logs_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    "/api/tasks/",
+                    {"title": "t", "assigned_to_ids": [u.id for u in self.members]},
+                    format="json",
+                )
+
+        self.assertEqual(response.status_code, 201)
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "api_activity"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Activity.objects.count(), 10)
+
+    def test_buffered_activity_keeps_time_of_event(self):
+        logged_at = timezone.now() - timedelta(minutes=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch("api.utils.timezone.now", return_value=logged_at), activity_buffer():
+                log_activity(self.leader, "wcześniej")
+
+        self.assertEqual(Activity.objects.get().created_at, logged_at)
+
+    def test_failed_request_drops_buffer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/tasks/",
+                {"title": "", "assigned_to_ids": [self.members[0].id]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Activity.objects.count(), 0)
+
+    async def test_async_handler_keeps_one_insert_buffer(self):
+        # pod ASGI middleware działa asynchronicznie, a widok DRF w sync_to_async
+        token = str(RefreshToken.for_user(self.leader).access_token)
+        with mock.patch.object(Activity.objects, "bulk_create", wraps=Activity.objects.bulk_create) as bulk_create:
+            response = await self.async_client.post(
+                "/api/tasks/",
+                {"title": "t", "assigned_to_ids": [u.id for u in self.members]},
+                content_type="application/json",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+
+        self.assertEqual(response.status_code, 201)
+        bulk_create.assert_called_once()
+        self.assertEqual(await Activity.objects.acount(), 10)
+
+    def test_without_buffer_writes_immediately(self):
+        log_activity(self.leader, "akcja")
+
+        self.assertEqual(Activity.objects.count(), 1)
+
+
+class ActivityFilterTests(IndexUsageMixin, TestCase):
+    url = "/api/my-activities/"
+
+    def setUp(self):
+        self.user = User.objects.create_user("user")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        for day in (1, 2, 3):
+            activity = Activity.objects.create(user=self.user, action=f"Utworzyłeś zadanie {day}")
+            Activity.objects.filter(id=activity.id).update(
+                created_at=timezone.make_aware(datetime(2025, 5, day, 23, 59))
+            )
+
+    def test_date_range_is_inclusive(self):
+        response = self.client.get(self.url, {"date_from": "2025-05-02", "date_to": "2025-05-02"})
+
+        self.assertEqual([row["action"] for row in response.data["results"]], ["Utworzyłeś zadanie 2"])
+
+    def test_action_search_is_case_insensitive(self):
+        response = self.client.get(self.url, {"action_icontains": "ZADANIE 3"})
+
+        self.assertEqual(response.data["count"], 1)
+
+    def test_date_filters_use_user_created_index(self):
+        self.assertEndpointUsesIndex(
+            f"{self.url}?date_from=2025-05-01&date_to=2025-05-02",
+            "api_activity",
+            "api_activity_user_created_idx",
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "partycjonowanie api_activity wymaga PostgreSQL")
+class ActivityPartitionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user")
+
+    def test_rows_land_in_monthly_partitions(self):
+        partitions.ensure_partitions(start=date(2020, 1, 1), months_ahead=0)
+        activity = Activity.objects.create(user=self.user, action="stara")
+        Activity.objects.filter(id=activity.id).update(created_at=timezone.make_aware(datetime(2020, 1, 15)))
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM "api_activity_p2020_01"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        response = self.client.get("/api/my-activities/")
+        self.assertEqual(response.data["count"], 1)
+
+    def test_rows_in_default_partition_are_moved_to_new_partition(self):
+        activity = Activity.objects.create(user=self.user, action="za wcześnie")
+        Activity.objects.filter(id=activity.id).update(created_at=timezone.make_aware(datetime(2019, 6, 15)))
+
+        created = partitions.ensure_partitions(start=date(2019, 6, 1), months_ahead=0)
+
+        self.assertIn("api_activity_p2019_06", created)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT action FROM "api_activity_p2019_06"')
+            self.assertEqual(cursor.fetchall(), [("za wcześnie",)])
+            cursor.execute(f'SELECT COUNT(*) FROM "{partitions.DEFAULT_PARTITION}"')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_failed_month_is_logged_and_others_are_created(self):
+        with connection.cursor() as cursor:
+            # pozostałość po odłączonej, niezarchiwizowanej partycji blokuje ten miesiąc
+            cursor.execute('CREATE TABLE "api_activity_p2019_07" (id bigint)')
+
+        with self.assertLogs("api.partitions", "ERROR"):
+            created = partitions.ensure_partitions(start=date(2019, 7, 1), months_ahead=0)
+
+        self.assertNotIn("api_activity_p2019_07", created)
+        self.assertIn("api_activity_p2019_08", created)
+
+    def test_expired_partitions_are_detached_and_archived(self):
+        partitions.ensure_partitions(start=date(2020, 1, 1), months_ahead=0)
+        activity = Activity.objects.create(user=self.user, action="stara")
+        Activity.objects.filter(id=activity.id).update(created_at=timezone.make_aware(datetime(2020, 1, 15)))
+        Activity.objects.create(user=self.user, action="nowa")
+        with connection.cursor() as cursor:
+            # odroczone sprawdzenia FK z tej samej transakcji blokowałyby ALTER/DROP TABLE
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        detached = partitions.detach_expired_partitions(retention_months=12)
+
+        self.assertIn("api_activity_p2020_01", detached)
+        self.assertEqual(list(Activity.objects.values_list("action", flat=True)), ["nowa"])
+
+        with tempfile.TemporaryDirectory() as root:
+            path = partitions.archive_partition("api_activity_p2020_01", storage=FileSystemStorage(location=root))
+            with gzip.open(os.path.join(root, path), "rt") as archive:
+                rows = archive.read().splitlines()
+
+        self.assertEqual(rows[0], "id,user_id,source_user_id,action,created_at")
+        self.assertIn("stara", rows[1])
+        self.assertNotIn("api_activity_p2020_01", partitions.detached_partitions())
+
+    def test_detached_partition_does_not_block_user_deletion(self):
+        partitions.ensure_partitions(start=date(2020, 1, 1), months_ahead=0)
+        activity = Activity.objects.create(user=self.user, action="stara")
+        Activity.objects.filter(id=activity.id).update(created_at=timezone.make_aware(datetime(2020, 1, 15)))
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        partitions.detach_expired_partitions(retention_months=12)
+        self.user.delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute('SELECT action FROM "api_activity_p2020_01"')
+            self.assertEqual(cursor.fetchall(), [("stara",)])
+
+
+class DeadlineReminderTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", email="user@example.com")
+        self.user.userprofile.reminder_lead_times = ["1h", "1d", "3d"]
+        self.user.userprofile.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_task(self, deadline, **kwargs):
+        task = Task.objects.create(
+            user=self.user, created_by=self.user, assigned_to=self.user, title="t", deadline=deadline, **kwargs
+        )
+        reminders.schedule_reminders([task])
+        return task
+
+    def test_one_pending_reminder_per_lead_time(self):
+        deadline = timezone.now() + timedelta(days=5)
+        task = self.make_task(deadline)
+
+        self.assertEqual(
+            sorted(task.reminders.values_list("remind_at", flat=True)),
+            [deadline - timedelta(days=3), deadline - timedelta(days=1), deadline - timedelta(hours=1)],
+        )
+
+    def test_dispatch_queues_due_reminders_in_outbox_and_sends_after_commit(self):
+        now = timezone.now()
+        for _ in range(5):
+            self.make_task(now + timedelta(days=2))
+
+        with mock.patch("api.utils.async_task", side_effect=lambda func, *args: import_string(func)(*args)):
+            with mock.patch("api.mailer.get_connection", wraps=get_connection) as connections:
+                with self.captureOnCommitCallbacks() as callbacks:
+                    queued = reminders.dispatch_due_reminders(now=now + timedelta(days=1, minutes=1), chunk_size=2)
+
+                # w transakcji paczek tylko rejestr i skrzynka – bez SMTP
+                self.assertEqual(queued, 5)
+                self.assertEqual(len(mail.outbox), 0)
+                self.assertEqual(EmailOutbox.objects.filter(status="pending").count(), 5)
+                self.assertFalse(TaskReminder.objects.filter(remind_at__lte=now + timedelta(days=1, minutes=1), sent_at__isnull=True).exists())
+
+                for callback in callbacks:
+                    callback()
+
+        # trzy paczki, ale jedno połączenie z puli
+        self.assertEqual(connections.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertIn("za 1 dzień", mail.outbox[0].body)
+        self.assertEqual(EmailOutbox.objects.filter(status="sent").count(), 5)
+        self.assertEqual(reminders.dispatch_due_reminders(now=now + timedelta(days=1, minutes=1)), 0)
+
+    def test_deadline_change_in_update_recomputes_reminders(self):
+        task = self.make_task(timezone.now() + timedelta(days=5))
+        new_deadline = timezone.now() + timedelta(days=10)
+
+        response = self.client.patch(f"/api/tasks/{task.id}/", {"deadline": new_deadline.isoformat()}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(task.reminders.filter(sent_at__isnull=True).values_list("deadline", flat=True)),
+            {new_deadline},
+        )
+
+    def test_settings_endpoint_validates_and_reschedules(self):
+        task = self.make_task(timezone.now() + timedelta(days=5))
+
+        bad = self.client.put("/api/me/reminders/", {"reminder_lead_times": ["2x"]}, format="json")
+        self.assertEqual(bad.status_code, 400)
+
+        response = self.client.put("/api/me/reminders/", {"reminder_lead_times": ["30m"]}, format="json")
+        self.assertEqual(response.data, {"reminder_lead_times": ["30m"]})
+        self.assertEqual(list(task.reminders.values_list("lead_time", flat=True)), [timedelta(minutes=30)])
+
+    def test_invalid_stored_lead_times_are_skipped(self):
+        UserProfile.objects.filter(user=self.user).update(reminder_lead_times=["1d", "2x", 7])
+        deadline = timezone.now() + timedelta(days=5)
+
+        with self.assertLogs("api.reminders", "WARNING") as logs:
+            response = self.client.post(
+                "/api/tasks/", {"title": "t", "deadline": deadline.isoformat(), "assigned_to_id": self.user.id}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(TaskReminder.objects.filter(task_id=response.data["id"]).values_list("lead_time", flat=True)),
+            [timedelta(days=1)],
+        )
+        self.assertEqual(len(logs.output), 2)
+
+    def test_settings_get_does_not_create_profile(self):
+        UserProfile.objects.filter(user=self.user).delete()
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/me/reminders/")
+
+        self.assertEqual(response.data, {"reminder_lead_times": ["3d"]})
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+
+class RejectingSMTPBackend(LocalSMTPBackend):
+    """Odrzuca adresy z domeny invalid – symuluje błąd SMTP dla pojedynczej wiadomości."""
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if any(address.endswith("@invalid") for address in message.to):
+                raise SMTPRecipientsRefused({address: (550, b"no such user") for address in message.to})
+        return super().send_messages(email_messages)
+
+
+class UnreachableSMTPBackend(LocalSMTPBackend):
+    """Serwer SMTP niedostępny – open() kończy się błędem połączenia."""
+
+    def open(self):
+        raise ConnectionRefusedError(111, "Connection refused")
+
+
+@override_settings(EMAIL_BACKEND="api.tests.RejectingSMTPBackend", EMAIL_POOL_SIZE=2, EMAIL_BATCH_SIZE=3)
+class MailerTests(TestCase):
+
+    def setUp(self):
+        LocalSMTPBackend.reset_counters()
+        mailer.reset_pool()
+
+    def test_batches_reuse_pooled_connection_and_count_failures(self):
+        messages = [EmailMessage("s", "b", to=[f"u{i}@example.com"]) for i in range(7)]
+        messages.append(EmailMessage("s", "b", to=["ghost@invalid"]))
+
+        results = mailer.send_messages(messages)
+        mailer.send_messages(messages[:2])
+
+        self.assertEqual([error is None for _, error in results], [True] * 7 + [False])
+        self.assertEqual(LocalSMTPBackend.opened, 1)
+        self.assertEqual(LocalSMTPBackend.delivered, 9)
+        stats = mailer.stats()
+        self.assertEqual((stats["sent"], stats["failed"], stats["batches"]), (9, 1, 4))
+
+    def test_pool_discards_idle_connections(self):
+        pool = mailer.ConnectionPool(size=1, max_idle=60)
+        with pool.connection():
+            pass
+        with mock.patch("api.mailer.time.monotonic", return_value=time.monotonic() + 61):
+            with pool.connection():
+                pass
+
+        self.assertEqual(pool.stats.connections_opened, 2)
+
+    def test_mass_mail_is_queued_as_one_task_and_retries_only_failures(self):
+        with mock.patch("api.utils.async_task") as async_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                emails = queue_mass_mail([
+                    ("s", "b", None, ["ok@example.com"]),
+                    ("s", "b", None, ["ghost@invalid"]),
+                ])
+
+        ids = [email.id for email in emails]
+        async_task.assert_called_once_with("api.tasks.deliver_emails", ids)
+
+        self.assertEqual(deliver_emails(ids), 1)
+        self.assertEqual(
+            list(EmailOutbox.objects.order_by("id").values_list("status", "attempts")),
+            [("sent", 1), ("pending", 1)],
+        )
+
+    @override_settings(EMAIL_BACKEND="api.tests.UnreachableSMTPBackend")
+    def test_unreachable_server_fails_every_message_of_the_batch(self):
+        messages = [EmailMessage("s", "b", to=[f"u{i}@example.com"]) for i in range(4)]
+
+        results = mailer.send_messages(messages)
+
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(isinstance(error, ConnectionRefusedError) for _, error in results))
+        self.assertEqual(mailer.stats()["failed"], 4)
+
+    @override_settings(EMAIL_BACKEND="api.tests.UnreachableSMTPBackend")
+    def test_outbox_backs_off_when_server_is_unreachable(self):
+        email = EmailOutbox.objects.create(subject="s", message="b", recipient_list=["a@example.com"])
+
+        self.assertEqual(deliver_emails([email.id]), 0)
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ("pending", 1))
+        self.assertIn("ConnectionRefusedError", email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+
+@override_settings(
+    EMAIL_BACKEND="api.tests.RejectingSMTPBackend",
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS=60,
+)
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        mailer.reset_pool()
+
+    def test_mail_is_enqueued_only_after_commit(self):
+        with mock.patch("api.utils.async_task") as async_task:
+            with self.captureOnCommitCallbacks() as callbacks:
+                email = queue_mail("s", "b", ["a@example.com"])
+            async_task.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+
+        async_task.assert_called_once_with("api.tasks.deliver_email", email.id)
+
+    def test_unavailable_broker_leaves_row_for_the_schedule(self):
+        with mock.patch("api.utils.async_task", side_effect=ConnectionError):
+            with self.captureOnCommitCallbacks(execute=True):
+                email = queue_mail("s", "b", ["a@example.com"])
+
+        self.assertEqual(process_outbox(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ("sent", 1))
+
+    def test_failures_back_off_exponentially_then_dead_letter(self):
+        email = EmailOutbox.objects.create(subject="s", message="b", recipient_list=["ghost@invalid"])
+
+        delays = []
+        for _ in range(3):
+            before = timezone.now()
+            deliver_email(email.id)
+            email.refresh_from_db()
+            delays.append(round((email.next_attempt_at - before).total_seconds() / 60))
+            # termin kolejnej próby minął – jak przy wywołaniu przez harmonogram
+            EmailOutbox.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+
+        self.assertEqual(delays[:2], [1, 2])
+        self.assertEqual((email.status, email.attempts), ("dead", 3))
+        self.assertIn("SMTPRecipientsRefused", email.last_error)
+        self.assertEqual(process_outbox(), 0)
+
+    def test_claimed_rows_are_not_claimed_again(self):
+        email = EmailOutbox.objects.create(subject="s", message="b", recipient_list=["a@example.com"])
+
+        self.assertEqual(claim_emails([email.id]), [email])
+        self.assertEqual(claim_emails([email.id]), [])
+        self.assertEqual(process_outbox(), 0)
+
+
+@skipUnless(connection.vendor == "postgresql", "SKIP LOCKED wymaga PostgreSQL")
+class EmailOutboxSkipLockedTests(TransactionTestCase):
+
+    def test_row_locked_by_another_worker_is_skipped(self):
+        email = EmailOutbox.objects.create(subject="s", message="b", recipient_list=["a@example.com"])
+        claimed = []
+
+        def other_worker():
+            try:
+                claimed.extend(claim_emails([email.id]))
+            finally:
+                connections.close_all()
+
+        with transaction.atomic():
+            EmailOutbox.objects.select_for_update().get(id=email.id)
+            thread = threading.Thread(target=other_worker)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(claimed, [])
+        self.assertEqual(claim_emails([email.id]), [email])
+
+
+@override_settings(UPLOAD_BACKEND="api.uploads.LocalUploadBackend", UPLOAD_MAX_BYTES=1024)
+class DirectUploadTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        storage = mock.patch.object(default_storage, "_wrapped", FileSystemStorage(location=root.name, base_url="/media/"))
+        storage.start()
+        self.addCleanup(storage.stop)
+
+        self.user = User.objects.create_user("owner")
+        self.task = Task.objects.create(user=self.user, created_by=self.user, assigned_to=self.user, title="t")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request_upload(self, size=5, target="task", filename="raport końcowy.pdf"):
+        response = self.client.post(
+            "/api/uploads/", {"target": target, "filename": filename, "size": size}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def upload(self, form, content=b"hello"):
+        return APIClient().post(
+            form["upload"]["url"],
+            {**form["upload"]["fields"], "file": SimpleUploadedFile("x.pdf", content)},
+            format="multipart",
+        )
+
+    def attach(self, key):
+        return self.client.patch(f"/api/tasks/{self.task.id}/", {"attachment_key": key}, format="json")
+
+    def test_presign_upload_and_confirm_attaches_key(self):
+        form = self.request_upload()
+        self.assertTrue(form["key"].startswith(f"user_task_attachments/{self.user.id}/"))
+        self.assertEqual(self.upload(form).status_code, 204)
+
+        response = self.attach(form["key"])
+
+        self.assertEqual(response.status_code, 200)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.attachment.name, form["key"])
+        self.assertTrue(default_storage.exists(form["key"]))
+
+    def test_confirm_rejects_missing_foreign_and_reused_objects(self):
+        form = self.request_upload()
+        self.assertEqual(self.attach(form["key"]).status_code, 400)  # jeszcze nie wysłany
+
+        self.upload(form)
+        self.assertEqual(self.attach(form["key"]).status_code, 200)
+        self.assertEqual(self.attach(form["key"]).status_code, 400)  # już podpięty
+
+        intruder = User.objects.create_user("intruder")
+        with self.assertRaises(ValidationError):
+            uploads.claim_upload(form["key"], intruder, "task")
+        with self.assertRaises(ValidationError):
+            uploads.claim_upload(form["key"], self.user, "chat")
+
+    def test_task_for_many_assignees_gets_a_copy_per_task(self):
+        self.user.is_staff = True
+        self.user.save()
+        assignees = [User.objects.create_user(f"a{i}") for i in range(2)]
+        form = self.request_upload()
+        self.upload(form)
+
+        response = self.client.post(
+            "/api/tasks/",
+            {"title": "z plikiem", "assigned_to_ids": [u.id for u in assignees], "attachment_key": form["key"]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        names = list(Task.objects.filter(title="z plikiem").order_by("id").values_list("attachment", flat=True))
+        self.assertEqual(names[0], form["key"])
+        self.assertEqual(len(set(names)), 2)
+        for name in names:
+            with default_storage.open(name) as stored:
+                self.assertEqual(stored.read(), b"hello")
+
+    def test_stand_in_enforces_signature_and_size(self):
+        self.assertEqual(self.client.post("/api/uploads/", {"target": "task", "filename": "a", "size": 2048}, format="json").status_code, 400)
+
+        form = self.request_upload()
+        self.assertEqual(self.upload(form, content=b"x" * 2048).status_code, 403)
+        form["upload"]["fields"]["token"] += "x"
+        self.assertEqual(self.upload(form).status_code, 403)
+        self.assertFalse(default_storage.exists(form["key"]))
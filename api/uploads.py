@@ -0,0 +1,201 @@
+"""
+Załączniki wysyłane bezpośrednio do magazynu plików (presigned upload).
+
+1. Klient prosi o adres: POST /api/uploads/ {"target": "task"|"chat",
+   "filename", "content_type", "size"} – dostaje klucz obiektu i formularz
+   (url + fields) ważny UPLOAD_URL_EXPIRES_SECONDS.
+2. Klient wysyła plik prosto do magazynu (multipart POST z polami `fields`
+   i plikiem w polu "file") – gunicorn nie trzyma workera przez cały upload.
+3. Klient potwierdza: `attachment_key` w TaskSerializer / ChatMessageSerializer.
+   claim_upload sprawdza, że klucz należy do użytkownika i celu, obiekt
+   istnieje, mieści się w limicie i nie jest już podpięty – dopiero wtedy
+   klucz trafia do FileField.
+
+Backend wybiera UPLOAD_BACKEND: S3UploadBackend (presigned POST z warunkami
+rozmiaru i typu) albo LocalUploadBackend – zastępnik bez sieci dla CI i
+developmentu, z tym samym kontraktem presign/stat, zapisujący przez
+default_storage za podpisanym endpointem /api/uploads/local/.
+"""
+import os
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from django.utils.text import get_valid_filename
+from rest_framework import serializers
+
+# cel -> pole FileField, do którego trafia potwierdzony klucz
+UPLOAD_TARGETS = {
+    "task": "api.Task.attachment",
+    "chat": "chat.ChatMessage.attachment",
+}
+
+LOCAL_SIGNING_SALT = "api.uploads.local"
+
+
+def max_upload_bytes():
+    return getattr(settings, "UPLOAD_MAX_BYTES", 25 * 1024 * 1024)
+
+
+def url_expires_seconds():
+    return getattr(settings, "UPLOAD_URL_EXPIRES_SECONDS", 900)
+
+
+def target_field(target):
+    try:
+        app_label, model_name, field_name = UPLOAD_TARGETS[target].split(".")
+    except KeyError:
+        raise serializers.ValidationError({"target": "Nieznany cel załącznika."})
+    return apps.get_model(app_label, model_name)._meta.get_field(field_name)
+
+
+def key_prefix(field, user):
+    return f"{field.upload_to}{user.id}/"
+
+
+def make_key(field, user, filename):
+    directory = f"{key_prefix(field, user)}{uuid.uuid4().hex}/"
+    name, ext = os.path.splitext(get_valid_filename(os.path.basename(filename)) or "plik")
+    # FileField ma max_length (domyślnie 100) – skracamy nazwę, nie rozszerzenie
+    room = field.max_length - len(directory) - len(ext)
+    return f"{directory}{name[:max(room, 1)]}{ext}"
+
+
+class BaseUploadBackend:
+    def presign(self, key, content_type, max_size, expires_in, request=None):
+        """Formularz uploadu: {"url", "method", "fields"}."""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """{"size": int} dla istniejącego obiektu albo None."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        default_storage.delete(key)
+
+    def copy(self, source, target):
+        with default_storage.open(source) as content:
+            default_storage.save(target, content)
+
+
+class S3UploadBackend(BaseUploadBackend):
+    """Presigned POST do bucketu S3Boto3Storage – warunki rozmiaru i typu egzekwuje S3."""
+
+    def presign(self, key, content_type, max_size, expires_in, request=None):
+        client = default_storage.bucket.meta.client
+        form = client.generate_presigned_post(
+            Bucket=default_storage.bucket_name,
+            Key=default_storage._normalize_name(key),
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                ["content-length-range", 1, max_size],
+                {"Content-Type": content_type},
+            ],
+            ExpiresIn=expires_in,
+        )
+        return {"url": form["url"], "method": "POST", "fields": form["fields"]}
+
+    def stat(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            head = default_storage.bucket.meta.client.head_object(
+                Bucket=default_storage.bucket_name, Key=default_storage._normalize_name(key),
+            )
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {"size": head["ContentLength"]}
+
+    def copy(self, source, target):
+        # kopia po stronie S3 – plik nie przechodzi przez proces
+        default_storage.bucket.meta.client.copy_object(
+            Bucket=default_storage.bucket_name,
+            Key=default_storage._normalize_name(target),
+            CopySource={"Bucket": default_storage.bucket_name, "Key": default_storage._normalize_name(source)},
+        )
+
+
+class LocalUploadBackend(BaseUploadBackend):
+    """Zastępnik bez sieci: podpisany formularz na LocalUploadView, zapis przez default_storage."""
+
+    def presign(self, key, content_type, max_size, expires_in, request=None):
+        url = reverse("local-upload")
+        token = signing.dumps({"key": key, "max_size": max_size}, salt=LOCAL_SIGNING_SALT)
+        return {
+            "url": request.build_absolute_uri(url) if request is not None else url,
+            "method": "POST",
+            "fields": {"key": key, "token": token},
+        }
+
+    def stat(self, key):
+        if not default_storage.exists(key):
+            return None
+        return {"size": default_storage.size(key)}
+
+    def receive(self, token, key, upload):
+        """Przyjmuje plik z formularza presign; zwraca komunikat błędu albo None."""
+        try:
+            grant = signing.loads(token, salt=LOCAL_SIGNING_SALT, max_age=url_expires_seconds())
+        except signing.BadSignature:
+            return "Nieprawidłowy lub wygasły podpis."
+        if grant["key"] != key:
+            return "Klucz nie zgadza się z podpisem."
+        if not upload or not 0 < upload.size <= grant["max_size"]:
+            return "Nieprawidłowy rozmiar pliku."
+        if default_storage.exists(key):
+            return "Obiekt już istnieje."
+        default_storage.save(key, upload)
+        return None
+
+
+def get_backend():
+    return import_string(getattr(settings, "UPLOAD_BACKEND", "api.uploads.S3UploadBackend"))()
+
+
+def create_upload(user, target, filename, content_type, size, request=None):
+    if not 0 < size <= max_upload_bytes():
+        raise serializers.ValidationError({"size": f"Plik musi mieć od 1 do {max_upload_bytes()} bajtów."})
+
+    field = target_field(target)
+    key = make_key(field, user, filename)
+    expires_in = url_expires_seconds()
+    return {
+        "key": key,
+        "expires_in": expires_in,
+        "upload": get_backend().presign(key, content_type, max_upload_bytes(), expires_in, request=request),
+    }
+
+
+def claim_upload(key, user, target):
+    """Weryfikuje przesłany obiekt przed podpięciem; zwraca klucz albo ValidationError."""
+    field = target_field(target)
+    if not key.startswith(key_prefix(field, user)) or ".." in key or len(key) > field.max_length:
+        raise serializers.ValidationError("Nieprawidłowy klucz załącznika.")
+
+    backend = get_backend()
+    info = backend.stat(key)
+    if info is None:
+        raise serializers.ValidationError("Plik nie został przesłany.")
+    if info["size"] > max_upload_bytes():
+        backend.delete(key)
+        raise serializers.ValidationError("Plik przekracza dozwolony rozmiar.")
+    if field.model._default_manager.filter(**{field.name: key}).exists():
+        raise serializers.ValidationError("Ten plik jest już podpięty.")
+    return key
+
+
+def copy_upload(key, user, target):
+    """
+    Kopia potwierdzonego obiektu pod nowym kluczem – każde zadanie ma własny
+    plik (usunięcie załącznika jednego zadania nie psuje pozostałych).
+    """
+    field = target_field(target)
+    copy_key = make_key(field, user, os.path.basename(key))
+    get_backend().copy(key, copy_key)
+    return copy_key
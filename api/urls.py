@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TaskViewSet, ScheduleViewSet, NoteListCreate, NoteDelete, UserListView, MeView, CommentListCreateView, TaskStatsView, MyActivityListView, GroupActivityListView, DashboardStatsView, TaskSummaryView, VisibleUsersView, CompletedTaskViewSet, ActivityUserView
+from .views import TaskViewSet, ScheduleViewSet, NoteListCreate, NoteDelete, UserListView, MeView, CommentListCreateView, TaskStatsView, MyActivityListView, GroupActivityListView, DashboardStatsView, TaskSummaryView, VisibleUsersView, CompletedTaskViewSet, ActivityUserView, ReminderSettingsView, UploadCreateView, LocalUploadView
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet, basename='task')
@@ -12,6 +12,7 @@ urlpatterns = [
     path("notes/delete/<int:pk>/", NoteDelete.as_view(), name="delete-note"),
     path("users/", UserListView.as_view(), name="user-list"),
     path("me/", MeView.as_view(), name="me"),
+    path("me/reminders/", ReminderSettingsView.as_view(), name="reminder-settings"),
     path('tasks/<int:task_id>/comments/', CommentListCreateView.as_view(), name='task-comments'),
     path("tasks-stats/", TaskStatsView.as_view()),
     # path("activities/", ActivityListView.as_view(), name="activity-list"),
@@ -22,4 +23,6 @@ urlpatterns = [
     path('visible-users/', VisibleUsersView.as_view(), name='visible-users'),
     path("completed-tasks/", CompletedTaskViewSet.as_view({"get": "list"})),
     path("activity-users/", ActivityUserView.as_view(), name="activity-users"),
+    path("uploads/", UploadCreateView.as_view(), name="upload-create"),
+    path("uploads/local/", LocalUploadView.as_view(), name="local-upload"),
 ]
@@ -1,32 +1,184 @@
-from .models import Activity
+from .models import Activity, EmailOutbox
 from django.utils import timezone
-from django.core.mail import send_mail
-from .models import Task
-from datetime import timedelta
+from django.db import transaction
+from datetime import datetime, time
+from django_q.tasks import async_task
+import logging
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from asgiref.sync import sync_to_async
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+# Bufor aktywności bieżącego requestu / joba (None = brak bufora)
+_activity_buffer = ContextVar("activity_buffer", default=None)
+
 
 def log_activity(user, action, source_user=None):
-    Activity.objects.create(user=user, action=action, source_user=source_user)
+    # czas zdarzenia, nie zapisu – bufor trafia do bazy dopiero po commicie
+    activity = Activity(user=user, action=action, source_user=source_user, created_at=timezone.now())
+
+    buffer = _activity_buffer.get()
+    if buffer is None:
+        # poza buforem (np. shell) – zapis od razu, jak dotychczas
+        activity.save()
+    else:
+        buffer.append(activity)
+    return activity
+
+
+@contextmanager
+def activity_buffer():
+    """
+    Zbiera wywołania log_activity i zapisuje je jednym bulk_create po commicie.
+    Używane przez ActivityBufferMiddleware; w komendach i jobach django_q
+    można owinąć nim pracę ręcznie. Wyczyszczenie listy porzuca wpisy.
+    """
+    buffer = []
+    token = _activity_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _activity_buffer.reset(token)
+
+    if buffer:
+        pending = list(buffer)
+        transaction.on_commit(lambda: Activity.objects.bulk_create(pending))
+
+
+@asynccontextmanager
+async def async_activity_buffer():
+    """
+    Odpowiednik activity_buffer dla middleware pod ASGI. Widoki synchroniczne
+    działają wtedy w sync_to_async, który kopiuje kontekst – dopisują do tej
+    samej listy. Ich transakcja jest już zamknięta, więc zapis idzie od razu.
+    """
+    buffer = []
+    token = _activity_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _activity_buffer.reset(token)
+
+    if buffer:
+        await sync_to_async(Activity.objects.bulk_create)(list(buffer))
+
+
+def shared_cache():
+    """
+    Domyślny Django cache, jeśli jest wspólny dla procesów (np. Redis przez
+    REDIS_URL); None dla LocMem/Dummy – wtedy unieważnienie z jednego workera
+    nie dotarłoby do pozostałych, więc cache'e usług zostają tylko w procesie.
+    """
+    cache = caches["default"]
+    return None if isinstance(cache, (LocMemCache, DummyCache)) else cache
+
+
+class TwoLevelCache:
+    """
+    Wynik compute(id) trzymany krótko w pamięci procesu (local_ttl) i dłużej
+    we wspólnym Django cache (shared_cache, timeout) pod kluczem key(id).
+    Pamięć procesu ogranicza nieaktualność między workerami, gdy unieważnienie
+    z innego procesu nie może do niej dotrzeć. compute nie może zwracać None.
+    """
+
+    def __init__(self, key, compute, timeout=300, local_ttl=5):
+        self.key = key
+        self.compute = compute
+        self.timeout = timeout
+        self.local_ttl = local_ttl
+        self.local = {}
+
+    def get(self, ident):
+        now = monotonic()
+        entry = self.local.get(ident)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        cache = shared_cache()
+        value = cache.get(self.key(ident)) if cache is not None else None
+        if value is None:
+            value = self.compute(ident)
+            if cache is not None:
+                cache.set(self.key(ident), value, self.timeout)
+
+        self.local[ident] = (now + self.local_ttl, value)
+        return value
+
+    def forget(self, idents):
+        for ident in idents:
+            self.local.pop(ident, None)
+        cache = shared_cache()
+        if cache is not None:
+            cache.delete_many([self.key(ident) for ident in idents])
+
+    def invalidate(self, idents):
+        idents = set(idents)
+        if not idents:
+            return
+        self.forget(idents)
+        # równoległe żądanie mogło w międzyczasie zapisać starą wartość – drugi raz po commicie
+        transaction.on_commit(lambda: self.forget(idents))
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """
+    Zapisuje maila w EmailOutbox w bieżącej transakcji.
+    Wysyłkę robi worker django_q dopiero po commicie – request nie czeka na SMTP.
+    """
+    email = EmailOutbox.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email,
+        recipient_list=list(recipient_list),
+    )
+
+    def enqueue():
+        try:
+            async_task("api.tasks.deliver_email", email.id)
+        except Exception:
+            # broker niedostępny – wiersz i tak podbierze harmonogram process_outbox
+            logger.warning("Could not enqueue outbox email %s", email.id, exc_info=True)
+
+    transaction.on_commit(enqueue)
+    return email
+
+
+def queue_mass_mail(datatuple):
+    """
+    Jak send_mass_mail: (subject, message, from_email, recipient_list) dla
+    każdego maila. Wiersze zapisywane jednym bulk_create, a po commicie jedno
+    zadanie django_q wysyła całą paczkę jednym połączeniem z puli.
+    """
+    emails = EmailOutbox.objects.bulk_create([
+        EmailOutbox(
+            subject=subject,
+            message=message,
+            from_email=from_email,
+            recipient_list=list(recipient_list),
+        )
+        for subject, message, from_email, recipient_list in datatuple
+    ])
+    if not emails:
+        return emails
 
+    outbox_ids = [email.id for email in emails]
 
+    def enqueue():
+        try:
+            async_task("api.tasks.deliver_emails", outbox_ids)
+        except Exception:
+            logger.warning("Could not enqueue outbox emails %s", outbox_ids, exc_info=True)
 
-def remind_deadlines():
-    today = timezone.now().date()
-    reminder_date = today + timedelta(days=2)  # <-- 2 dni przed!
+    transaction.on_commit(enqueue)
+    return emails
 
-    tasks = Task.objects.filter(deadline__date=reminder_date)
 
-    print(f"🔔 Sprawdzam deadliny na {reminder_date} — znaleziono {tasks.count()} zadań")
 
-    for task in tasks:
-        recipient = task.assigned_to
-        if recipient and recipient.email:
-            send_mail(
-                subject=f'Przypomnienie: termin zadania "{task.title}"',
-                message=(
-                    f'Cześć {recipient.username},\n\n'
-                    f'Przypominamy, że zadanie "{task.title}" ma termin za 2 dni: {task.deadline}.\n'
-                    f'Sprawdź w TickTask!'
-                ),
-                from_email=None,
-                recipient_list=[recipient.email],
-            )
\ No newline at end of file
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
@@ -1,23 +1,26 @@
 from django.shortcuts import render
 from django.contrib.auth.models import User
 from rest_framework import generics,viewsets, permissions, filters, decorators
-from .serializers import UserSerializer, NoteSerializer, TaskSerializer, ScheduleSerializer, CommentSerializer, ActivitySerializer
+from .serializers import UserSerializer, NoteSerializer, TaskSerializer, ScheduleSerializer, CommentSerializer, ActivitySerializer, ReminderSettingsSerializer, UploadRequestSerializer, recent_comments_prefetch
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import Note, Task, Schedule, Activity, GroupMembership
+from .models import Note, Task, Schedule, Activity, UserProfile, overdue_q
+from .visibility import visible_user_ids, is_leader
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from .models import Comment
-from django.utils import timezone
-from collections import Counter
-from .utils import log_activity
+from datetime import timedelta
+from .utils import log_activity, queue_mail, queue_mass_mail, start_of_day
+from .reminders import schedule_reminders, reschedule_user_reminders
+from . import uploads
 from rest_framework import status
-from django.core.mail import send_mail
-from api.pagination import StandardResultsSetPagination
+from django.db import transaction
+from api.pagination import StandardResultsSetPagination, KeysetPagination
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from django.utils.dateparse import parse_date
 from django.core.files.storage import default_storage
 from rest_framework.decorators import action
-from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+from django.db.models import Count, Q, prefetch_related_objects
 
 
 class NoteListCreate(generics.ListCreateAPIView):
@@ -54,7 +57,7 @@ class TaskViewSet(viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = None
+    pagination_class = KeysetPagination  # opcjonalnie: ?page_size=&cursor=
     parser_classes = [JSONParser, MultiPartParser, FormParser]
     
     filter_backends = [filters.OrderingFilter]
@@ -64,30 +67,22 @@ class TaskViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
 
-        if user.is_staff:
-            return Task.objects.all()
-
-        if hasattr(user, "userprofile") and user.userprofile.role == "leader":
-            # Grupy, gdzie user jest leaderem
-            user_group_ids = GroupMembership.objects.filter(
-                user=user
-            ).values_list('group_id', flat=True)
-
-            # Userzy w tych grupach
-            group_user_ids = GroupMembership.objects.filter(
-                group_id__in=user_group_ids
-            ).values_list('user_id', flat=True)
+        # autorzy/przypisani + 2 ostatnie komentarze w stałej liczbie zapytań
+        qs = Task.objects.select_related("created_by", "assigned_to").prefetch_related(
+            recent_comments_prefetch()
+        )
 
-            return Task.objects.filter(
-                assigned_to__id__in=group_user_ids
-            )
+        # admin: wszystko, leader: członkowie wszystkich jego grup, zwykły user: on sam
+        user_ids = visible_user_ids(user, all_groups=True)
+        if user_ids is None:
+            return qs
 
-        # Zwykły user
-        return Task.objects.filter(assigned_to=user)
+        return qs.filter(assigned_to_id__in=user_ids)
 
     def get_serializer_context(self):
         return {"request": self.request}
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
         creator = request.user
         assigned_to_ids = request.data.get("assigned_to_ids", [])
@@ -98,11 +93,23 @@ class TaskViewSet(viewsets.ModelViewSet):
         assigned_to_ids = [int(uid) for uid in assigned_to_ids]
 
         tasks = []
+        mails = []
 
         if assigned_to_ids:
+            data = request.data
+            attachment_key = None
+            if "attachment_key" in data:
+                # klucz potwierdzany raz – przy drugim przypisanym byłby już "podpięty"
+                try:
+                    attachment_key = uploads.claim_upload(data["attachment_key"], creator, "task")
+                except ValidationError as error:
+                    raise ValidationError({"attachment_key": error.detail})
+                data = data.copy()
+                del data["attachment_key"]
+
             for user_id in assigned_to_ids:
                 
-                serializer = self.get_serializer(data=request.data)
+                serializer = self.get_serializer(data=data)
                 serializer.is_valid(raise_exception=True)
 
                 assigned_to_user = User.objects.get(id=user_id)
@@ -110,10 +117,16 @@ class TaskViewSet(viewsets.ModelViewSet):
                 print("Assigned to IDs:", assigned_to_ids)
                 print("Sending mail to:", assigned_to_user.email)
 
+                extra = {}
+                if attachment_key:
+                    # pierwsze zadanie dostaje wysłany obiekt, kolejne – własne kopie (jak przy multipart)
+                    extra["attachment"] = attachment_key if not tasks else uploads.copy_upload(attachment_key, creator, "task")
+
                 task = serializer.save(
                     created_by=creator,
                     assigned_to=assigned_to_user,
-                    user=creator
+                    user=creator,
+                    **extra
                 )
 
                 tasks.append(task)  # <-- DODAJESZ DO LISTY!
@@ -151,13 +164,17 @@ class TaskViewSet(viewsets.ModelViewSet):
                             f'Sprawdź w TickTask!'
                         )
 
-                    send_mail(
-                        subject=f'Nowe zadanie: {task.title}',
-                        message=msg,
-                        from_email='noreply@inqse.com',
-                        recipient_list=[assigned_to_user.email],
-                    )
-
+                    mails.append((
+                        f'Nowe zadanie: {task.title}',
+                        msg,
+                        'noreply@inqse.com',
+                        [assigned_to_user.email],
+                    ))
+
+            # wszystkie powiadomienia jedną paczką – jedno połączenie SMTP zamiast N
+            queue_mass_mail(mails)
+            schedule_reminders(tasks)
+            prefetch_related_objects(tasks, recent_comments_prefetch())
             return Response(self.get_serializer(tasks, many=True).data, status=status.HTTP_201_CREATED)
 
         else:
@@ -171,10 +188,12 @@ class TaskViewSet(viewsets.ModelViewSet):
             )
 
             log_activity(user=creator, action=f"Utworzyłeś zadanie: {task.title}")
+            schedule_reminders([task])
 
             return Response(self.get_serializer(task).data, status=status.HTTP_201_CREATED)
 
 
+    @transaction.atomic
     def perform_update(self, serializer):
         old_task = self.get_object()
         old_data = {
@@ -183,11 +202,20 @@ class TaskViewSet(viewsets.ModelViewSet):
             "deadline": old_task.deadline,
             "priority": old_task.priority,
             "status": old_task.status,  # <-- DODAJ TO!
+            "assigned_to_id": old_task.assigned_to_id,
         }
 
         updated_task = serializer.save()
         changes = []
 
+        # przypomnienia liczone z góry – przelicz, gdy zmienia się termin, osoba lub status
+        if (
+            old_data["deadline"] != updated_task.deadline
+            or old_data["assigned_to_id"] != updated_task.assigned_to_id
+            or old_data["status"] != updated_task.status
+        ):
+            schedule_reminders([updated_task])
+
         if old_data["title"] != updated_task.title:
             changes.append("zmieniono tytuł")
         if old_data["description"] != updated_task.description:
@@ -218,7 +246,7 @@ class TaskViewSet(viewsets.ModelViewSet):
                 recipient = updated_task.created_by
 
             if recipient and recipient.email:
-                send_mail(
+                queue_mail(
                     subject=f'Status zadania zmieniony: {updated_task.title}',
                     message=(
                         f'Cześć {recipient.username},\n\n'
@@ -366,6 +394,60 @@ class MeView(APIView):
         return Response(serializer.data)
 
 
+class ReminderSettingsView(APIView):
+    """Wyprzedzenia przypomnień zalogowanego usera, np. {"reminder_lead_times": ["1h", "1d"]}."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # odczyt bez zapisu – brak profilu to domyślne wyprzedzenia
+        profile = UserProfile.objects.filter(user=request.user).first() or UserProfile(user=request.user)
+        return Response(ReminderSettingsSerializer(profile).data)
+
+    @transaction.atomic
+    def put(self, request):
+        profile, _ = UserProfile.objects.get_or_create(user=request.user)
+        serializer = ReminderSettingsSerializer(profile, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        reschedule_user_reminders(request.user)
+        return Response(serializer.data)
+
+
+class UploadCreateView(APIView):
+    """
+    Krok 1 uploadu bezpośrednio do magazynu: zwraca klucz obiektu i formularz
+    (url, method, fields). Po wysłaniu pliku klient podaje klucz jako
+    `attachment_key` przy zadaniu albo wiadomości czatu (api.uploads).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = uploads.create_upload(request.user, request=request, **serializer.validated_data)
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+
+class LocalUploadView(APIView):
+    """Odbiornik formularzy LocalUploadBackend – bez sieci (CI, development); autoryzuje podpis."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        backend = uploads.get_backend()
+        if not isinstance(backend, uploads.LocalUploadBackend):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        error = backend.receive(
+            request.data.get("token", ""), request.data.get("key", ""), request.FILES.get("file"),
+        )
+        if error:
+            return Response({"error": error}, status=status.HTTP_403_FORBIDDEN)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class CommentListCreateView(generics.ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -392,31 +474,28 @@ class TaskStatsView(APIView):
 
     def get(self, request):
         user = request.user
-        now = timezone.now()
 
-        # ✅ Automatyczna zmiana na "po_terminie", tylko dla NIEukończonych zadań
-        Task.objects.filter(
-            assigned_to=user,
-            is_completed=False,
-            deadline__lt=now
-        ).exclude(status="overdue").exclude(status="completed").update(status="overdue")
+        # Czysty odczyt – "po terminie" liczone w locie, status w bazie
+        # przestawia w tle api.tasks.sweep_overdue_tasks
+        due = overdue_q()
 
         assigned_tasks = Task.objects.filter(assigned_to=user)
 
-        total = assigned_tasks.count()
-        completed = assigned_tasks.filter(status="completed").count()
-        in_progress = assigned_tasks.filter(status="in_progress").count()
-        overdue = assigned_tasks.filter(status="overdue").count()
-        upcoming = assigned_tasks.filter(status="upcoming").count()
+        counts = assigned_tasks.aggregate(
+            total=Count("id"),
+            completed=Count("id", filter=Q(status="completed")),
+            in_progress=Count("id", filter=Q(status="in_progress") & ~due),
+            overdue=Count("id", filter=Q(status="overdue") | due),
+            upcoming=Count("id", filter=Q(status="upcoming") & ~due),
+        )
 
-        priority_counts = dict(Counter(assigned_tasks.values_list("priority", flat=True)))
+        priority_counts = {
+            row["priority"]: row["count"]
+            for row in assigned_tasks.values("priority").annotate(count=Count("id")).order_by()
+        }
 
         return Response({
-            "total": total,
-            "completed": completed,
-            "in_progress": in_progress,
-            "overdue": overdue,
-            "upcoming": upcoming,
+            **counts,
             "priority_stats": priority_counts
         })
         
@@ -473,18 +552,21 @@ def apply_activity_filters(qs, request):
     date_to = qp.get("date_to")
 
     if action_icontains:
+        # Na Postgresie obsługuje to indeks GIN pg_trgm na UPPER(action)
+        # (migracja 0023), na SQLite zwykły LIKE
         qs = qs.filter(action__icontains=action_icontains)
 
     if username:
         qs = qs.filter(user__username=username)
 
-    # Parsowanie dat – filtrujemy po komponencie DATE stempla czasowego
+    # Daty jako zakres na created_at (bez rzutowania na DATE), żeby
+    # mógł zadziałać indeks (user, created_at)
     df = parse_date(date_from) if date_from else None
     dt = parse_date(date_to) if date_to else None
     if df:
-        qs = qs.filter(created_at__date__gte=df)
+        qs = qs.filter(created_at__gte=start_of_day(df))
     if dt:
-        qs = qs.filter(created_at__date__lte=dt)
+        qs = qs.filter(created_at__lt=start_of_day(dt + timedelta(days=1)))
 
     return qs
 
@@ -519,17 +601,8 @@ class GroupActivityListView(generics.ListAPIView):
             qs = Activity.objects.exclude(user=user)
         else:
             # leader: tylko aktywności użytkowników z jego grup
-            is_leader = hasattr(user, "userprofile") and user.userprofile.role == "leader"
-            if is_leader:
-                group_ids = GroupMembership.objects.filter(
-                    user=user, role="leader"
-                ).values_list("group_id", flat=True)
-
-                group_user_ids = GroupMembership.objects.filter(
-                    group_id__in=group_ids
-                ).values_list("user_id", flat=True)
-
-                qs = Activity.objects.filter(user__id__in=group_user_ids).exclude(user=user)
+            if is_leader(user):
+                qs = Activity.objects.filter(user_id__in=visible_user_ids(user)).exclude(user=user)
             else:
                 qs = Activity.objects.none()
 
@@ -541,40 +614,74 @@ class GroupActivityListView(generics.ListAPIView):
 class TaskSummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
+    # aliasy adnotacji dla priorytetów (nazwy pól w SQL muszą być ASCII)
+    PRIORITY_ALIASES = {
+        "Wysoki": "priority_high",
+        "Średni": "priority_medium",
+        "Niski": "priority_low",
+    }
+
     def get(self, request):
         user_id = request.query_params.get('user_id')
-        users = User.objects.all()
+        users = User.objects.only("id", "username").order_by("id")
+
+        visible_ids = visible_user_ids(request.user)
+        if visible_ids is not None:
+            users = users.filter(id__in=visible_ids)
 
         if user_id:
             users = users.filter(id=user_id)
 
+        # Paginacja opcjonalna (?page=), bez niej zwracamy pełną listę jak dotychczas
+        paginator = None
+        if "page" in request.query_params:
+            paginator = StandardResultsSetPagination()
+            users = paginator.paginate_queryset(users, request, view=self)
+            user_filter = [u.id for u in users]
+        else:
+            user_filter = users.values("id")
+
+        # Jedno zapytanie GROUP BY assigned_to z warunkowymi COUNT-ami;
+        # "po terminie" liczone w locie jak w TaskStatsView (sweeper działa w tle)
+        not_completed = ~Q(status="completed")
+        due = overdue_q()
+        rows = (
+            Task.objects.filter(assigned_to__in=user_filter)
+            .values("assigned_to")
+            .annotate(
+                total=Count("id"),
+                completed=Count("id", filter=Q(status="completed")),
+                overdue=Count("id", filter=Q(status="overdue") | due),
+                upcoming=Count("id", filter=Q(status="upcoming") & ~due),
+                in_progress=Count("id", filter=Q(status="in_progress") & ~due),
+                **{
+                    alias: Count("id", filter=Q(priority=priority) & not_completed)
+                    for priority, alias in self.PRIORITY_ALIASES.items()
+                },
+            )
+            .order_by()
+        )
+        stats = {row["assigned_to"]: row for row in rows}
+
         data = []
         for user in users:
-            user_tasks = Task.objects.filter(assigned_to=user)
-            total = user_tasks.count()
-            completed = user_tasks.filter(is_completed=True).count()
-            overdue = user_tasks.filter(status="overdue").count()
-            upcoming = user_tasks.filter(status="upcoming").count()
-            in_progress = user_tasks.filter(status="in_progress").count()
-            completed = user_tasks.filter(status="completed").count()
-
-            priority_stats = {
-                "Wysoki": user_tasks.filter(priority="Wysoki").exclude(status="completed").count(),
-                "Średni": user_tasks.filter(priority="Średni").exclude(status="completed").count(),
-                "Niski": user_tasks.filter(priority="Niski").exclude(status="completed").count(),
-            }
-
+            row = stats.get(user.id, {})
             data.append({
                 "id": user.id,
                 "username": user.username,
-                "total": total,
-                "completed": completed,
-                "overdue": overdue,
-                "upcoming": upcoming,
-                "in_progress": in_progress,
-                "priority_stats": priority_stats,
+                "total": row.get("total", 0),
+                "completed": row.get("completed", 0),
+                "overdue": row.get("overdue", 0),
+                "upcoming": row.get("upcoming", 0),
+                "in_progress": row.get("in_progress", 0),
+                "priority_stats": {
+                    priority: row.get(alias, 0)
+                    for priority, alias in self.PRIORITY_ALIASES.items()
+                },
             })
 
+        if paginator is not None:
+            return paginator.get_paginated_response(data)
         return Response(data)
     
 
@@ -586,14 +693,8 @@ class VisibleUsersView(APIView):
 
         if user.is_staff:
             users = User.objects.all()
-        elif hasattr(user, "userprofile") and user.userprofile.role == 'leader':
-            group_ids = GroupMembership.objects.filter(
-                user=user, role='leader'
-            ).values_list('group_id', flat=True)
-
-            users = User.objects.filter(
-                groupmembership__group_id__in=group_ids
-            ).distinct()
+        elif is_leader(user):
+            users = User.objects.filter(id__in=visible_user_ids(user))
         else:
             users = User.objects.none()
 
@@ -609,23 +710,15 @@ class CompletedTaskViewSet(viewsets.ReadOnlyModelViewSet):
         user = self.request.user
 
         # 🔑 Poprawiony warunek:
-        qs = Task.objects.filter(status="completed")
+        qs = Task.objects.filter(status="completed").select_related(
+            "created_by", "assigned_to"
+        ).prefetch_related(recent_comments_prefetch())
 
-        if user.is_staff:
+        user_ids = visible_user_ids(user)
+        if user_ids is None:
             return qs
 
-        if hasattr(user, "userprofile") and user.userprofile.role == "leader":
-            group_ids = GroupMembership.objects.filter(
-                user=user, role="leader"
-            ).values_list("group_id", flat=True)
-
-            group_user_ids = GroupMembership.objects.filter(
-                group_id__in=group_ids
-            ).values_list("user_id", flat=True)
-
-            return qs.filter(assigned_to__id__in=group_user_ids)
-
-        return qs.filter(assigned_to=user)
+        return qs.filter(assigned_to_id__in=user_ids)
     
     
 class ActivityUserView(APIView):
@@ -0,0 +1,63 @@
+"""
+Zakres widoczności użytkowników:
+  - admin (is_staff) – wszyscy,
+  - leader – on sam i członkowie grup, w których jest liderem; lista zadań
+    (TaskViewSet) obejmuje, jak dotąd, wszystkie jego grupy (all_groups=True),
+  - member – tylko on sam.
+
+Wynik (rola z UserProfile + zbiory id) jest trzymany krótko w pamięci procesu
+i dłużej we wspólnym Django cache (api.utils.TwoLevelCache – drugi poziom tylko,
+gdy cache jest współdzielony przez procesy, np. Redis). Sygnały w api.signals
+czyszczą oba poziomy przy zmianach GroupMembership i UserProfile.
+"""
+from .models import GroupMembership, UserProfile
+from .utils import TwoLevelCache
+
+
+def _compute(user_id):
+    role = (
+        UserProfile.objects.filter(user_id=user_id).values_list("role", flat=True).first()
+        or "member"
+    )
+
+    if role != "leader":
+        return role, frozenset([user_id]), frozenset([user_id])
+
+    own_groups = dict(GroupMembership.objects.filter(user_id=user_id).values_list("group_id", "role"))
+    led_ids, all_ids = {user_id}, {user_id}
+    for member_id, group_id in GroupMembership.objects.filter(
+        group_id__in=list(own_groups)
+    ).values_list("user_id", "group_id"):
+        all_ids.add(member_id)
+        if own_groups[group_id] == "leader":
+            led_ids.add(member_id)
+
+    return role, frozenset(led_ids), frozenset(all_ids)
+
+
+_cache = TwoLevelCache(lambda user_id: f"visibility:v2:{user_id}", _compute)
+
+
+def get_role(user):
+    """Rola z UserProfile ('admin' / 'leader' / 'member')."""
+    return _cache.get(user.id)[0]
+
+
+def is_leader(user):
+    return get_role(user) == "leader"
+
+
+def visible_user_ids(user, all_groups=False):
+    """
+    Id użytkowników widocznych dla `user` (zawsze z nim samym); None oznacza
+    brak ograniczeń (admin). all_groups=True – leader widzi członków wszystkich
+    swoich grup, nie tylko tych, którymi kieruje.
+    """
+    if user.is_staff:
+        return None
+    _, led_ids, all_ids = _cache.get(user.id)
+    return all_ids if all_groups else led_ids
+
+
+def invalidate(user_ids):
+    _cache.invalidate(user_ids)
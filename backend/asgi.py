@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Strumień zdarzeń czatu (/api/chat/events/, Server-Sent Events) i long-poll
+(/api/chat/<id>/poll/) to widoki asynchroniczne – uruchamiane pod ASGI
+(Procfile: gunicorn z UvicornWorker) czekają bez blokowania workerów.
+Wszystkie middleware są async-capable, więc łańcuch nie przechodzi przez wątek.
 """
 
 import os
@@ -25,6 +25,12 @@ AWS_S3_FILE_OVERWRITE = False
 # AWS_DEFAULT_ACL = 'public-read'
 AWS_QUERYSTRING_AUTH = False
 
+# Załączniki wysyłane bezpośrednio do magazynu (api.uploads). LocalUploadBackend
+# to zastępnik bez sieci (CI, development) – pliki lądują wtedy w MEDIA_ROOT.
+UPLOAD_BACKEND = os.getenv("UPLOAD_BACKEND", "api.uploads.S3UploadBackend")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 25 * 1024 * 1024))
+UPLOAD_URL_EXPIRES_SECONDS = int(os.getenv("UPLOAD_URL_EXPIRES_SECONDS", 900))
+
 
 # --- Inne ---
 SECRET_KEY = os.environ.get("SECRET_KEY", "fallback")
@@ -76,7 +82,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.StaticFilesMiddleware',  # WhiteNoise z trybem async
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -84,6 +90,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "api.middleware.ActivityBufferMiddleware",
 ]
 
 ROOT_URLCONF = "backend.urls"
@@ -117,6 +124,17 @@ DATABASES = {
     }
 }
 
+# Wspólny cache (Redis) – api.visibility i chat.membership trzymają w nim wyniki
+# między workerami. Bez REDIS_URL zostaje LocMem i cache'e działają tylko w procesie.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -142,6 +160,45 @@ Q_CLUSTER = {
     'orm': 'default',
 }
 
+# Skrzynka nadawcza maili (api.EmailOutbox) – ponowienia z wykładniczym backoffem
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_OUTBOX_RETRY_BASE_SECONDS", 60))
+
+# Pula połączeń SMTP na worker (api.mailer) i rozmiar paczki wysyłanej jedną sesją
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", 2))
+EMAIL_POOL_MAX_IDLE_SECONDS = int(os.getenv("EMAIL_POOL_MAX_IDLE_SECONDS", 60))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 100))
+# Opóźnienia zastępczego backendu api.mailer.LocalSMTPBackend (benchmarki offline)
+EMAIL_STANDIN_HANDSHAKE_MS = int(os.getenv("EMAIL_STANDIN_HANDSHAKE_MS", 0))
+EMAIL_STANDIN_SEND_MS = int(os.getenv("EMAIL_STANDIN_SEND_MS", 0))
+
+# Partycje api_activity (PostgreSQL) – retencja i archiwizacja do storage
+ACTIVITY_RETENTION_MONTHS = int(os.getenv("ACTIVITY_RETENTION_MONTHS", 12))
+ACTIVITY_PARTITIONS_AHEAD = int(os.getenv("ACTIVITY_PARTITIONS_AHEAD", 3))
+ACTIVITY_ARCHIVE_PREFIX = os.getenv("ACTIVITY_ARCHIVE_PREFIX", "activity_archive/")
+
+# Przypomnienia o terminach (api.reminders) – domyślne wyprzedzenia dla nowych profili
+REMINDER_DEFAULT_LEAD_TIMES = os.getenv("REMINDER_DEFAULT_LEAD_TIMES", "3d").split(",")
+
+# Digesty powiadomień czatu (chat.notifications) – okres ciszy i maksymalne opóźnienie
+CHAT_DIGEST_QUIET_SECONDS = int(os.getenv("CHAT_DIGEST_QUIET_SECONDS", 120))
+CHAT_DIGEST_MAX_DELAY_SECONDS = int(os.getenv("CHAT_DIGEST_MAX_DELAY_SECONDS", 900))
+
+# Zdarzenia czatu na żywo (chat.realtime) – broker i heartbeat strumienia SSE.
+# Web działa pod ASGI (Procfile: gunicorn + UvicornWorker). Z REDIS_URL zdarzenia
+# idą przez Redis pub/sub i workerów może być wiele; bez Redisa broker jest
+# w pamięci procesu, więc web MUSI mieć jeden worker (WEB_CONCURRENCY=1) –
+# inaczej sprawdzenie chat.W001 ostrzega przy starcie.
+CHAT_REALTIME_BROKER = os.getenv(
+    "CHAT_REALTIME_BROKER",
+    "chat.realtime.RedisBroker" if REDIS_URL else "chat.realtime.InMemoryBroker",
+)
+CHAT_EVENTS_HEARTBEAT_SECONDS = int(os.getenv("CHAT_EVENTS_HEARTBEAT_SECONDS", 15))
+CHAT_LONG_POLL_TIMEOUT_SECONDS = int(os.getenv("CHAT_LONG_POLL_TIMEOUT_SECONDS", 25))
+
+# Odczyty rozmów (chat.seen) – co ile sekund bufor trafia do ConversationSeen
+CHAT_SEEN_FLUSH_SECONDS = int(os.getenv("CHAT_SEEN_FLUSH_SECONDS", 5))
+
 
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND')
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -172,5 +229,9 @@ DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 
 from storages.backends.s3boto3 import S3Boto3Storage
 from django.core.files.storage import default_storage
-default_storage._wrapped = S3Boto3Storage()
+if UPLOAD_BACKEND == "api.uploads.LocalUploadBackend":
+    MEDIA_ROOT = os.getenv("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
+    MEDIA_URL = "/media/"
+else:
+    default_storage._wrapped = S3Boto3Storage()
 
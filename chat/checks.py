@@ -0,0 +1,21 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def realtime_broker_check(app_configs, **kwargs):
+    """InMemoryBroker nie przenosi zdarzeń między workerami – przy kilku gubi SSE i long-polle."""
+    broker = getattr(settings, "CHAT_REALTIME_BROKER", "chat.realtime.InMemoryBroker")
+    try:
+        workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    except ValueError:
+        workers = 1
+    if broker == "chat.realtime.InMemoryBroker" and workers > 1:
+        return [Warning(
+            f"CHAT_REALTIME_BROKER to InMemoryBroker, a WEB_CONCURRENCY={workers}.",
+            hint="Ustaw REDIS_URL (RedisBroker) albo WEB_CONCURRENCY=1.",
+            id="chat.W001",
+        )]
+    return []
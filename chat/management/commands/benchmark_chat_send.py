@@ -0,0 +1,107 @@
+# chat/management/commands/benchmark_chat_send.py
+
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chat import realtime
+from chat.models import ChatMessage, Conversation
+from chat.tasks import record_notifications
+from chat.views import ChatMessageListCreateView
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mierzy czas i liczbę zapytań wysyłki wiadomości dla rozmów 2-, 20- i 200-osobowych (dane są wycofywane)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[2, 20, 200], help='Liczby uczestników')
+        parser.add_argument('--messages', type=int, default=50, help='Wiadomości na rozmowę')
+        parser.add_argument(
+            '--broker',
+            help='Broker zdarzeń na żywo (ścieżka klasy, np. chat.realtime.RedisBroker); domyślnie CHAT_REALTIME_BROKER',
+        )
+
+    def handle(self, *args, **options):
+        broker = import_string(options['broker'])() if options['broker'] else realtime.get_broker()
+        previous, realtime._broker = realtime._broker, broker
+
+        # każda publikacja to jeden round-trip do Redisa przy RedisBroker
+        publish = broker.publish
+        self.publishes = 0
+
+        def counting_publish(channel, event):
+            self.publishes += 1
+            return publish(channel, event)
+
+        broker.publish = counting_publish
+        self.stdout.write(f'broker: {type(broker).__name__}')
+        try:
+            with transaction.atomic():
+                for size in options['sizes']:
+                    self.benchmark(size, options['messages'])
+                # nic z benchmarku nie zostaje w bazie; on_commit (fan-out) benchmark wykonuje i mierzy sam
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            del broker.publish
+            realtime._broker = previous
+
+    def benchmark(self, size, count):
+        users = User.objects.bulk_create([
+            User(username=f'bench_{size}_{i}_{time.monotonic_ns()}', email=f'bench{i}@example.com')
+            for i in range(size)
+        ])
+        conversation = Conversation.objects.create(is_group=size > 2, group_name=f'benchmark {size}')
+        conversation.participants.set(users)
+
+        view = ChatMessageListCreateView.as_view()
+        factory = APIRequestFactory()
+        sender = users[0]
+
+        elapsed = after_commit = 0.0
+        request_queries = after_commit_queries = inserts = 0
+        self.publishes = 0
+        for i in range(count):
+            request = factory.post(f'/api/chat/{conversation.id}/messages/', {'text': f'wiadomość {i}'})
+            force_authenticate(request, user=sender)
+            # callbacki on_commit przechwycone – transakcja benchmarku nigdy nie jest commitowana
+            with CaptureQueriesContext(connection) as queries, TestCase.captureOnCommitCallbacks() as callbacks:
+                started = time.perf_counter()
+                response = view(request, conversation_id=conversation.id)
+                elapsed += time.perf_counter() - started
+            assert response.status_code == 201, response.data
+            request_queries += len(queries)
+            inserts += sum(1 for query in queries if query['sql'].startswith('INSERT INTO "chat_chatmessage"'))
+
+            # to, co po commicie robi proces web: zdarzenia na żywo + zlecenie dla workera
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for callback in callbacks:
+                    callback()
+                after_commit += time.perf_counter() - started
+            after_commit_queries += len(queries)
+
+        # etap w workerze django_q, poza procesem web – dla porównania, jak rośnie z wielkością grupy
+        message = ChatMessage.objects.filter(conversation=conversation).last()
+        started = time.perf_counter()
+        record_notifications(message.id)
+        worker = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{size:>4} uczestników: {elapsed * 1000 / count:6.2f} ms/wysyłkę, '
+            f'{request_queries / count:.1f} zapytań/wysyłkę, {inserts / count:.1f} INSERT wiadomości/wysyłkę; '
+            f'po commicie: {after_commit * 1000 / count:6.2f} ms/wysyłkę, {after_commit_queries / count:.1f} zapytań/wysyłkę, '
+            f'{self.publishes / count:.1f} publikacji brokera/wysyłkę; '
+            f'digest w workerze: {worker * 1000:6.2f} ms'
+        )
@@ -0,0 +1,41 @@
+"""
+Członkostwo w rozmowach – zbiór id uczestników per rozmowa.
+
+Wynik jest trzymany krótko w pamięci procesu i dłużej we wspólnym Django
+cache (api.utils.TwoLevelCache – wspólny tylko, gdy cache jest np. w Redisie),
+więc autoryzacja w widokach czatu to sprawdzenie w zbiorze, bez zapytań przy
+ciepłym cache. Sygnały w chat.signals czyszczą oba poziomy przy zmianach
+Conversation.participants (m2m_changed) oraz przy zapisie/usunięciu rozmowy.
+"""
+from api.utils import TwoLevelCache
+
+from .models import Conversation
+
+
+def _compute(conversation_id):
+    user_ids = frozenset(
+        Conversation.participants.through.objects.filter(
+            conversation_id=conversation_id
+        ).values_list("user_id", flat=True)
+    )
+    # pusty zbiór może też znaczyć, że rozmowy nie ma – wtedy (False, ...)
+    exists = bool(user_ids) or Conversation.objects.filter(id=conversation_id).exists()
+    return exists, user_ids
+
+
+_cache = TwoLevelCache(lambda conversation_id: f"chat-membership:{conversation_id}", _compute)
+
+
+def participant_ids(conversation_id):
+    """Id uczestników rozmowy; None, gdy rozmowa nie istnieje."""
+    exists, user_ids = _cache.get(int(conversation_id))
+    return user_ids if exists else None
+
+
+def is_participant(conversation_id, user):
+    user_ids = participant_ids(conversation_id)
+    return user_ids is not None and user.id in user_ids
+
+
+def invalidate(conversation_ids):
+    _cache.invalidate(int(conversation_id) for conversation_id in conversation_ids)
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+CONV_TIMESTAMP_INDEX = models.Index(fields=['conversation', 'timestamp'], name='chat_msg_conv_timestamp_idx')
+
+
+def concurrently(schema_editor):
+    # CONCURRENTLY (bez blokady zapisów) tylko na Postgresie – SQLite tworzy indeks zwyczajnie
+    return {"concurrently": True} if schema_editor.connection.vendor == "postgresql" else {}
+
+
+def add_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model('chat', 'ChatMessage'), CONV_TIMESTAMP_INDEX, **concurrently(schema_editor))
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('chat', 'ChatMessage'), CONV_TIMESTAMP_INDEX, **concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('chat', '0005_chatmessage_attachment_alter_chatmessage_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='chatmessage', index=CONV_TIMESTAMP_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_index, remove_index),
+            ],
+        ),
+    ]
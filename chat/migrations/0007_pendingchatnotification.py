@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_query_pattern_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingChatNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_message_at', models.DateTimeField()),
+                ('last_message_at', models.DateTimeField()),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_notifications', to='chat.conversation')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_chat_notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('conversation', 'recipient')},
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:29
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_participants_key(apps, schema_editor):
+    # klucz dostaje najstarsza rozmowa danej pary; późniejsze duplikaty zostają
+    # z NULL (bez utraty wiadomości), a get_or_create zwraca już tę kanoniczną
+    Conversation = apps.get_model("chat", "Conversation")
+    Through = Conversation.participants.through
+
+    members = defaultdict(set)
+    for conversation_id, user_id in Through.objects.filter(
+        conversation__is_group=False
+    ).values_list("conversation_id", "user_id").iterator(chunk_size=2000):
+        members[conversation_id].add(user_id)
+
+    taken = set()
+    batch = []
+    for conversation_id in sorted(members):
+        user_ids = members[conversation_id]
+        if len(user_ids) != 2:
+            continue
+        key = ":".join(str(user_id) for user_id in sorted(user_ids))
+        if key in taken:
+            continue
+        taken.add(key)
+        batch.append(Conversation(id=conversation_id, participants_key=key))
+
+    Conversation.objects.bulk_update(batch, ["participants_key"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_pendingchatnotification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='participants_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_participants_key, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_group', False)), fields=('participants_key',), name='chat_private_participants_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+CONV_TS_ID_INDEX = models.Index(fields=['conversation', 'timestamp', 'id'], name='chat_msg_conv_ts_id_idx')
+CONV_TIMESTAMP_INDEX = models.Index(fields=['conversation', 'timestamp'], name='chat_msg_conv_timestamp_idx')
+
+
+def concurrently(schema_editor):
+    # CONCURRENTLY (bez blokady zapisów) tylko na Postgresie – SQLite zmienia indeksy zwyczajnie
+    return {"concurrently": True} if schema_editor.connection.vendor == "postgresql" else {}
+
+
+def swap_indexes(apps, schema_editor):
+    # nowy indeks najpierw – historia nie traci indeksu w trakcie migracji
+    model = apps.get_model('chat', 'ChatMessage')
+    schema_editor.add_index(model, CONV_TS_ID_INDEX, **concurrently(schema_editor))
+    schema_editor.remove_index(model, CONV_TIMESTAMP_INDEX, **concurrently(schema_editor))
+
+
+def restore_indexes(apps, schema_editor):
+    model = apps.get_model('chat', 'ChatMessage')
+    schema_editor.add_index(model, CONV_TIMESTAMP_INDEX, **concurrently(schema_editor))
+    schema_editor.remove_index(model, CONV_TS_ID_INDEX, **concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('chat', '0008_conversation_participants_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='chatmessage', index=CONV_TS_ID_INDEX),
+                migrations.RemoveIndex(model_name='chatmessage', name='chat_msg_conv_timestamp_idx'),
+            ],
+            database_operations=[
+                migrations.RunPython(swap_indexes, restore_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:31
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_message_at(apps, schema_editor):
+    Conversation = apps.get_model("chat", "Conversation")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+
+    latest = (
+        ChatMessage.objects.filter(conversation=OuterRef("pk"))
+        .order_by("-timestamp")
+        .values("timestamp")[:1]
+    )
+    Conversation.objects.update(last_message_at=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_message_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_message_at, migrations.RunPython.noop),
+    ]
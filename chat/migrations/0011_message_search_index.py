@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # GIN na tsvector istnieje tylko na Postgresie – na SQLite (testy) zostaje LIKE
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    # wyrażenie musi być takie samo jak SearchVector("text", config="simple") w chat.search
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_msg_text_search_idx "
+        "ON chat_chatmessage USING gin (to_tsvector('simple'::regconfig, COALESCE(text, '')))"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS chat_msg_text_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('chat', '0010_conversation_last_message_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 
 class Conversation(models.Model):
@@ -13,6 +14,23 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_group = models.BooleanField(default=False)
     group_name = models.CharField(max_length=255, blank=True, null=True)
+    # kanoniczny klucz pary rozmówców ("<mniejsze id>:<większe id>") – tylko czaty prywatne
+    participants_key = models.CharField(max_length=64, blank=True, null=True)
+    # czas ostatniej wiadomości, utrzymywany przy wysyłce (chat.signals)
+    last_message_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['participants_key'],
+                condition=Q(is_group=False),
+                name='chat_private_participants_key_uniq',
+            ),
+        ]
+
+    @staticmethod
+    def private_key(user_ids):
+        return ":".join(str(user_id) for user_id in sorted(set(user_ids)))
 
     def __str__(self):
         if self.is_group and self.group_name:
@@ -25,6 +43,12 @@ class ChatMessage(models.Model):
     text = models.TextField(blank=True)
     attachment = models.FileField(upload_to='chat_attachments/', blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # historia rozmowy stronicowana kursorem po (timestamp, id)
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='chat_msg_conv_ts_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username}: {self.text[:20]}"
@@ -40,3 +64,21 @@ class ConversationSeen(models.Model):
 
     def __str__(self):
         return f"{self.user.username} saw {self.conversation.id} at {self.last_seen}"
+
+
+class PendingChatNotification(models.Model):
+    """
+    Zaległe powiadomienie mailowe: jeden wiersz na (rozmowa, odbiorca),
+    scalający wszystkie wiadomości od first_message_at do last_message_at.
+    Wysyłane jako jeden digest po okresie ciszy (chat.notifications).
+    """
+    conversation = models.ForeignKey('Conversation', on_delete=models.CASCADE, related_name='pending_notifications')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_chat_notifications')
+    first_message_at = models.DateTimeField()
+    last_message_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('conversation', 'recipient')
+
+    def __str__(self):
+        return f"{self.recipient.username} <- {self.conversation.id} ({self.first_message_at} – {self.last_message_at})"
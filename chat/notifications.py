@@ -0,0 +1,147 @@
+"""
+Powiadomienia mailowe o nowych wiadomościach czatu.
+
+Zamiast maila na każdą wiadomość, record_message (w workerze, chat.tasks)
+robi jeden upsert PendingChatNotification na odbiorcę. Job flush_digests
+(co minutę) wysyła jeden digest na rozmowę, gdy rozmowa ucichła na CHAT_DIGEST_QUIET_SECONDS
+(albo najstarsza zaległa wiadomość czeka dłużej niż CHAT_DIGEST_MAX_DELAY_SECONDS).
+Odbiorcy, którzy w międzyczasie przeczytali rozmowę (ConversationSeen albo
+bufor chat.seen), są pomijani.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.utils import queue_mass_mail
+
+from . import seen as seen_buffer
+from .models import ChatMessage, ConversationSeen, PendingChatNotification
+
+FLUSH_BATCH_SIZE = 200
+PREVIEW_LIMIT = 10
+
+
+def record_message(message):
+    """Dopisuje wiadomość do zaległych powiadomień pozostałych uczestników."""
+    recipient_ids = (
+        message.conversation.participants.exclude(id=message.sender_id)
+        .exclude(email="")
+        .values_list("id", flat=True)
+    )
+    pending = PendingChatNotification.objects.bulk_create(
+        [
+            PendingChatNotification(
+                conversation_id=message.conversation_id,
+                recipient_id=recipient_id,
+                first_message_at=message.timestamp,
+                last_message_at=message.timestamp,
+            )
+            for recipient_id in recipient_ids
+        ],
+        update_conflicts=True,
+        unique_fields=["conversation", "recipient"],
+        update_fields=["last_message_at"],
+    )
+    return len(pending)
+
+
+def ready_q(now):
+    quiet = timedelta(seconds=getattr(settings, "CHAT_DIGEST_QUIET_SECONDS", 120))
+    max_delay = timedelta(seconds=getattr(settings, "CHAT_DIGEST_MAX_DELAY_SECONDS", 900))
+    return Q(last_message_at__lte=now - quiet) | Q(first_message_at__lte=now - max_delay)
+
+
+def build_digest(pending, messages):
+    recipient = pending.recipient
+    conversation = pending.conversation
+    where = f'w grupie "{conversation.group_name}"' if conversation.is_group and conversation.group_name else "w TickTask"
+
+    lines = [
+        f"{message.sender.username}: {message.text or '[załącznik]'}"
+        for message in messages[-PREVIEW_LIMIT:]
+    ]
+    if len(messages) > PREVIEW_LIMIT:
+        lines.insert(0, f"(... i {len(messages) - PREVIEW_LIMIT} wcześniejszych)")
+
+    return (
+        "📬 Nowe wiadomości w TickTask",
+        (
+            f"Cześć {recipient.username},\n\n"
+            f"Masz {len(messages)} nowych wiadomości {where}:\n\n"
+            + "\n".join(lines)
+            + "\n\nZaloguj się do TickTask, aby odpowiedzieć!"
+        ),
+        "noreply@inqse.com",
+        [recipient.email],
+    )
+
+
+def flush_digests(now=None, batch_size=FLUSH_BATCH_SIZE):
+    """Harmonogram: wysyła digesty dla rozmów, które ucichły; zwraca liczbę maili."""
+    now = now or timezone.now()
+    ready = (
+        PendingChatNotification.objects.filter(ready_q(now))
+        .select_related("recipient", "conversation")
+        .order_by("id")
+    )
+
+    queued = 0
+    while True:
+        with transaction.atomic():
+            batch = list(ready.select_for_update(skip_locked=True, of=("self",))[:batch_size])
+            if not batch:
+                break
+
+            conversation_ids = {pending.conversation_id for pending in batch}
+            recipient_ids = {pending.recipient_id for pending in batch}
+            last_seen = {
+                (seen.conversation_id, seen.user_id): seen.last_seen
+                for seen in ConversationSeen.objects.filter(
+                    conversation_id__in=conversation_ids,
+                    user_id__in=recipient_ids,
+                    last_seen__isnull=False,
+                )
+            }
+            # odczyty jeszcze w buforze chat.seen
+            for key, when in seen_buffer.pending_seen_many(recipient_ids).items():
+                if key not in last_seen or last_seen[key] < when:
+                    last_seen[key] = when
+
+            # wiadomości z okna wszystkich digestów paczki – jedno zapytanie
+            by_conversation = defaultdict(list)
+            for message in (
+                ChatMessage.objects.filter(
+                    conversation_id__in=conversation_ids,
+                    timestamp__gte=min(pending.first_message_at for pending in batch),
+                )
+                .select_related("sender")
+                .order_by("timestamp", "id")
+            ):
+                by_conversation[message.conversation_id].append(message)
+
+            mails = []
+            for pending in batch:
+                seen_at = last_seen.get((pending.conversation_id, pending.recipient_id))
+                if seen_at is not None and seen_at >= pending.last_message_at:
+                    # odbiorca przeczytał już rozmowę – nie ma o czym powiadamiać
+                    continue
+
+                messages = [
+                    message
+                    for message in by_conversation[pending.conversation_id]
+                    if message.timestamp >= pending.first_message_at
+                    and (seen_at is None or message.timestamp > seen_at)
+                    and message.sender_id != pending.recipient_id
+                ]
+                if messages:
+                    mails.append(build_digest(pending, messages))
+
+            queue_mass_mail(mails)
+            PendingChatNotification.objects.filter(id__in=[pending.id for pending in batch]).delete()
+        queued += len(mails)
+
+    return queued
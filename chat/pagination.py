@@ -0,0 +1,93 @@
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.response import Response
+
+from api.pagination import KeysetPagination
+
+
+class MessageHistoryPagination(KeysetPagination):
+    """
+    Historia czatu stronicowana kursorem po (timestamp, id), zawsze włączona.
+
+    Bez kotwicy – ostatnie page_size wiadomości. ?before=<kursor> przewija
+    wstecz, ?after=<kursor> dociąga nowsze. Wyniki zawsze rosnąco po czasie;
+    "previous" wskazuje starszą stronę (gdy istnieje), "next" – wiadomości
+    po najnowszej z bieżącej strony (do odpytywania o nowe).
+    """
+    page_size = 50
+    max_page_size = 200
+    before_query_param = "before"
+    after_query_param = "after"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            self.page_size = min(max(int(request.query_params[self.page_size_query_param]), 1), self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+
+        self.request = request
+        self.field = "timestamp"
+        self.model_field = queryset.model._meta.get_field(self.field)
+
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+        if before and after:
+            raise NotFound("Podaj tylko jedną kotwicę: before albo after.")
+
+        if after:
+            value, pk = self.decode_cursor(after)
+            queryset = queryset.filter(Q(timestamp__gt=value) | Q(timestamp=value, id__gt=pk))
+            rows = list(queryset.order_by("timestamp", "id")[:self.page_size + 1])
+            self.has_previous = True
+            self.page = rows[:self.page_size]
+        else:
+            if before:
+                value, pk = self.decode_cursor(before)
+                queryset = queryset.filter(Q(timestamp__lt=value) | Q(timestamp=value, id__lt=pk))
+            rows = list(queryset.order_by("-timestamp", "-id")[:self.page_size + 1])
+            self.has_previous = len(rows) > self.page_size
+            self.page = rows[:self.page_size][::-1]
+
+        return self.page
+
+    def anchored_link(self, param, obj):
+        url = self.request.build_absolute_uri()
+        for other in (self.before_query_param, self.after_query_param):
+            url = remove_query_param(url, other)
+        return replace_query_param(url, param, self.encode_cursor(obj))
+
+    def get_previous_link(self):
+        if not self.page or not self.has_previous:
+            return None
+        return self.anchored_link(self.before_query_param, self.page[0])
+
+    def get_next_link(self):
+        if not self.page:
+            # pusta strona po ?after= – kotwica bez zmian, klient odpytuje dalej
+            return self.request.build_absolute_uri() if self.request.query_params.get(self.after_query_param) else None
+        return self.anchored_link(self.after_query_param, self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response({
+            "previous": self.get_previous_link(),
+            "next": self.get_next_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class MessageSearchPagination(KeysetPagination):
+    """Wyniki wyszukiwania od najnowszych, kursor po (timestamp, id) – zawsze włączone."""
+    default_page_size = 20
+    max_page_size = 100
@@ -0,0 +1,217 @@
+"""
+Zdarzenia czatu na żywo (Server-Sent Events przez backend.asgi).
+
+Każdy użytkownik ma własny kanał "user:<id>", strumień /api/chat/events/
+przekazuje jego zdarzenia klientowi. Po commicie nowej wiadomości
+(chat.signals) wychodzi jedno zdarzenie na kanał "conversation:<id>" –
+koszt wysyłki nie zależy od wielkości grupy. Broker doręcza je lokalnie:
+czekającym long-pollom (/api/chat/<id>/poll/) oraz tym uczestnikom, którzy
+mają w tym procesie otwarty strumień – jako "message" i "unread" z
+przyrostem ("delta"). UpdateLastSeenView wysyła "unread" z zerem.
+
+Broker jest wymienny (CHAT_REALTIME_BROKER – ścieżka do klasy).
+InMemoryBroker działa w obrębie jednego procesu: wystarcza dla jednego
+workera i testów. Przy kilku workerach (REDIS_URL) RedisBroker publikuje
+przez Redis pub/sub, a każdy proces rozdaje odebrane zdarzenia swoim
+lokalnym subskrybentom.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from . import membership
+
+logger = logging.getLogger(__name__)
+
+
+USER_PREFIX = "user:"
+CONVERSATION_PREFIX = "conversation:"
+
+
+def user_channel(user_id):
+    return f"{USER_PREFIX}{user_id}"
+
+
+def conversation_channel(conversation_id):
+    # long-poll traktuje zdarzenie jako sygnał "jest coś nowego" – treść pobiera sam widok
+    return f"{CONVERSATION_PREFIX}{conversation_id}"
+
+
+class Subscription:
+    """Kolejka zdarzeń jednego klienta, związana z pętlą zdarzeń, w której powstała."""
+
+    def __init__(self, broker, channel, max_pending=100):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def deliver(self, event):
+        # wołane z dowolnego wątku – do kolejki wkłada pętla subskrybenta
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            # wolny klient – gubimy najstarsze zdarzenie zamiast blokować publikującego
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Następne zdarzenie albo None po upływie timeout (czas na heartbeat)."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Wołane z pętli asyncio; zwraca obiekt z `await get(timeout)` i `close()`."""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InMemoryBroker(BaseBroker):
+    """Broker w pamięci procesu – jeden węzeł i testy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, event):
+        return self.deliver(channel, event)
+
+    def deliver(self, channel, event):
+        """Doręcza zdarzenie subskrybentom z tego procesu."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+        if channel.startswith(CONVERSATION_PREFIX) and "message" in event:
+            return len(subscriptions) + self._deliver_to_participants(event)
+        return len(subscriptions)
+
+    def _deliver_to_participants(self, event):
+        conversation_id = event["conversation"]
+        participant_ids = membership.participant_ids(conversation_id) or frozenset()
+        with self._lock:
+            # tylko uczestnicy z otwartym strumieniem w tym procesie
+            listening = [
+                int(channel[len(USER_PREFIX):])
+                for channel in self._subscriptions if channel.startswith(USER_PREFIX)
+            ]
+        delivered = 0
+        message = {"type": "message", "conversation": conversation_id, "message": event["message"]}
+        for user_id in participant_ids.intersection(listening):
+            delivered += self.deliver(user_channel(user_id), message)
+            if user_id != event["sender"]:
+                self.deliver(user_channel(user_id), {"type": "unread", "conversation": conversation_id, "delta": 1})
+        return delivered
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Redis pub/sub – zdarzenia docierają do strumieni we wszystkich workerach.
+
+    publish wysyła do Redisa (także dla subskrybentów z tego procesu). Wątek
+    nasłuchujący (psubscribe na kanały user:* i conversation:*) przekazuje
+    odebrane zdarzenia lokalnym subskrypcjom, więc kolejki i backpressure
+    działają tak samo jak w InMemoryBroker.
+    """
+    patterns = ("user:*", "conversation:*")
+
+    def __init__(self, url=None):
+        import redis
+
+        super().__init__()
+        self._redis = redis.Redis.from_url(url or settings.REDIS_URL)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(**{pattern: self._receive for pattern in self.patterns})
+        self._listener = self._pubsub.run_in_thread(
+            sleep_time=1, daemon=True, exception_handler=self._listener_error,
+        )
+
+    def publish(self, channel, event):
+        return self._redis.publish(channel, json.dumps(event, cls=DjangoJSONEncoder))
+
+    def _receive(self, message):
+        channel = message["channel"].decode() if isinstance(message["channel"], bytes) else message["channel"]
+        # członkostwo przy pustym cache czyta bazę – połączenie wątku nasłuchującego
+        close_old_connections()
+        self.deliver(channel, json.loads(message["data"]))
+
+    @staticmethod
+    def _listener_error(error, pubsub, thread):
+        # zerwane połączenie – kolejne get_message łączy się ponownie i odnawia psubscribe
+        logger.warning("Chat realtime Redis listener error: %r", error)
+        time.sleep(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def default_broker_path():
+    return "chat.realtime.RedisBroker" if getattr(settings, "REDIS_URL", None) else "chat.realtime.InMemoryBroker"
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, "CHAT_REALTIME_BROKER", default_broker_path())
+            _broker = import_string(path)()
+        return _broker
+
+
+def publish_message(message, payload):
+    """
+    Jedno zdarzenie na kanał rozmowy, niezależnie od wielkości grupy. Procesy
+    ze strumieniami uczestników rozdają je lokalnie (InMemoryBroker.deliver),
+    razem z "unread" z przyrostem o 1 – bez liczenia w bazie (dokładne liczby
+    daje migawka na starcie strumienia).
+    """
+    conversation_id = message.conversation_id
+    get_broker().publish(conversation_channel(conversation_id), {
+        "type": "message",
+        "conversation": conversation_id,
+        "id": message.id,
+        "sender": message.sender_id,
+        "message": payload,
+    })
+
+
+def publish_seen(conversation_id, user_id):
+    get_broker().publish(user_channel(user_id), {
+        "type": "unread", "conversation": conversation_id, "unread": 0,
+    })
@@ -0,0 +1,66 @@
+"""
+Wyszukiwanie pełnotekstowe w wiadomościach czatu.
+
+Na Postgresie dopasowanie to to_tsvector('simple', text) @@ websearch_to_tsquery
+(frazy w cudzysłowie, OR, -wykluczenia). Wyrażenie jest identyczne z indeksem
+GIN chat_msg_text_search_idx (migracja 0011), więc baza utrzymuje tsvector
+przy każdym INSERT, a zapytanie go używa. Konfiguracja 'simple' – bez
+stemmingu, bo Postgres nie ma słownika polskiego w standardzie.
+
+Na SQLite (testy) – icontains po każdym słowie frazy i podświetlenie w Pythonie.
+"""
+import re
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchVector
+from django.db import connection
+from django.utils.html import escape
+
+from .models import ChatMessage, Conversation
+
+SEARCH_CONFIG = "simple"
+
+# znaczniki z prywatnego obszaru Unicode – treść jest escapowana dopiero po ts_headline
+START_SEL = "\ue000"
+STOP_SEL = "\ue001"
+
+
+def search_query(terms):
+    return SearchQuery(terms, config=SEARCH_CONFIG, search_type="websearch")
+
+
+def search_messages(user, terms):
+    """Wiadomości z rozmów użytkownika pasujące do frazy; z `headline` na Postgresie."""
+    conversation_ids = Conversation.participants.through.objects.filter(user_id=user.id).values("conversation_id")
+    messages = ChatMessage.objects.filter(conversation_id__in=conversation_ids).select_related("sender")
+
+    if connection.vendor != "postgresql":
+        for word in terms.split():
+            messages = messages.filter(text__icontains=word.strip('"'))
+        return messages
+
+    query = search_query(terms)
+    return (
+        messages.annotate(search=SearchVector("text", config=SEARCH_CONFIG))
+        .filter(search=query)
+        # ts_headline liczy się już po LIMIT – tylko dla wierszy strony
+        .annotate(headline=SearchHeadline(
+            "text", query, config=SEARCH_CONFIG,
+            start_sel=START_SEL, stop_sel=STOP_SEL, max_fragments=2,
+        ))
+    )
+
+
+def render_headline(message, terms):
+    """Fragment wiadomości jako bezpieczny HTML z dopasowaniami w <mark>."""
+    headline = getattr(message, "headline", None)
+    if headline is None:
+        words = [re.escape(word.strip('"')) for word in terms.split() if word.strip('"')]
+        if not words:
+            return escape(message.text)
+        headline = re.sub(
+            "|".join(words),
+            lambda match: f"{START_SEL}{match.group(0)}{STOP_SEL}",
+            message.text,
+            flags=re.IGNORECASE,
+        )
+    return escape(headline).replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>")
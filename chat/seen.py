@@ -0,0 +1,174 @@
+"""
+Write-behind dla ConversationSeen.
+
+Klient woła /api/chat/<id>/seen/ bez przerwy, gdy rozmowa jest otwarta.
+mark_seen nie pisze do bazy: trzyma najnowszy czas na parę (rozmowa,
+użytkownik) w buforze procesu i we wspólnym Django cache (nakładka do
+odczytu). flush zapisuje bufor dwoma zapytaniami (INSERT brakujących wierszy +
+UPDATE tylko tam, gdzie nowy czas jest późniejszy – last_seen nigdy się nie
+cofa). Bufor opróżnia się, gdy najstarszy wpis czeka CHAT_SEEN_FLUSH_SECONDS
+– timerem w tle (także w bezczynnym procesie), przy mark_seen i na końcu
+każdego requestu – oraz przy wyjściu procesu.
+
+Liczniki nieprzeczytanych (annotate_unread) i digesty workera django_q
+czytają nakładkę, więc widzą odczyty jeszcze nie zapisane w bazie. Wymaga to
+cache wspólnego dla procesów (api.utils.shared_cache, np. Redis) – bez niego
+mark_seen zapisuje od razu do bazy, jak przed buforem.
+"""
+import atexit
+import logging
+import threading
+import time
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, DateTimeField, Q, Value, When
+from django.utils import timezone
+
+from api.utils import shared_cache
+
+from .models import ConversationSeen
+
+logger = logging.getLogger(__name__)
+
+OVERLAY_TIMEOUT = 300  # Django cache (sekundy) – z zapasem ponad interwał flush
+WRITE_BATCH_SIZE = 500
+
+_lock = threading.Lock()
+_pending = {}   # (conversation_id, user_id) -> najnowszy last_seen
+_oldest = None  # time.monotonic() pierwszego niezapisanego wpisu
+
+
+def _cache_key(user_id):
+    return f"chat-seen:{user_id}"
+
+
+def flush_interval():
+    return getattr(settings, "CHAT_SEEN_FLUSH_SECONDS", 5)
+
+
+def mark_seen(conversation_id, user_id, when=None):
+    global _oldest
+    when = when or timezone.now()
+    cache = shared_cache()
+    if cache is None:
+        # nakładki nie zobaczyłyby inne procesy (digesty, pozostałe workery)
+        write({(conversation_id, user_id): when})
+        return when
+
+    with _lock:
+        key = (conversation_id, user_id)
+        if key not in _pending or _pending[key] < when:
+            _pending[key] = when
+        if _oldest is None:
+            _oldest = time.monotonic()
+            _schedule_flush()
+
+    overlay = cache.get(_cache_key(user_id)) or {}
+    if conversation_id not in overlay or overlay[conversation_id] < when:
+        overlay[conversation_id] = when
+        cache.set(_cache_key(user_id), overlay, OVERLAY_TIMEOUT)
+
+    flush_if_due()
+    return when
+
+
+def pending_seen(user_id):
+    """{id rozmowy: last_seen} z nakładki – odczyty, których baza może jeszcze nie mieć."""
+    cache = shared_cache()
+    return (cache.get(_cache_key(user_id)) or {}) if cache is not None else {}
+
+
+def pending_seen_many(user_ids):
+    """{(id rozmowy, id użytkownika): last_seen} dla wielu użytkowników – jedno get_many."""
+    cache = shared_cache()
+    if cache is None:
+        return {}
+    keys = {_cache_key(user_id): user_id for user_id in set(user_ids)}
+    return {
+        (conversation_id, keys[key]): when
+        for key, overlay in cache.get_many(list(keys)).items()
+        for conversation_id, when in overlay.items()
+    }
+
+
+def _schedule_flush():
+    # bez tego bufor bezczynnego procesu czekałby na kolejny request dłużej niż żyje nakładka
+    timer = threading.Timer(flush_interval(), _flush_in_background)
+    timer.daemon = True
+    timer.start()
+
+
+def _flush_in_background():
+    try:
+        flush()
+    except Exception:
+        logger.warning("Could not flush buffered conversation seen updates", exc_info=True)
+    finally:
+        # połączenie wątku timera – nie zostaje otwarte do końca procesu
+        connection.close()
+
+
+def flush_if_due():
+    if _oldest is not None and time.monotonic() - _oldest >= flush_interval():
+        return flush()
+    return 0
+
+
+def flush():
+    """Zapisuje bufor procesu do ConversationSeen; zwraca liczbę par."""
+    global _pending, _oldest
+    with _lock:
+        entries, _pending = _pending, {}
+        _oldest = None
+    if not entries:
+        return 0
+
+    try:
+        items = list(entries.items())
+        for start in range(0, len(items), WRITE_BATCH_SIZE):
+            write(dict(items[start:start + WRITE_BATCH_SIZE]))
+    except Exception:
+        # baza niedostępna – wpisy wracają do bufora na następną próbę
+        with _lock:
+            for key, when in entries.items():
+                if key not in _pending or _pending[key] < when:
+                    _pending[key] = when
+            if _oldest is None:
+                _oldest = time.monotonic()
+        raise
+    return len(entries)
+
+
+def write(entries):
+    ConversationSeen.objects.bulk_create(
+        [
+            ConversationSeen(conversation_id=conversation_id, user_id=user_id, last_seen=when)
+            for (conversation_id, user_id), when in entries.items()
+        ],
+        ignore_conflicts=True,
+    )
+    # istniejące wiersze – tylko do przodu (inny proces mógł już zapisać późniejszy czas)
+    ConversationSeen.objects.filter(
+        reduce(or_, (
+            Q(conversation_id=conversation_id, user_id=user_id)
+            & (Q(last_seen__isnull=True) | Q(last_seen__lt=when))
+            for (conversation_id, user_id), when in entries.items()
+        ))
+    ).update(last_seen=Case(
+        *(
+            When(conversation_id=conversation_id, user_id=user_id, then=Value(when))
+            for (conversation_id, user_id), when in entries.items()
+        ),
+        output_field=DateTimeField(),
+    ))
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.warning("Could not flush buffered conversation seen updates", exc_info=True)
@@ -1,6 +1,14 @@
 from rest_framework import serializers
 from .models import ChatMessage, Conversation
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
+
+from api import uploads
+
+
+def participants_prefetch():
+    """Uczestnicy rozmów jednym zapytaniem – tylko pola potrzebne UserSerializer."""
+    return Prefetch("participants", queryset=User.objects.only("id", "username").order_by("id"))
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,10 +19,28 @@ class UserSerializer(serializers.ModelSerializer):
 class ChatMessageSerializer(serializers.ModelSerializer):
     sender_username = serializers.ReadOnlyField(source='sender.username')
     conversation = serializers.PrimaryKeyRelatedField(read_only=True)
+    # klucz pliku wysłanego bezpośrednio do magazynu (api.uploads)
+    attachment_key = serializers.CharField(write_only=True, required=False)
 
     class Meta:
         model = ChatMessage
-        fields = ['id', 'conversation', 'sender_username', 'text', 'timestamp', 'attachment']
+        fields = ['id', 'conversation', 'sender_username', 'text', 'timestamp', 'attachment', 'attachment_key']
+
+    def validate_attachment_key(self, value):
+        return uploads.claim_upload(value, self.context["request"].user, "chat")
+
+    def validate(self, attrs):
+        if "attachment_key" in attrs:
+            attrs["attachment"] = attrs.pop("attachment_key")
+        return attrs
+
+
+class ChatMessageSearchSerializer(ChatMessageSerializer):
+    # HTML z escapowaną treścią i dopasowaniami w <mark> (chat.search.render_headline)
+    headline = serializers.ReadOnlyField()
+
+    class Meta(ChatMessageSerializer.Meta):
+        fields = ChatMessageSerializer.Meta.fields + ['headline']
 
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -38,7 +64,25 @@ class ConversationSerializer(serializers.ModelSerializer):
         if obj.is_group:
             return None
         user = self.context['request'].user
-        other = obj.participants.exclude(id=user.id).first()
+        # participants.all() korzysta z prefetchu – bez zapytania na rozmowę
+        other = next((participant for participant in obj.participants.all() if participant.id != user.id), None)
         return UserSerializer(other).data if other else None
 
 
+class LastMessageSerializer(serializers.ModelSerializer):
+    sender_username = serializers.ReadOnlyField(source='sender.username')
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'sender_username', 'text', 'timestamp', 'attachment']
+
+
+class InboxConversationSerializer(ConversationSerializer):
+    last_message = LastMessageSerializer(read_only=True)
+    last_message_at = serializers.DateTimeField(read_only=True)
+    unread = serializers.IntegerField(read_only=True)
+
+    class Meta(ConversationSerializer.Meta):
+        fields = ConversationSerializer.Meta.fields + ['last_message', 'last_message_at', 'unread']
+
+
@@ -0,0 +1,68 @@
+import logging
+
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django_q.tasks import async_task
+
+from . import membership, realtime, seen
+from .models import ChatMessage, Conversation
+from .serializers import ChatMessageSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def fan_out(message):
+    """
+    Etap po commicie: zdarzenia na żywo (tanie, w procesie – broker musi je
+    dostać tam, gdzie wiszą strumienie SSE) i zlecenie digestów dla workera.
+    """
+    realtime.publish_message(message, ChatMessageSerializer(message).data)
+    try:
+        async_task("chat.tasks.record_notifications", message.id)
+    except Exception:
+        logger.warning("Could not enqueue chat notifications for message %s", message.id, exc_info=True)
+
+
+@receiver(post_save, sender=ChatMessage)
+def message_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    # zdenormalizowany czas ostatniej wiadomości – w tej samej transakcji co INSERT
+    Conversation.objects.filter(id=instance.conversation_id).filter(
+        Q(last_message_at__isnull=True) | Q(last_message_at__lt=instance.timestamp)
+    ).update(last_message_at=instance.timestamp)
+
+    # klient nie może dostać wiadomości, której jeszcze nie ma w bazie
+    transaction.on_commit(lambda: fan_out(instance))
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        membership.invalidate([instance.pk])
+    elif action == "pre_clear":
+        # user.conversations.clear() – w post_clear nie ma już listy rozmów
+        membership.invalidate(instance.conversations.values_list("id", flat=True))
+    elif pk_set:
+        membership.invalidate(pk_set)
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def invalidate_conversation_membership(sender, instance, **kwargs):
+    membership.invalidate([instance.pk])
+
+
+@receiver(request_finished)
+def flush_seen(sender, **kwargs):
+    # zaległe odczyty nie czekają na następne /seen/ w tym procesie
+    try:
+        seen.flush_if_due()
+    except Exception:
+        logger.warning("Could not flush buffered conversation seen updates", exc_info=True)
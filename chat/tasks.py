@@ -0,0 +1,14 @@
+"""
+Zadania czatu wykonywane przez klaster django_q (Q_CLUSTER w settings).
+"""
+from . import notifications
+from .models import ChatMessage
+
+
+def record_notifications(message_id):
+    """Fan-out po wysyłce: zaległe powiadomienia (digest) dla pozostałych uczestników."""
+    message = ChatMessage.objects.select_related("conversation").filter(id=message_id).first()
+    if message is None:
+        # wiadomość usunięta razem z rozmową, zanim worker ją podjął
+        return 0
+    return notifications.record_message(message)
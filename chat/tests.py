@@ -1,3 +1,732 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connection, transaction
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import EmailOutbox
+from api.tests import IndexUsageMixin
+from . import checks, membership, notifications, realtime, seen
+from .models import Conversation, ChatMessage, ConversationSeen, PendingChatNotification
+
+
+class ChatMessageIndexTests(IndexUsageMixin, TestCase):
+
+    def test_history_uses_conversation_timestamp_id_index(self):
+        user = User.objects.create_user("user")
+        conversation = Conversation.objects.create(created_by=user)
+        conversation.participants.add(user)
+        ChatMessage.objects.create(conversation=conversation, sender=user, text="hej")
+
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.assertEndpointUsesIndex(
+            f"/api/chat/{conversation.id}/", "chat_chatmessage", "chat_msg_conv_ts_id_idx"
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "indeks GIN tsvector istnieje tylko na PostgreSQL")
+    def test_search_uses_tsvector_gin_index(self):
+        user = User.objects.create_user("user")
+        conversation = Conversation.objects.create(created_by=user)
+        conversation.participants.add(user)
+        ChatMessage.objects.bulk_create(
+            ChatMessage(conversation=conversation, sender=user, text=f"wiadomość {i}") for i in range(500)
+        )
+        ChatMessage.objects.create(conversation=conversation, sender=user, text="kot na płocie")
+
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.assertEndpointUsesIndex("/api/chat/search/?q=kot", "chat_chatmessage", "chat_msg_text_search_idx")
+
+
+class ChatDigestTests(TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user("sender", email="sender@example.com")
+        self.reader = User.objects.create_user("reader", email="reader@example.com")
+        self.away = User.objects.create_user("away", email="away@example.com")
+        self.conversation = Conversation.objects.create(is_group=True, group_name="zespół", created_by=self.sender)
+        self.conversation.participants.add(self.sender, self.reader, self.away)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+
+    def post_messages(self, count):
+        # fan-out po commicie, zadanie django_q wykonane od razu
+        with mock.patch("chat.signals.async_task", side_effect=lambda func, *args: import_string(func)(*args)):
+            for i in range(count):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post(f"/api/chat/{self.conversation.id}/messages/", {"text": f"wiadomość {i}"})
+                self.assertEqual(response.status_code, 201)
+
+    def test_messages_are_coalesced_per_recipient_without_mail(self):
+        self.post_messages(3)
+
+        self.assertEqual(
+            sorted(PendingChatNotification.objects.values_list("recipient__username", flat=True)),
+            ["away", "reader"],
+        )
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_flush_waits_for_quiet_period_and_skips_readers(self):
+        self.post_messages(3)
+        last = ChatMessage.objects.latest("timestamp").timestamp
+        ConversationSeen.objects.create(conversation=self.conversation, user=self.reader, last_seen=last)
+
+        self.assertEqual(notifications.flush_digests(now=last + timedelta(seconds=10)), 0)
+        self.assertEqual(PendingChatNotification.objects.count(), 2)
+
+        self.assertEqual(notifications.flush_digests(now=last + timedelta(minutes=5)), 1)
+
+        digest = EmailOutbox.objects.get()
+        self.assertEqual(digest.recipient_list, ["away@example.com"])
+        self.assertIn('3 nowych wiadomości w grupie "zespół"', digest.message)
+        self.assertIn("sender: wiadomość 2", digest.message)
+        self.assertFalse(PendingChatNotification.objects.exists())
+
+    def test_busy_conversation_is_flushed_after_max_delay(self):
+        self.post_messages(1)
+        PendingChatNotification.objects.update(last_message_at=timezone.now() + timedelta(minutes=20))
+
+        self.assertEqual(notifications.flush_digests(now=timezone.now() + timedelta(minutes=16)), 2)
+
+
+class PrivateConversationLookupTests(TestCase):
+    url = "/api/conversations/get_or_create/"
+
+    def setUp(self):
+        self.me = User.objects.create_user("me")
+        self.other = User.objects.create_user("other")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_get_or_create_reuses_pair_with_constant_queries(self):
+        created = self.client.post(self.url, {"participants": [self.other.id]}, format="json")
+        self.assertEqual(created.status_code, 201)
+
+        for _ in range(20):
+            conversation = Conversation.objects.create(is_group=False)
+            conversation.participants.add(User.objects.create_user(f"u{conversation.id}"), self.me)
+
+        with self.assertNumQueries(5):
+            again = self.client.post(self.url, {"participants": [self.other.id]}, format="json")
+
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data["id"], created.data["id"])
+        self.assertEqual(
+            Conversation.objects.get(id=created.data["id"]).participants_key,
+            Conversation.private_key([self.me.id, self.other.id]),
+        )
+
+    def test_duplicate_private_pair_is_rejected_by_database(self):
+        key = Conversation.private_key([self.other.id, self.me.id])
+        Conversation.objects.create(is_group=False, participants_key=key)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Conversation.objects.create(is_group=False, participants_key=key)
+
+        # klucz dotyczy tylko czatów prywatnych
+        Conversation.objects.create(is_group=True, participants_key=key)
+
+    def test_private_create_sets_key_and_rejects_duplicate_pair(self):
+        created = self.client.post("/api/conversations/", {"participants": [self.other.id]}, format="json")
+
+        self.assertEqual(created.status_code, 201)
+        conversation = Conversation.objects.get(id=created.data["id"])
+        self.assertEqual(conversation.participants_key, Conversation.private_key([self.me.id, self.other.id]))
+        self.assertEqual(set(conversation.participants.values_list("id", flat=True)), {self.me.id, self.other.id})
+
+        again = self.client.post("/api/conversations/", {"participants": [self.other.id]}, format="json")
+        self.assertEqual(again.status_code, 400)
+        found = self.client.post(self.url, {"participants": [self.other.id]}, format="json")
+        self.assertEqual(found.data["id"], conversation.id)
+
+        third = User.objects.create_user("third")
+        crowded = self.client.post("/api/conversations/", {"participants": [self.other.id, third.id]}, format="json")
+        self.assertEqual(crowded.status_code, 400)
+
+    def test_groups_endpoint_creates_only_groups(self):
+        response = self.client.post("/api/groups/", {"group_name": "zespół", "is_group": False}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Conversation.objects.get(id=response.data["id"]).is_group)
+
+
+class UnreadCountsTests(TestCase):
+    url = "/api/conversations/unread/"
+
+    def setUp(self):
+        self.me = User.objects.create_user("me")
+        self.other = User.objects.create_user("other")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def make_conversation(self, messages_from_other, seen_after=None):
+        conversation = Conversation.objects.create(created_by=self.me)
+        conversation.participants.add(self.me, self.other)
+        for i in range(seen_after or 0):
+            ChatMessage.objects.create(conversation=conversation, sender=self.other, text=f"stara {i}")
+        if seen_after is not None:
+            ConversationSeen.objects.create(conversation=conversation, user=self.me, last_seen=timezone.now())
+        for i in range(messages_from_other):
+            ChatMessage.objects.create(conversation=conversation, sender=self.other, text=f"nowa {i}")
+        ChatMessage.objects.create(conversation=conversation, sender=self.me, text="moja")
+        return conversation
+
+    def test_counts_for_all_conversations_in_one_query_without_writes(self):
+        never_seen = self.make_conversation(3)
+        partly_seen = self.make_conversation(2, seen_after=4)
+        elsewhere = Conversation.objects.create()
+        elsewhere.participants.add(self.other)
+        ChatMessage.objects.create(conversation=elsewhere, sender=self.other, text="obca")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data, {"unread": {never_seen.id: 3, partly_seen.id: 2}})
+        self.assertEqual(ConversationSeen.objects.count(), 1)
+
+    def test_single_conversation_endpoint_is_read_only(self):
+        conversation = self.make_conversation(2)
+
+        response = self.client.get(f"/api/chat/{conversation.id}/unread/")
+
+        self.assertEqual(response.data, {"unread": 2})
+        self.assertFalse(ConversationSeen.objects.exists())
+
+
+class MessageHistoryPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user")
+        self.conversation = Conversation.objects.create(created_by=self.user)
+        self.conversation.participants.add(self.user)
+        # wspólny timestamp dla części wiadomości – kolejność rozstrzyga id
+        for i in range(7):
+            message = ChatMessage.objects.create(conversation=self.conversation, sender=self.user, text=f"m{i}")
+            if i == 4:
+                ChatMessage.objects.filter(id=message.id).update(timestamp=previous.timestamp)
+            previous = message
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def texts(self, response):
+        return [message["text"] for message in response.data["results"]]
+
+    def test_default_page_is_latest_messages_and_scrolls_back(self):
+        for url in (f"/api/chat/{self.conversation.id}/", f"/api/chat/{self.conversation.id}/messages/"):
+            first = self.client.get(url, {"page_size": 3})
+            self.assertEqual(self.texts(first), ["m4", "m5", "m6"])
+
+            older = self.client.get(first.data["previous"])
+            self.assertEqual(self.texts(older), ["m1", "m2", "m3"])
+
+            oldest = self.client.get(older.data["previous"])
+            self.assertEqual(self.texts(oldest), ["m0"])
+            self.assertIsNone(oldest.data["previous"])
+
+    def test_after_anchor_fetches_newer_messages(self):
+        url = f"/api/chat/{self.conversation.id}/"
+        oldest = self.client.get(self.client.get(url, {"page_size": 6}).data["previous"])
+
+        newer = self.client.get(oldest.data["next"])
+        self.assertEqual(self.texts(newer), ["m1", "m2", "m3", "m4", "m5", "m6"])
+
+        nothing_new = self.client.get(self.client.get(url).data["next"])
+        self.assertEqual(nothing_new.data["results"], [])
+        self.assertIsNotNone(nothing_new.data["next"])
+
+
+class ConversationInboxTests(TestCase):
+    url = "/api/conversations/inbox/"
+
+    def setUp(self):
+        self.me = User.objects.create_user("me")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def make_conversation(self, name, messages=0):
+        other = User.objects.create_user(name)
+        conversation = Conversation.objects.create(created_by=self.me)
+        conversation.participants.add(self.me, other)
+        for i in range(messages):
+            ChatMessage.objects.create(conversation=conversation, sender=other, text=f"{name} {i}")
+        return conversation
+
+    def test_inbox_sorted_by_last_activity_in_constant_queries(self):
+        quiet = self.make_conversation("quiet")
+        older = self.make_conversation("older", messages=2)
+        newer = self.make_conversation("newer", messages=1)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+
+        self.assertEqual([item["id"] for item in response.data], [newer.id, older.id, quiet.id])
+        first = response.data[0]
+        self.assertEqual(first["last_message"]["text"], "newer 0")
+        self.assertEqual(first["other_user"]["username"], "newer")
+        self.assertEqual(first["unread"], 1)
+        self.assertIsNone(response.data[2]["last_message"])
+
+        for i in range(10):
+            self.make_conversation(f"more{i}", messages=1)
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+    def test_sending_updates_last_message_at_and_pages_by_it(self):
+        first = self.make_conversation("first", messages=1)
+        second = self.make_conversation("second", messages=1)
+
+        response = self.client.post(f"/api/chat/{first.id}/messages/", {"text": "odświeżam"})
+        first.refresh_from_db()
+        self.assertEqual(first.last_message_at, ChatMessage.objects.get(id=response.data["id"]).timestamp)
+
+        page = self.client.get(self.url, {"page_size": 1})
+        self.assertEqual([item["id"] for item in page.data["results"]], [first.id])
+        rest = self.client.get(page.data["next"])
+        self.assertEqual([item["id"] for item in rest.data["results"]], [second.id])
+
+    def test_ordering_outside_allowed_fields_is_ignored(self):
+        older = self.make_conversation("older", messages=1)
+        newer = self.make_conversation("newer", messages=1)
+
+        response = self.client.get(self.url, {"page_size": 5, "ordering": "unread"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data["results"]], [newer.id, older.id])
+
+        oldest_first = self.client.get(self.url, {"page_size": 5, "ordering": "last_message_at"})
+        self.assertEqual([item["id"] for item in oldest_first.data["results"]], [older.id, newer.id])
+
+
+class ChatRealtimeTests(TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user("sender")
+        self.reader = User.objects.create_user("reader")
+        self.conversation = Conversation.objects.create(created_by=self.sender)
+        self.conversation.participants.add(self.sender, self.reader)
+
+    def test_new_message_is_published_once_after_commit(self):
+        client = APIClient()
+        client.force_authenticate(self.sender)
+
+        with mock.patch.object(realtime.get_broker(), "publish") as publish, mock.patch("chat.signals.async_task"):
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(f"/api/chat/{self.conversation.id}/messages/", {"text": "hej"})
+
+        (channel, event), _ = publish.call_args
+        publish.assert_called_once()
+        self.assertEqual(channel, realtime.conversation_channel(self.conversation.id))
+        self.assertEqual((event["sender"], event["message"]["text"]), (self.sender.id, "hej"))
+
+    async def test_conversation_event_is_fanned_out_to_local_participant_streams(self):
+        broker = realtime.InMemoryBroker()
+        message = await ChatMessage.objects.acreate(conversation=self.conversation, sender=self.sender, text="hej")
+        reader = broker.subscribe(realtime.user_channel(self.reader.id))
+        sender = broker.subscribe(realtime.user_channel(self.sender.id))
+        outsider = broker.subscribe(realtime.user_channel(0))
+
+        with mock.patch.object(realtime, "get_broker", return_value=broker):
+            await sync_to_async(realtime.publish_message)(message, {"text": "hej"})
+
+        self.assertEqual((await reader.get(1))["message"], {"text": "hej"})
+        self.assertEqual((await reader.get(1))["delta"], 1)
+        self.assertEqual((await sender.get(1))["type"], "message")
+        self.assertIsNone(await sender.get(0.05))
+        self.assertIsNone(await outsider.get(0.05))
+
+    async def test_event_stream_authenticates_with_jwt_and_relays_events(self):
+        anonymous = await self.async_client.get("/api/chat/events/")
+        self.assertEqual(anonymous.status_code, 401)
+
+        token = str(RefreshToken.for_user(self.reader).access_token)
+        response = await self.async_client.get("/api/chat/events/", {"token": token})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+
+        snapshot = await anext(stream)
+        self.assertIn(b"event: unread", snapshot)
+        self.assertIn(f'"{self.conversation.id}": 0'.encode(), snapshot)
+
+        realtime.get_broker().publish(
+            realtime.user_channel(self.reader.id),
+            {"type": "message", "conversation": self.conversation.id, "message": {"text": "na żywo"}},
+        )
+        event = await anext(stream)
+        self.assertTrue(event.startswith(b"event: message\n"))
+        self.assertIn("na żywo", event.decode())
+        await stream.aclose()
+
+
+class RedisBrokerTests(TestCase):
+
+    def setUp(self):
+        redis_client = mock.patch("redis.Redis.from_url")
+        self.client_factory = redis_client.start()
+        self.addCleanup(redis_client.stop)
+        self.broker = realtime.RedisBroker(url="redis://example:6379/0")
+        self.redis = self.client_factory.return_value
+
+    def test_publish_goes_through_redis_and_listener_delivers_locally(self):
+        self.broker.publish("user:1", {"type": "unread", "delta": 1})
+        self.redis.publish.assert_called_once_with("user:1", '{"type": "unread", "delta": 1}')
+        self.redis.pubsub.return_value.psubscribe.assert_called_once()
+        self.redis.pubsub.return_value.run_in_thread.assert_called_once()
+
+        async def relay():
+            subscription = self.broker.subscribe("user:1")
+            self.broker._receive({"channel": b"user:1", "data": b'{"type": "unread", "delta": 1}'})
+            try:
+                return await subscription.get(timeout=1)
+            finally:
+                subscription.close()
+
+        self.assertEqual(asyncio.run(relay()), {"type": "unread", "delta": 1})
+
+    def test_broker_defaults_to_redis_when_configured(self):
+        with override_settings(REDIS_URL="redis://example:6379/0"):
+            self.assertEqual(realtime.default_broker_path(), "chat.realtime.RedisBroker")
+        with override_settings(REDIS_URL=None):
+            self.assertEqual(realtime.default_broker_path(), "chat.realtime.InMemoryBroker")
+
+    def test_in_memory_broker_with_many_workers_is_reported(self):
+        with override_settings(CHAT_REALTIME_BROKER="chat.realtime.InMemoryBroker"):
+            with mock.patch.dict("os.environ", {"WEB_CONCURRENCY": "4"}):
+                self.assertEqual([w.id for w in checks.realtime_broker_check(None)], ["chat.W001"])
+            with mock.patch.dict("os.environ", {"WEB_CONCURRENCY": "1"}):
+                self.assertEqual(checks.realtime_broker_check(None), [])
+
+
+class ChatLongPollTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user")
+        self.outsider = User.objects.create_user("outsider")
+        self.conversation = Conversation.objects.create(created_by=self.user)
+        self.conversation.participants.add(self.user)
+        self.first = ChatMessage.objects.create(conversation=self.conversation, sender=self.user, text="pierwsza")
+        self.url = f"/api/chat/{self.conversation.id}/poll/"
+
+    def auth(self, user):
+        return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    async def test_returns_existing_messages_immediately(self):
+        response = await self.async_client.get(self.url, {"after_id": 0}, headers=self.auth(self.user))
+
+        self.assertEqual([message["text"] for message in response.json()["results"]], ["pierwsza"])
+        self.assertEqual(response.json()["after_id"], self.first.id)
+
+    async def test_waits_for_signal_and_returns_only_new_rows(self):
+        poll = asyncio.ensure_future(self.async_client.get(
+            self.url, {"after_id": self.first.id, "timeout": 5}, headers=self.auth(self.user)
+        ))
+        await asyncio.sleep(0.2)
+        self.assertFalse(poll.done())
+
+        message = await ChatMessage.objects.acreate(conversation=self.conversation, sender=self.user, text="nowa")
+        realtime.get_broker().publish(realtime.conversation_channel(self.conversation.id), {"type": "message", "id": message.id})
+
+        response = await asyncio.wait_for(poll, 2)
+        self.assertEqual([item["text"] for item in response.json()["results"]], ["nowa"])
+
+    async def test_wakes_up_on_signal_relayed_from_another_worker(self):
+        with mock.patch("redis.Redis.from_url"):
+            broker = realtime.RedisBroker(url="redis://example:6379/0")
+        channel = realtime.conversation_channel(self.conversation.id)
+
+        with mock.patch.object(realtime, "get_broker", return_value=broker):
+            poll = asyncio.ensure_future(self.async_client.get(
+                self.url, {"after_id": self.first.id, "timeout": 5}, headers=self.auth(self.user)
+            ))
+            await asyncio.sleep(0.2)
+            self.assertFalse(poll.done())
+
+            # wiadomość zapisana i opublikowana w innym workerze – dociera tylko przez listener Redis
+            message = await ChatMessage.objects.acreate(conversation=self.conversation, sender=self.user, text="z innego workera")
+            payload = json.dumps({"type": "message", "id": message.id}).encode()
+            await asyncio.to_thread(broker._receive, {"channel": channel.encode(), "data": payload})
+
+            response = await asyncio.wait_for(poll, 2)
+        self.assertEqual([item["text"] for item in response.json()["results"]], ["z innego workera"])
+
+    async def test_times_out_with_empty_result_and_hides_foreign_conversations(self):
+        empty = await self.async_client.get(
+            self.url, {"after_id": self.first.id, "timeout": 0.1}, headers=self.auth(self.user)
+        )
+        self.assertEqual(empty.json(), {"results": [], "after_id": self.first.id})
+
+        foreign = await self.async_client.get(self.url, {"timeout": 0.1}, headers=self.auth(self.outsider))
+        self.assertEqual(foreign.status_code, 404)
+
+
+class MessageSendPathTests(TestCase):
+
+    def make_conversation(self, size):
+        users = [User.objects.create_user(f"u{size}_{i}", email=f"u{i}@example.com") for i in range(size)]
+        conversation = Conversation.objects.create(is_group=True, group_name=str(size))
+        conversation.participants.set(users)
+        client = APIClient()
+        client.force_authenticate(users[0])
+        return conversation, client
+
+    def send(self, conversation, client):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = client.post(f"/api/chat/{conversation.id}/messages/", {"text": "hej"})
+        self.assertEqual(response.status_code, 201)
+        return queries, callbacks
+
+    def test_one_insert_and_constant_queries_regardless_of_group_size(self):
+        small_queries, _ = self.send(*self.make_conversation(2))
+        large_queries, callbacks = self.send(*self.make_conversation(50))
+
+        self.assertEqual(len(small_queries), len(large_queries))
+        inserts = [q for q in large_queries if q["sql"].startswith('INSERT INTO "chat_chatmessage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertFalse(PendingChatNotification.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+    def test_fan_out_is_queued_after_commit(self):
+        conversation, client = self.make_conversation(3)
+
+        with mock.patch("chat.signals.async_task") as async_task:
+            _, callbacks = self.send(conversation, client)
+            for callback in callbacks:
+                callback()
+
+        message = ChatMessage.objects.get()
+        async_task.assert_called_once_with("chat.tasks.record_notifications", message.id)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message_at, message.timestamp)
+
+
+class MembershipCacheTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.carol = User.objects.create_user("carol")
+        self.conversation = Conversation.objects.create(is_group=True, group_name="g")
+        self.conversation.participants.set([self.alice, self.bob])
+        self.client = APIClient()
+
+    def test_warm_cache_needs_no_queries(self):
+        membership.participant_ids(self.conversation.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(membership.participant_ids(self.conversation.id), {self.alice.id, self.bob.id})
+            self.assertTrue(membership.is_participant(self.conversation.id, self.alice))
+            self.assertFalse(membership.is_participant(self.conversation.id, self.carol))
+
+    def test_shared_cache_tier_is_used_only_with_a_shared_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={"default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location,
+            }}):
+                membership.participant_ids(self.conversation.id)
+                membership._cache.local.clear()
+                with self.assertNumQueries(0):
+                    self.assertTrue(membership.is_participant(self.conversation.id, self.alice))
+
+                # unieważnienie z innego procesu trafia do wspólnego cache
+                self.conversation.participants.remove(self.alice)
+                membership._cache.local.clear()
+                self.assertFalse(membership.is_participant(self.conversation.id, self.alice))
+
+        # LocMem nie jest wspólny – po wygaśnięciu pamięci procesu liczymy od nowa
+        membership._cache.local.clear()
+        with self.assertNumQueries(1):
+            membership.participant_ids(self.conversation.id)
+
+    def test_participant_changes_invalidate(self):
+        self.assertFalse(membership.is_participant(self.conversation.id, self.carol))
+
+        self.conversation.participants.add(self.carol)
+        self.assertTrue(membership.is_participant(self.conversation.id, self.carol))
+
+        self.carol.conversations.remove(self.conversation)
+        self.assertFalse(membership.is_participant(self.conversation.id, self.carol))
+
+        self.alice.conversations.clear()
+        self.assertEqual(membership.participant_ids(self.conversation.id), {self.bob.id})
+
+        conversation_id = self.conversation.id
+        self.conversation.delete()
+        self.assertIsNone(membership.participant_ids(conversation_id))
+
+    def test_views_distinguish_missing_conversation_from_outsider(self):
+        self.client.force_authenticate(self.carol)
+        self.assertEqual(self.client.get(f"/api/chat/{self.conversation.id}/").status_code, 403)
+        self.assertEqual(self.client.post(f"/api/chat/{self.conversation.id}/messages/", {"text": "x"}).status_code, 403)
+        self.assertEqual(self.client.get("/api/chat/999999/").status_code, 404)
+        self.assertFalse(ChatMessage.objects.exists())
+
+
+@override_settings(CHAT_SEEN_FLUSH_SECONDS=60)
+class ConversationSeenBufferTests(TestCase):
+
+    def setUp(self):
+        self.me = User.objects.create_user("me")
+        self.other = User.objects.create_user("other")
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.me, self.other)
+        for i in range(3):
+            ChatMessage.objects.create(conversation=self.conversation, sender=self.other, text=f"m{i}")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+        # bufor działa tylko ze wspólnym cache; timer flush sprawdzany osobno
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location,
+        }}))
+        self.timer = self.enterContext(mock.patch("chat.seen.threading.Timer"))
+
+    def tearDown(self):
+        seen.flush()
+        cache.clear()
+
+    def test_seen_is_buffered_and_unread_reads_through(self):
+        for _ in range(3):
+            response = self.client.post(f"/api/chat/{self.conversation.id}/seen/")
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(ConversationSeen.objects.exists())
+
+        response = self.client.get("/api/conversations/unread/")
+        self.assertEqual(response.data, {"unread": {self.conversation.id: 0}})
+
+        self.assertEqual(seen.flush(), 1)
+        row = ConversationSeen.objects.get()
+        self.assertEqual(row.last_seen, seen.pending_seen(self.me.id)[self.conversation.id])
+
+    def test_flush_never_moves_last_seen_back(self):
+        later = timezone.now()
+        ConversationSeen.objects.create(conversation=self.conversation, user=self.me, last_seen=later)
+        seen.mark_seen(self.conversation.id, self.me.id, later - timedelta(hours=1))
+        seen.mark_seen(self.conversation.id, self.other.id, later)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(seen.flush(), 2)
+
+        self.assertEqual(ConversationSeen.objects.get(user=self.me).last_seen, later)
+        self.assertEqual(ConversationSeen.objects.get(user=self.other).last_seen, later)
+
+    def test_due_buffer_is_flushed_at_request_end(self):
+        with override_settings(CHAT_SEEN_FLUSH_SECONDS=0):
+            self.client.post(f"/api/chat/{self.conversation.id}/seen/")
+
+        self.assertTrue(ConversationSeen.objects.filter(user=self.me, last_seen__isnull=False).exists())
+
+    def test_idle_buffer_is_flushed_by_timer(self):
+        seen.mark_seen(self.conversation.id, self.me.id)
+        seen.mark_seen(self.conversation.id, self.other.id)
+
+        self.timer.assert_called_once_with(60, seen._flush_in_background)
+        self.assertFalse(ConversationSeen.objects.exists())
+
+        with mock.patch("chat.seen.connection"):
+            seen._flush_in_background()
+        self.assertEqual(ConversationSeen.objects.count(), 2)
+
+    def test_without_shared_cache_seen_is_written_through(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            when = seen.mark_seen(self.conversation.id, self.me.id)
+            self.assertEqual(seen.pending_seen(self.me.id), {})
+
+        self.assertEqual(ConversationSeen.objects.get(user=self.me).last_seen, when)
+        self.timer.assert_not_called()
+
+
+
+class ChatMessageSearchTests(TestCase):
+    url = "/api/chat/search/"
+
+    def setUp(self):
+        self.me = User.objects.create_user("me")
+        self.other = User.objects.create_user("other")
+        self.mine = Conversation.objects.create()
+        self.mine.participants.add(self.me, self.other)
+        self.foreign = Conversation.objects.create()
+        self.foreign.participants.add(self.other)
+
+        self.old = ChatMessage.objects.create(conversation=self.mine, sender=self.other, text="Spotkanie o <b>kocie</b> jutro")
+        self.new = ChatMessage.objects.create(conversation=self.mine, sender=self.me, text="spotkanie przeniesione")
+        ChatMessage.objects.create(conversation=self.mine, sender=self.other, text="nic ciekawego")
+        ChatMessage.objects.create(conversation=self.foreign, sender=self.other, text="tajne spotkanie")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_matches_only_own_conversations_newest_first_with_cursor(self):
+        first = self.client.get(self.url, {"q": "spotkanie", "page_size": 1})
+        self.assertEqual([m["id"] for m in first.data["results"]], [self.new.id])
+        self.assertIsNotNone(first.data["next"])
+
+        second = self.client.get(first.data["next"])
+        self.assertEqual([m["id"] for m in second.data["results"]], [self.old.id])
+        self.assertIsNone(second.data["next"])
+
+    def test_headline_marks_matches_and_escapes_text(self):
+        response = self.client.get(self.url, {"q": "spotkanie"})
+        headline = {m["id"]: m["headline"] for m in response.data["results"]}[self.old.id]
+
+        self.assertIn("<mark>Spotkanie</mark>", headline)
+        self.assertNotIn("<b>", headline)
+
+    def test_empty_query_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {"q": " "}).status_code, 400)
+
+    def test_ordering_is_limited_to_timestamp(self):
+        ignored = self.client.get(self.url, {"q": "spotkanie", "ordering": "headline"})
+        self.assertEqual(ignored.status_code, 200)
+        self.assertEqual([m["id"] for m in ignored.data["results"]], [self.new.id, self.old.id])
+
+        oldest_first = self.client.get(self.url, {"q": "spotkanie", "ordering": "timestamp"})
+        self.assertEqual([m["id"] for m in oldest_first.data["results"]], [self.old.id, self.new.id])
+
+
+@override_settings(UPLOAD_BACKEND="api.uploads.LocalUploadBackend")
+class ChatDirectUploadTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        storage = mock.patch.object(default_storage, "_wrapped", FileSystemStorage(location=root.name, base_url="/media/"))
+        storage.start()
+        self.addCleanup(storage.stop)
+
+        self.me = User.objects.create_user("me")
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.me)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_message_attaches_uploaded_object_by_key(self):
+        form = self.client.post(
+            "/api/uploads/", {"target": "chat", "filename": "zdjęcie.png", "size": 3}, format="json"
+        ).data
+        default_storage.save(form["key"], ContentFile(b"png"))
+
+        response = self.client.post(
+            f"/api/chat/{self.conversation.id}/send/", {"text": "", "attachment_key": form["key"]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ChatMessage.objects.get().attachment.name, form["key"])
+        self.assertTrue(response.data["attachment"].endswith(default_storage.url(form["key"])))
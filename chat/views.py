@@ -1,69 +1,87 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework import generics, permissions, viewsets
-from .models import ChatMessage, Conversation, ConversationSeen
-from .serializers import ChatMessageSerializer, ConversationSerializer
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .models import ChatMessage, Conversation
+from .serializers import ChatMessageSearchSerializer, ChatMessageSerializer, ConversationSerializer, InboxConversationSerializer, participants_prefetch
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from django.utils.timezone import now
 from rest_framework import status
-from django.utils import timezone
-from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DateTimeField, F, FilteredRelation, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from . import membership, realtime, search, seen
+from .pagination import MessageHistoryPagination, MessageSearchPagination
+from api.pagination import KeysetPagination
 
 
 class ChatMessageListCreateView(generics.ListCreateAPIView):
     serializer_class = ChatMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageHistoryPagination
 
     def get_queryset(self):
         conversation_id = self.kwargs['conversation_id']
-        conversation = Conversation.objects.get(id=conversation_id)
-
-        if self.request.user not in conversation.participants.all():
+        if not membership.is_participant(conversation_id, self.request.user):
             return ChatMessage.objects.none()
 
-        return conversation.messages.order_by('timestamp')
+        return ChatMessage.objects.filter(conversation_id=conversation_id).select_related('sender').order_by('timestamp')
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        conversation = Conversation.objects.get(id=self.kwargs['conversation_id'])
+        conversation_id = self.kwargs['conversation_id']
+        if not membership.is_participant(conversation_id, self.request.user):
+            raise PermissionDenied('Not a participant of this conversation')
+        # jeden INSERT; last_message_at i fan-out (SSE, digesty) robi chat.signals
         serializer.save(
             sender=self.request.user,
-            conversation=conversation
-        )
-        
-        message = serializer.save(
-            sender=self.request.user,
-            conversation=conversation
+            conversation_id=conversation_id
         )
 
-        # 🔑 Wykluczasz nadawcę!
-        recipients = conversation.participants.exclude(id=self.request.user.id)
-
-        for recipient in recipients:
-            if recipient.email:
-                send_mail(
-                    subject="📬 Nowa wiadomość w TickTask",
-                    message=(
-                        f"Cześć {recipient.username},\n\n"
-                        f"Masz nową wiadomość od {self.request.user.username}:\n\n"
-                        f"\"{message.text}\"\n\n"
-                        f"Zaloguj się do TickTask, aby odpowiedzieć!"
-                    ),
-                    from_email='noreply@inqse.com',
-                    recipient_list=[recipient.email],
-                    fail_silently=False
-                )
-        
+
 class ConversationListCreateView(generics.ListCreateAPIView):
     queryset = Conversation.objects.all()
     serializer_class = ConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Conversation.objects.filter(participants=self.request.user)
+        return (
+            Conversation.objects.filter(participants=self.request.user)
+            .select_related('created_by')
+            .prefetch_related(participants_prefetch())
+        )
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        conversation = serializer.save()
-        conversation.participants.add(*self.request.data.get('participants', []))
+        if serializer.validated_data.get('is_group'):
+            conversation = serializer.save()
+            conversation.participants.add(*self.request.data.get('participants', []))
+            return
+
+        # czat prywatny – ten sam klucz pary co w get_or_create, inaczej unikalność pary nie działa
+        try:
+            participant_ids = {int(pk) for pk in self.request.data.get('participants', [])} | {self.request.user.id}
+        except (TypeError, ValueError):
+            raise ValidationError({'participants': 'Nieprawidłowe id uczestników.'})
+        if len(participant_ids) != 2 or User.objects.filter(id__in=participant_ids).count() != 2:
+            raise ValidationError({'participants': 'Czat prywatny wymaga dokładnie jednego istniejącego rozmówcy.'})
+
+        try:
+            with transaction.atomic():
+                conversation = serializer.save(participants_key=Conversation.private_key(participant_ids))
+        except IntegrityError:
+            raise ValidationError({'participants': 'Ta para ma już czat prywatny – użyj /api/conversations/get_or_create/.'})
+        conversation.participants.add(*participant_ids)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -106,27 +124,42 @@ class GetOrCreateConversationView(APIView):
             if len(unique_participants) != 2:
                 return Response({"error": "Exactly 2 participants required for private chat"}, status=400)
 
-            participants_set = set(unique_participants)
+            # jedno zapytanie po unikalnym indeksie częściowym zamiast przeglądania wszystkich rozmów
+            key = Conversation.private_key(unique_participants)
+            convo = Conversation.objects.filter(is_group=False, participants_key=key).first()
+            if convo is not None:
+                serializer = ConversationSerializer(convo, context={"request": request})
+                return Response(serializer.data)
+
+            try:
+                with transaction.atomic():
+                    new_convo = Conversation.objects.create(
+                        is_group=False,
+                        created_by=request.user,  # możesz dać to t  eż tu dla spójności
+                        participants_key=key,
+                    )
+                    new_convo.participants.set(users)
+            except IntegrityError:
+                # równoległy request założył już tę parę – zwracamy jego rozmowę
+                convo = Conversation.objects.get(is_group=False, participants_key=key)
+                serializer = ConversationSerializer(convo, context={"request": request})
+                return Response(serializer.data)
 
-            for convo in Conversation.objects.filter(is_group=False):
-                convo_set = set(convo.participants.values_list("id", flat=True))
-                if convo_set == participants_set:
-                    serializer = ConversationSerializer(convo, context={"request": request})
-                    return Response(serializer.data)
-
-            new_convo = Conversation.objects.create(
-                is_group=False,
-                created_by=request.user  # możesz dać to t  eż tu dla spójności
-            )
-            new_convo.participants.set(users)
             serializer = ConversationSerializer(new_convo, context={"request": request})
             return Response(serializer.data, status=201)
 
 class GroupViewSet(viewsets.ModelViewSet):
-    queryset = Conversation.objects.filter(is_group=True)
+    queryset = Conversation.objects.filter(is_group=True).select_related('created_by').prefetch_related(participants_prefetch())
     serializer_class = ConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    # tylko grupy – czat prywatny bez participants_key ominąłby unikalność pary
+    def perform_create(self, serializer):
+        serializer.save(is_group=True)
+
+    def perform_update(self, serializer):
+        serializer.save(is_group=True)
+
     def destroy(self, request, *args, **kwargs):
         group = self.get_object()
         if group.created_by_id != request.user.id and not request.user.is_staff:
@@ -140,46 +173,148 @@ class UpdateLastSeenView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, conversation_id):
-        try:
-            conversation = Conversation.objects.get(id=conversation_id)
-            if request.user not in conversation.participants.all():
-                return Response({'error': 'Brak dostępu'}, status=status.HTTP_403_FORBIDDEN)
-
-            seen_obj, _ = ConversationSeen.objects.get_or_create(
-                conversation=conversation,
-                user=request.user
+        participant_ids = membership.participant_ids(conversation_id)
+        if participant_ids is None:
+            return Response({'error': 'Nie znaleziono rozmowy'}, status=404)
+        if request.user.id not in participant_ids:
+            return Response({'error': 'Brak dostępu'}, status=status.HTTP_403_FORBIDDEN)
+
+        # bez zapisu do bazy – chat.seen zbiera odczyty i zapisuje je paczką
+        seen.mark_seen(conversation_id, request.user.id)
+        transaction.on_commit(lambda: realtime.publish_seen(conversation_id, request.user.id))
+
+        return Response({'status': 'Zaktualizowano'}, status=200)
+
+def annotate_unread(queryset, user):
+    """
+    Dokłada do rozmów użytkownika `unread` – nieprzeczytane cudze wiadomości
+    (ChatMessage LEFT JOIN jego ConversationSeen), w tym samym zapytaniu.
+    Odczyty czekające w chat.seen są nakładane na wartość z bazy.
+    """
+    seen_at = Coalesce(F("my_seen__last_seen"), F("created_at"))
+    pending = seen.pending_seen(user.id)
+    if pending:
+        seen_at = Case(
+            *(
+                When(id=conversation_id, then=Greatest(Value(when), seen_at))
+                for conversation_id, when in pending.items()
+            ),
+            default=seen_at,
+            output_field=DateTimeField(),
+        )
+    return (
+        queryset.filter(participants=user)
+        .annotate(my_seen=FilteredRelation("seen", condition=Q(seen__user=user)))
+        .annotate(
+            unread=Count(
+                "messages",
+                filter=Q(messages__timestamp__gt=seen_at)
+                & ~Q(messages__sender=user),
             )
+        )
+    )
 
-            seen_obj.last_seen = timezone.now()
-            seen_obj.save()
 
-            return Response({'status': 'Zaktualizowano'}, status=200)
-        except Conversation.DoesNotExist:
-            return Response({'error': 'Nie znaleziono rozmowy'}, status=404)
+def unread_counts(user, conversations=None):
+    """Liczba nieprzeczytanych w rozmowach użytkownika – jedno zapytanie, bez zapisów."""
+    conversations = Conversation.objects.all() if conversations is None else conversations
+    return dict(annotate_unread(conversations, user).values_list("id", "unread"))
+
 
 class UnreadMessageCountView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, conversation_id):
-        try:
-            conversation = Conversation.objects.get(id=conversation_id)
-            if request.user not in conversation.participants.all():
-                return Response({'error': 'Brak dostępu'}, status=status.HTTP_403_FORBIDDEN)
+        participant_ids = membership.participant_ids(conversation_id)
+        if participant_ids is None:
+            return Response({'error': 'Nie znaleziono rozmowy'}, status=status.HTTP_404_NOT_FOUND)
+        if request.user.id not in participant_ids:
+            return Response({'error': 'Brak dostępu'}, status=status.HTTP_403_FORBIDDEN)
 
-            seen_obj, _ = ConversationSeen.objects.get_or_create(
-                conversation=conversation,
-                user=request.user
-            )
+        counts = unread_counts(request.user, Conversation.objects.filter(id=conversation_id))
+
+        return Response({'unread': counts[conversation_id]})
+
+
+class UnreadCountsView(APIView):
+    """Nieprzeczytane we wszystkich rozmowach naraz: {"unread": {"<id rozmowy>": liczba}}."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({'unread': unread_counts(request.user)})
+
+
+class ChatMessageSearchView(generics.ListAPIView):
+    """
+    Wyszukiwanie w wiadomościach rozmów, w których użytkownik uczestniczy:
+    ?q=<fraza> (składnia websearch). Od najnowszych, kursor ?cursor=,
+    każdy wynik z fragmentem `headline` (dopasowania w <mark>).
+    """
+    serializer_class = ChatMessageSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageSearchPagination
+    ordering_fields = ["timestamp"]
+    ordering = ["-timestamp"]
+
+    def get_queryset(self):
+        return search.search_messages(self.request.user, self.request.query_params.get('q', '').strip())
+
+    def list(self, request, *args, **kwargs):
+        terms = request.query_params.get('q', '').strip()
+        if not terms:
+            return Response({'error': 'Podaj frazę do wyszukania (?q=).'}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(self.get_queryset())
+        for message in page:
+            message.headline = search.render_headline(message, terms)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class ConversationInboxView(generics.ListAPIView):
+    """
+    Skrzynka rozmów: uczestnicy, podgląd ostatniej wiadomości i liczba
+    nieprzeczytanych, posortowane po last_message_at – stała liczba zapytań.
+    Stronicowanie opcjonalne przez ?page_size= (KeysetPagination).
+    """
+    serializer_class = InboxConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering_fields = ["last_message_at"]
+    ordering = ["-last_message_at"]
+
+    def get_queryset(self):
+        last_message = (
+            ChatMessage.objects.filter(conversation=OuterRef("pk"))
+            .order_by("-timestamp", "-id")
+            .values("id")[:1]
+        )
+        return (
+            annotate_unread(Conversation.objects.all(), self.request.user)
+            .annotate(last_message_id=Subquery(last_message))
+            .select_related("created_by")
+            .prefetch_related(participants_prefetch())
+            .order_by(F("last_message_at").desc(nulls_last=True), "-id")
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        conversations = list(queryset if page is None else page)
+
+        # ostatnie wiadomości wszystkich rozmów strony jednym zapytaniem
+        last_messages = ChatMessage.objects.select_related("sender").in_bulk(
+            [conversation.last_message_id for conversation in conversations if conversation.last_message_id]
+        )
+        for conversation in conversations:
+            conversation.last_message = last_messages.get(conversation.last_message_id)
+
+        serializer = self.get_serializer(conversations, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
-            unread_count = conversation.messages.filter(
-                timestamp__gt=seen_obj.last_seen or conversation.created_at
-            ).exclude(sender=request.user).count()
 
-            return Response({'unread': unread_count})
-        except Conversation.DoesNotExist:
-            return Response({'error': 'Nie znaleziono rozmowy'}, status=status.HTTP_404_NOT_FOUND)
-        
-        
 class GroupConversationsView(generics.ListAPIView):
     serializer_class = ConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -188,7 +323,7 @@ class GroupConversationsView(generics.ListAPIView):
         return Conversation.objects.filter(
             participants=self.request.user,
             is_group=True
-        )
+        ).select_related('created_by').prefetch_related(participants_prefetch())
         
 class SendMessageView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -196,24 +331,24 @@ class SendMessageView(APIView):
     def post(self, request, conversation_id):
         user = request.user
 
-        try:
-            conversation = Conversation.objects.get(id=conversation_id)
-        except Conversation.DoesNotExist:
+        participant_ids = membership.participant_ids(conversation_id)
+        if participant_ids is None:
             return Response(
                 {'error': 'Conversation not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        if user not in conversation.participants.all():
+        if user.id not in participant_ids:
             return Response(
                 {'error': 'Not a participant of this conversation'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
         # ✅ UŻYJ SERIALIZERA!
-        serializer = ChatMessageSerializer(data=request.data)
+        serializer = ChatMessageSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            serializer.save(sender=user, conversation=conversation)
+            with transaction.atomic():
+                serializer.save(sender=user, conversation_id=conversation_id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -223,17 +358,19 @@ class ChatMessageDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, conversation_id):
-        try:
-            conversation = Conversation.objects.get(id=conversation_id)
-        except Conversation.DoesNotExist:
+        participant_ids = membership.participant_ids(conversation_id)
+        if participant_ids is None:
             return Response({'error': 'Conversation not found'}, status=404)
 
-        if request.user not in conversation.participants.all():
+        if request.user.id not in participant_ids:
             return Response({'error': 'Not a participant of this conversation'}, status=403)
 
-        messages = ChatMessage.objects.filter(conversation=conversation).order_by('timestamp')
+        paginator = MessageHistoryPagination()
+        messages = paginator.paginate_queryset(
+            ChatMessage.objects.filter(conversation_id=conversation_id).select_related('sender'), request, view=self
+        )
         serializer = ChatMessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
@@ -241,14 +378,120 @@ class ConversationViewSet(viewsets.ModelViewSet):
     serializer_class = ConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def perform_update(self, serializer):
+        # typ rozmowy jest stały – klucz pary ma tylko czat założony jako prywatny
+        serializer.save(is_group=serializer.instance.is_group)
+
     def destroy(self, request, *args, **kwargs):
         conversation = self.get_object()
 
         if not conversation.is_group:
             return Response({"error": "Nie można usuwać czatu prywatnego."}, status=400)
 
-        if request.user.is_staff or request.user in conversation.participants.all():
+        if request.user.is_staff or membership.is_participant(conversation.id, request.user):
             conversation.delete()
             return Response(status=204)
 
-        return Response({"error": "Brak uprawnień."}, status=403)
\ No newline at end of file
+        return Response({"error": "Brak uprawnień."}, status=403)
+
+def authenticate_jwt(request):
+    """Użytkownik z tokenu SimpleJWT – nagłówek Authorization albo ?token= (EventSource nie ustawia nagłówków)."""
+    header = request.headers.get("Authorization", "")
+    raw_token = header[len("Bearer "):] if header.startswith("Bearer ") else request.GET.get("token")
+    if not raw_token:
+        return None
+
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n"
+
+
+class ChatEventStreamView(View):
+    """
+    Strumień Server-Sent Events z nowymi wiadomościami i licznikami
+    nieprzeczytanych (chat.realtime). Na start wysyła migawkę "unread" ze
+    wszystkich rozmów, potem zdarzenia z kanału użytkownika i heartbeat.
+    """
+
+    async def get(self, request):
+        user = await sync_to_async(authenticate_jwt)(request)
+        if user is None:
+            return JsonResponse({"detail": "Nieprawidłowy lub brakujący token."}, status=401)
+
+        async def stream():
+            # subskrypcja w pętli, która czyta odpowiedź – także gdy widok szedł przez sync middleware
+            subscription = realtime.get_broker().subscribe(realtime.user_channel(user.id))
+            heartbeat = getattr(settings, "CHAT_EVENTS_HEARTBEAT_SECONDS", 15)
+            try:
+                snapshot = await sync_to_async(unread_counts)(user)
+                yield sse_event("unread", {"type": "unread", "unread": snapshot})
+                while True:
+                    event = await subscription.get(timeout=heartbeat)
+                    yield ": ping\n\n" if event is None else sse_event(event["type"], event)
+            finally:
+                subscription.close()
+
+        response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # nginx nie buforuje strumienia
+        return response
+
+
+def fetch_messages_after(user, conversation_id, after_id, limit):
+    """Nowe wiadomości po after_id albo None, gdy rozmowy nie ma lub użytkownik w niej nie jest."""
+    if not membership.is_participant(conversation_id, user):
+        return None
+    messages = (
+        ChatMessage.objects.filter(conversation_id=conversation_id, id__gt=after_id)
+        .select_related('sender')
+        .order_by('id')[:limit]
+    )
+    return ChatMessageSerializer(messages, many=True).data
+
+
+class ChatMessagePollView(View):
+    """
+    Long-poll dla klientów bez SSE: ?after_id= zwraca od razu nowsze wiadomości,
+    a gdy ich nie ma – czeka do ?timeout= sekund (max CHAT_LONG_POLL_TIMEOUT_SECONDS)
+    na sygnał z kanału rozmowy (chat.realtime), bez odpytywania bazy w pętli.
+    """
+    limit = 200
+
+    async def get(self, request, conversation_id):
+        user = await sync_to_async(authenticate_jwt)(request)
+        if user is None:
+            return JsonResponse({"detail": "Nieprawidłowy lub brakujący token."}, status=401)
+
+        max_timeout = getattr(settings, "CHAT_LONG_POLL_TIMEOUT_SECONDS", 25)
+        try:
+            after_id = int(request.GET.get("after_id", 0))
+            timeout = min(max(float(request.GET.get("timeout", max_timeout)), 0), max_timeout)
+        except ValueError:
+            return JsonResponse({"error": "after_id i timeout muszą być liczbami"}, status=400)
+
+        # subskrypcja przed pierwszym odczytem – wiadomość z chwili pomiędzy nie zginie
+        subscription = realtime.get_broker().subscribe(realtime.conversation_channel(conversation_id))
+        try:
+            deadline = asyncio.get_running_loop().time() + timeout
+            while True:
+                messages = await sync_to_async(fetch_messages_after)(user, conversation_id, after_id, self.limit)
+                if messages is None:
+                    return JsonResponse({"error": "Conversation not found"}, status=404)
+
+                remaining = deadline - asyncio.get_running_loop().time()
+                if messages or remaining <= 0:
+                    break
+                await subscription.get(timeout=remaining)
+        finally:
+            subscription.close()
+
+        return JsonResponse({
+            "results": messages,
+            "after_id": messages[-1]["id"] if messages else after_id,
+        })